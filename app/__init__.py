@@ -92,6 +92,7 @@ def create_app() -> Flask:
         models.ensure_user_schema()
         models.ensure_circle_schema()
         models.ensure_chat_schema()
+        models.ensure_rag_schema()
 
         tables_after = set(inspect(db.engine).get_table_names())
         app.logger.info("Database tables present after initialization: %s", sorted(tables_after))
@@ -128,6 +129,26 @@ def create_app() -> Flask:
             except Exception:
                 app.logger.exception("Failed to bootstrap NEOD token service.")
 
+    from .ocr import configure_ocr_pool, warm_ocr_pool_async
+
+    configure_ocr_pool(
+        app.config["OCR_POOL_SIZE"], app.config["OCR_RECYCLE_PAGES"], app.config["OCR_WORKERS"]
+    )
+    if app.config.get("OCR_WARMUP") and not app.config.get("TESTING"):
+        if app.config.get("EXTRACTION_SANDBOX_ENABLED", True):
+            # OCR runs in the sandbox workers, so that is where the engines must be loaded
+            from .extraction_sandbox import get_extraction_sandbox
+
+            with app.app_context():
+                get_extraction_sandbox().start()
+        else:
+            warm_ocr_pool_async()
+
+    if app.config.get("AI_PRELOAD_MODELS") and not app.config.get("TESTING"):
+        from .llm import preload_models_async
+
+        preload_models_async(app)
+
     from .site_settings import get_site_settings
 
     @app.context_processor
@@ -1,75 +1,119 @@
 from __future__ import annotations
 
 import logging
-import os
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-from typing import Optional
+from time import perf_counter
+from typing import Iterator, Optional
 
 from flask import Blueprint, current_app, jsonify, request
 from flask_login import login_required
 
 from .llm import (
+    CancelToken,
     InferenceError,
     ModelLoadError,
     ModelNotConfiguredError,
+    generation_timeout,
     get_model_manager,
 )
+from .metrics import cache_stats, process_memory, record_inference, registry as metrics_registry, stage_timer
+from .prompting import PromptBudget, local_prompt_budget, openai_token_counter
+from .providers import get_openai_provider
 from .rag import build_rag_context
+from .scheduler import SchedulerFull, get_ai_scheduler, queue_full_response
+from .streaming import sse_response
 
 logger = logging.getLogger(__name__)
 
 ai_bp = Blueprint("ai", __name__, url_prefix="/ai")
-_generation_pool = ThreadPoolExecutor(max_workers=2)
+_OPENAI_MODEL = "gpt-4o-mini"  # Fast and cheap
+_OPENAI_CONTEXT_WINDOW = 128_000
+_OPENAI_MAX_TOKENS = 500
 
-# OpenAI client (lazy loaded)
-_openai_client = None
 
+def _openai_ready() -> bool:
+    """OpenAI is configured and its circuit breaker is not open."""
+    provider = get_openai_provider()
+    if provider.configured and not provider.available:
+        logger.info("OpenAI circuit breaker is open; using the local model")
+    return provider.available
 
-def _get_openai_client():
-    """Get or create OpenAI client (lazy initialization)."""
-    global _openai_client
-    if _openai_client is None:
-        import openai
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-        _openai_client = openai.OpenAI(api_key=api_key)
-    return _openai_client
+
+def _openai_budget(max_context: Optional[int]) -> PromptBudget:
+    return PromptBudget(
+        openai_token_counter(_OPENAI_MODEL), _OPENAI_CONTEXT_WINDOW, _OPENAI_MAX_TOKENS, max_context=max_context
+    )
+
+
+def _insight_prompt_budget(app, max_context: Optional[int]) -> tuple[PromptBudget, str, str]:
+    """Budget for the provider _model_insight_stream will try first, as (budget, provider, model)."""
+    if app.config.get("AI_USE_OPENAI", True) and get_openai_provider().available:
+        return _openai_budget(max_context), "openai", _OPENAI_MODEL
+    model_name = app.config.get("AI_DEFAULT_MODEL", "archdruid")
+    return local_prompt_budget(app, model_name, max_context=max_context), "local", model_name
+
+
+def _openai_messages(prompt: str, system_prompt: Optional[str], use_rag: bool) -> tuple[list[dict], list[dict]]:
+    """Build the chat messages for an OpenAI call, with Knowledge Garden context if enabled."""
+    app = current_app._get_current_object()
+    budget = _openai_budget(app.config.get("RAG_CONTEXT_TOKENS", 1500))
+    if system_prompt:
+        budget.add("system", system_prompt)
+    budget.add("question", f"User question: {prompt}")
+
+    # Build RAG context if enabled, packed into what the budget has left
+    rag_context = ""
+    sources = []
+    if use_rag:
+        try:
+            with stage_timer("rag_total"):
+                rag_context, sources = build_rag_context(
+                    prompt, top_k=app.config.get("RAG_TOP_K", 3), budget=budget
+                )
+            if rag_context:
+                logger.info(
+                    "Added RAG context from Knowledge Garden (%d tokens, %d sources)",
+                    budget.sections.get("context", 0),
+                    len(sources),
+                )
+        except Exception as rag_exc:
+            logger.warning("Failed to get RAG context: %s", rag_exc)
+    budget.record("openai", _OPENAI_MODEL)
+
+    # Build the user message with RAG context
+    user_message = prompt
+    if rag_context:
+        user_message = f"{rag_context}\nUser question: {prompt}"
+
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_message})
+
+    logger.info("Calling OpenAI API with %d message(s) (RAG: %s)", len(messages), bool(rag_context))
+    return messages, sources
 
 
 def _openai_insight(prompt: str, system_prompt: Optional[str] = None, use_rag: bool = True) -> tuple[str, list[dict]]:
     """Generate insight using OpenAI API (fast and reliable) with optional RAG context."""
     try:
-        client = _get_openai_client()
-
-        # Build RAG context if enabled
-        rag_context = ""
-        sources = []
-        if use_rag:
-            try:
-                rag_context, sources = build_rag_context(prompt, top_k=3)
-                if rag_context:
-                    logger.info("Added RAG context from Knowledge Garden (%d chars, %d sources)", len(rag_context), len(sources))
-            except Exception as rag_exc:
-                logger.warning("Failed to get RAG context: %s", rag_exc)
-
-        # Build the user message with RAG context
-        user_message = prompt
-        if rag_context:
-            user_message = f"{rag_context}\nUser question: {prompt}"
-
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": user_message})
-
-        logger.info("Calling OpenAI API with %d message(s) (RAG: %s)", len(messages), bool(rag_context))
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Fast and cheap
-            messages=messages,
-            max_tokens=500,
-            temperature=0.7,
+        provider = get_openai_provider()
+        messages, sources = _openai_messages(prompt, system_prompt, use_rag)
+
+        started = perf_counter()
+        with stage_timer("llm_call"):
+            response = provider.chat(
+                model=_OPENAI_MODEL,
+                messages=messages,
+                max_tokens=_OPENAI_MAX_TOKENS,
+                temperature=0.7,
+            )
+        usage = getattr(response, "usage", None)
+        record_inference(
+            "openai",
+            _OPENAI_MODEL,
+            total_seconds=perf_counter() - started,
+            prefill_tokens=getattr(usage, "prompt_tokens", None),
+            decode_tokens=getattr(usage, "completion_tokens", None),
         )
 
         insight_text = response.choices[0].message.content
@@ -81,6 +125,57 @@ def _openai_insight(prompt: str, system_prompt: Optional[str] = None, use_rag: b
         raise
 
 
+def _openai_insight_stream(
+    prompt: str, system_prompt: Optional[str] = None, use_rag: bool = True
+) -> tuple[Iterator[str], list[dict]]:
+    """Streaming variant of _openai_insight; the request is opened before returning."""
+    provider = get_openai_provider()
+    messages, sources = _openai_messages(prompt, system_prompt, use_rag)
+    started = perf_counter()
+    response = provider.chat_stream(
+        model=_OPENAI_MODEL,
+        messages=messages,
+        max_tokens=_OPENAI_MAX_TOKENS,
+        temperature=0.7,
+        # The last chunk then carries token counts
+        stream_options={"include_usage": True},
+    )
+
+    def deltas() -> Iterator[str]:
+        first_token_at = None
+        chunks = 0
+        usage = None
+        try:
+            for chunk in response:
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = perf_counter()
+                    metrics_registry.observe("insight_stage_seconds", first_token_at - started, stage="first_token")
+                chunks += 1
+                yield delta
+        finally:
+            finished = perf_counter()
+            metrics_registry.observe("insight_stage_seconds", finished - started, stage="llm_call")
+            response.close()
+            first = first_token_at or finished
+            record_inference(
+                "openai",
+                _OPENAI_MODEL,
+                total_seconds=finished - started,
+                prefill_tokens=getattr(usage, "prompt_tokens", None),
+                prefill_seconds=first - started,
+                decode_tokens=getattr(usage, "completion_tokens", None) or chunks,
+                decode_seconds=finished - first,
+            )
+
+    return deltas(), sources
+
+
 def _fallback_insight(prompt: str) -> str:
     ritual_focus = "steady rhythm of the seasons"
     if "ritual" in prompt.lower():
@@ -93,14 +188,18 @@ def _fallback_insight(prompt: str) -> str:
     )
 
 
-def _model_insight(prompt: str) -> tuple[str, list[dict]]:
-    """Generate insight using best available AI model with RAG context."""
+def _model_insight(prompt: str, priority: str = "insight") -> tuple[str, list[dict]]:
+    """
+    Generate insight using best available AI model with RAG context.
+
+    Raises SchedulerFull when the local model's queue has no room.
+    """
     app = current_app._get_current_object()
     use_openai = app.config.get("AI_USE_OPENAI", True)
     use_rag = app.config.get("RAG_ENABLED", True)
 
     # Try OpenAI first (fast and reliable)
-    if use_openai and os.environ.get("OPENAI_API_KEY"):
+    if use_openai and _openai_ready():
         try:
             registry = app.config.get("AI_MODEL_REGISTRY", {})
             model_name = app.config.get("AI_DEFAULT_MODEL", "archdruid")
@@ -116,26 +215,29 @@ def _model_insight(prompt: str) -> tuple[str, list[dict]]:
     model_name = app.config.get("AI_DEFAULT_MODEL", "archdruid")
     registry = app.config.get("AI_MODEL_REGISTRY", {})
     system_prompt = registry.get(model_name, {}).get("system_prompt")
-    timeout_override = registry.get(model_name, {}).get("timeout")
-    timeout_seconds = (
-        float(timeout_override)
-        if timeout_override is not None
-        else float(app.config.get("AI_GENERATION_TIMEOUT", 45))
-    )
+    timeout_seconds = generation_timeout(app, model_name)
 
     logger.info("Using local model '%s' for insight generation", model_name)
-    future = _generation_pool.submit(
+    # The deadline also covers time spent queued for a worker or a model replica
+    cancel = CancelToken(timeout_seconds)
+    future = get_ai_scheduler(app).submit(
         manager.generate,
+        priority=priority,
+        timeout=timeout_seconds,
         model_name=model_name,
         prompt=prompt,
         system_prompt=system_prompt,
+        cancel=cancel,
     )
 
     try:
-        result = future.result(timeout=timeout_seconds)
+        with stage_timer("llm_call"):
+            result = future.result(timeout=timeout_seconds)
         return result.text, []
     except TimeoutError:
+        # Also covers JobExpired; a running job stops at its next token
         future.cancel()
+        cancel.cancel("timed out")
         logger.error(
             "Generation timed out after %.1f seconds for model '%s'",
             timeout_seconds,
@@ -153,6 +255,112 @@ def _model_insight(prompt: str) -> tuple[str, list[dict]]:
         return _fallback_insight(prompt), []
 
 
+def _local_stream(
+    app,
+    model_name: str,
+    prompt: str,
+    system_prompt: Optional[str],
+    timeout_seconds: float,
+    priority: str,
+) -> Iterator[str]:
+    """
+    Queue ModelManager.generate_stream on the AI scheduler and relay its deltas.
+
+    Raises SchedulerFull immediately when the queue has no room. The returned
+    iterator raises TimeoutError once the whole generation has run past
+    timeout_seconds. On a timeout or when the consumer stops reading (client
+    disconnect), the worker stops at its next token and releases the model replica.
+    """
+    manager = get_model_manager(app)
+    cancel = CancelToken(timeout_seconds)
+    started = perf_counter()
+    deltas = get_ai_scheduler(app).stream(
+        lambda: manager.generate_stream(
+            model_name=model_name,
+            prompt=prompt,
+            system_prompt=system_prompt,
+            cancel=cancel,
+        ),
+        priority=priority,
+        timeout=timeout_seconds,
+        on_close=lambda: cancel.cancel("consumer closed"),
+    )
+
+    def timed():
+        first = True
+        try:
+            for item in deltas:
+                if first:
+                    metrics_registry.observe("insight_stage_seconds", perf_counter() - started, stage="first_token")
+                    first = False
+                yield item
+        finally:
+            deltas.close()
+            metrics_registry.observe("insight_stage_seconds", perf_counter() - started, stage="llm_call")
+
+    return timed()
+
+
+def _local_insight_stream(app, prompt: str, priority: str = "insight") -> Iterator[str]:
+    model_name = app.config.get("AI_DEFAULT_MODEL", "archdruid")
+    registry = app.config.get("AI_MODEL_REGISTRY", {})
+    system_prompt = registry.get(model_name, {}).get("system_prompt")
+    timeout_seconds = generation_timeout(app, model_name)
+
+    logger.info("Streaming local model '%s' for insight generation", model_name)
+    deltas = _local_stream(app, model_name, prompt, system_prompt, timeout_seconds, priority)
+
+    def with_fallback():
+        emitted = False
+        try:
+            for delta in deltas:
+                emitted = True
+                yield delta
+            return
+        except TimeoutError:
+            logger.error(
+                "Streamed generation timed out after %.1f seconds for model '%s'",
+                timeout_seconds,
+                model_name,
+            )
+        except (ModelNotConfiguredError, ModelLoadError, InferenceError) as exc:
+            logger.error("Local model streaming failed: %s", exc)
+        finally:
+            deltas.close()
+        # Only substitute the fallback if the member has not already seen real output
+        if not emitted:
+            yield _fallback_insight(prompt)
+
+    return with_fallback()
+
+
+def _model_insight_stream(prompt: str, priority: str = "insight") -> tuple[Iterator[str], list[dict]]:
+    """
+    Streaming counterpart of _model_insight: returns (text deltas, sources).
+
+    OpenAI is tried first when configured; if the stream cannot be opened
+    the local model streams instead, and the fallback text is sent as a
+    single delta when neither produces anything. Raises SchedulerFull when
+    the local model's queue has no room.
+    """
+    app = current_app._get_current_object()
+    use_openai = app.config.get("AI_USE_OPENAI", True)
+    use_rag = app.config.get("RAG_ENABLED", True)
+
+    if use_openai and _openai_ready():
+        try:
+            registry = app.config.get("AI_MODEL_REGISTRY", {})
+            model_name = app.config.get("AI_DEFAULT_MODEL", "archdruid")
+            system_prompt = registry.get(model_name, {}).get("system_prompt")
+
+            logger.info("Streaming OpenAI insight (RAG: %s)", use_rag)
+            return _openai_insight_stream(prompt, system_prompt, use_rag=use_rag)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("OpenAI stream failed, falling back to local model: %s", exc)
+
+    return _local_insight_stream(app, prompt, priority), []
+
+
 @ai_bp.route("/insight", methods=["POST"])
 @login_required
 def insight():
@@ -161,7 +369,26 @@ def insight():
     if not prompt:
         return jsonify({"error": "Prompt required."}), 400
 
-    guidance, sources = _model_insight(prompt)
+    if data.get("stream"):
+        try:
+            deltas, sources = _model_insight_stream(prompt)
+        except SchedulerFull as exc:
+            return queue_full_response(exc)
+
+        def events():
+            yield "sources", {"sources": sources}
+            parts = []
+            for delta in deltas:
+                parts.append(delta)
+                yield "delta", {"text": delta}
+            yield "done", {"insight": "".join(parts), "sources": sources}
+
+        return sse_response(events())
+
+    try:
+        guidance, sources = _model_insight(prompt)
+    except SchedulerFull as exc:
+        return queue_full_response(exc)
     return jsonify({
         "insight": guidance,
         "sources": sources
@@ -199,14 +426,33 @@ def index_files():
 @login_required
 def rag_status():
     """Get RAG system status."""
-    from .models import DocumentEmbedding, FileAsset
+    from .models import DocumentChunkLink, DocumentEmbedding, ExtractionFailure, FileAsset
+    from .rag import embedding_dimension_counts, get_active_projection, index_stats, stale_vector_count
 
     try:
         total_files = FileAsset.query.count()
         total_embeddings = DocumentEmbedding.query.count()
-        indexed_files = DocumentEmbedding.query.with_entities(
-            DocumentEmbedding.file_asset_id
-        ).distinct().count()
+        linked_chunks = DocumentChunkLink.query.count()
+        indexed_file_ids = {
+            file_id
+            for (file_id,) in DocumentEmbedding.query.with_entities(
+                DocumentEmbedding.file_asset_id
+            ).distinct()
+        }
+        indexed_file_ids.update(
+            file_id
+            for (file_id,) in DocumentChunkLink.query.with_entities(
+                DocumentChunkLink.file_asset_id
+            ).distinct()
+        )
+        indexed_files = len(indexed_file_ids)
+
+        dimension_counts = embedding_dimension_counts()
+        projection = get_active_projection()
+        latency = {
+            dict(labels)["stage"]: histogram.snapshot()
+            for labels, histogram in metrics_registry.histograms("insight_stage_seconds").items()
+        }
 
         app = current_app._get_current_object()
 
@@ -215,10 +461,46 @@ def rag_status():
             "total_files": total_files,
             "indexed_files": indexed_files,
             "total_chunks": total_embeddings,
+            "linked_duplicate_chunks": linked_chunks,
+            "extraction_failures": [
+                {
+                    "file_name": failure.file_name,
+                    "kind": failure.kind,
+                    "attempts": failure.attempts,
+                    "error": failure.error,
+                    "last_failed_at": failure.last_failed_at.isoformat() + "Z",
+                }
+                for failure in ExtractionFailure.query.order_by(
+                    ExtractionFailure.last_failed_at.desc()
+                ).limit(20)
+            ],
+            "embeddings": {
+                "projection": {
+                    "method": projection.method,
+                    "source_dimensions": projection.source_dimensions,
+                    "dimensions": projection.dimensions,
+                    "created_at": projection.created_at.isoformat() + "Z",
+                } if projection else None,
+                "dimensions": dimension_counts,
+                "mixed": len(dimension_counts) > 1,
+                "stale": stale_vector_count(projection),
+            },
+            "index": index_stats(),
+            "latency_seconds": latency,
+            "caches": cache_stats(),
+            "process_memory": process_memory(),
             "config": {
                 "top_k": app.config.get("RAG_TOP_K", 3),
                 "chunk_size": app.config.get("RAG_CHUNK_SIZE", 512),
                 "chunk_overlap": app.config.get("RAG_CHUNK_OVERLAP", 128),
+                "dedup_enabled": app.config.get("RAG_DEDUP_ENABLED", True),
+                "dedup_threshold": app.config.get("RAG_DEDUP_THRESHOLD", 0.85),
+                "embedding_dimensions": app.config.get("RAG_EMBEDDING_DIMENSIONS", 0),
+                "embedding_projection": app.config.get("RAG_EMBEDDING_PROJECTION", "truncate"),
+                "chunk_compression": app.config.get("RAG_CHUNK_COMPRESSION", "none"),
+                "summaries_enabled": app.config.get("RAG_SUMMARIES_ENABLED", True),
+                "summary_chars": app.config.get("RAG_SUMMARY_CHARS", 600),
+                "coarse_top_docs": app.config.get("RAG_COARSE_TOP_DOCS", 8),
             }
         })
 
@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import itertools
 import logging
+import math
 from typing import Any, Dict, Iterable, Optional
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request
 
 from .llm import (
+    CancelToken,
+    GenerationCancelled,
+    GenerationResult,
     InferenceError,
     ModelLoadError,
     ModelNotConfiguredError,
+    generation_timeout,
     get_model_manager,
 )
+from .metrics import process_memory, registry as metrics_registry
+from .scheduler import SchedulerFull, get_ai_scheduler, queue_full_response
+from .streaming import sse_response
 from .neod import (
     PaymentAlreadyProcessed,
     PaymentNotFound,
@@ -54,12 +63,37 @@ def _extract_extra_options(payload: Dict[str, Any]) -> Dict[str, Any]:
     extra: Dict[str, Any] = {}
     options = payload.get("options")
     if isinstance(options, dict):
-        for key in ("top_p", "repeat_penalty", "presence_penalty", "frequency_penalty"):
+        for key in ("top_p", "repeat_penalty", "presence_penalty", "frequency_penalty", "seed"):
             if key in options:
                 extra[key] = options[key]
+    if payload.get("seed") is not None:
+        extra["seed"] = payload["seed"]
     return extra
 
 
+def _generation_options(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """generate() keyword arguments for the options a request body sets (prompt and model aside)."""
+    options: Dict[str, Any] = {
+        key: payload[key]
+        for key in ("system_prompt", "temperature", "max_tokens")
+        if payload.get(key) is not None
+    }
+    stop_sequences = _normalise_stop_sequences(payload.get("stop"))
+    if stop_sequences:
+        options["stop"] = stop_sequences
+    options.update(_extract_extra_options(payload))
+    return options
+
+
+def _batch_entry(model_name: str, index: int, outcome: Any) -> Dict[str, Any]:
+    if isinstance(outcome, GenerationResult):
+        return {"index": index, "completion": outcome.text, "usage": outcome.usage, "cached": outcome.cached}
+    if isinstance(outcome, GenerationCancelled):
+        return {"index": index, "error": "Generation timed out"}
+    logger.error("Batch item %d for '%s' failed: %s", index, model_name, outcome)
+    return {"index": index, "error": "Generation failed"}
+
+
 @api_bp.route("/models", methods=["GET"])
 def list_models():
     api_guard = _enforce_api_key()
@@ -76,6 +110,30 @@ def list_models():
     )
 
 
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition of RAG/inference metrics."""
+    api_guard = _enforce_api_key()
+    if api_guard:
+        return api_guard
+
+    from .rag import index_stats
+
+    try:
+        index_stats()
+    except Exception as exc:
+        logger.warning("Could not refresh RAG index gauges: %s", exc)
+    memory = process_memory()
+    for kind, value in memory.items():
+        if value is not None:
+            metrics_registry.set_gauge("process_memory_bytes", value, kind=kind.replace("_bytes", ""))
+
+    return Response(
+        metrics_registry.render_prometheus(),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
 @api_bp.route("/generate", methods=["POST"])
 def generate_text():
     api_guard = _enforce_api_key()
@@ -96,24 +154,57 @@ def generate_text():
     if not model_name:
         return jsonify({"error": "No model configured"}), 503
 
-    temperature = payload.get("temperature")
-    max_tokens = payload.get("max_tokens")
-    system_prompt = payload.get("system_prompt")
-    stop_sequences = _normalise_stop_sequences(payload.get("stop"))
-    extra_options = _extract_extra_options(payload)
-
     app = current_app._get_current_object()
     manager = get_model_manager(app)
+    scheduler = get_ai_scheduler(app)
+    timeout_seconds = generation_timeout(app, model_name)
+    cancel = CancelToken(timeout_seconds)
+    generate_kwargs = dict(model_name=model_name, prompt=prompt, cancel=cancel, **_generation_options(payload))
+    if payload.get("stream"):
+        try:
+            deltas = scheduler.stream(
+                lambda: manager.generate_stream(**generate_kwargs),
+                priority="api",
+                timeout=timeout_seconds,
+                on_close=lambda: cancel.cancel("consumer closed"),
+            )
+            # Wait for the first delta so load and configuration errors are still plain JSON
+            first = list(itertools.islice(deltas, 1))
+        except SchedulerFull as exc:
+            return queue_full_response(exc)
+        except ModelNotConfiguredError:
+            return jsonify({"error": f"Unknown model '{model_name}'"}), 404
+        except ModelLoadError as exc:
+            logger.error("Model '%s' failed to load: %s", model_name, exc)
+            return jsonify({"error": "Model not available"}), 503
+        except (TimeoutError, GenerationCancelled):
+            # The token's deadline can stop generation before the stream's own timeout fires
+            return jsonify({"error": "Generation timed out"}), 504
+        except InferenceError as exc:
+            logger.error("Generation failure for '%s': %s", model_name, exc)
+            return jsonify({"error": "Generation failed"}), 500
+
+        def events():
+            parts = []
+            for delta in itertools.chain(first, deltas):
+                parts.append(delta)
+                yield "delta", {"text": delta}
+            yield "done", {"model": model_name, "completion": "".join(parts).strip()}
+
+        return sse_response(events())
+
     try:
-        result = manager.generate(
-            model_name=model_name,
-            prompt=prompt,
-            system_prompt=system_prompt,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stop=stop_sequences,
-            **extra_options,
-        )
+        future = scheduler.submit(manager.generate, priority="api", timeout=timeout_seconds, **generate_kwargs)
+    except SchedulerFull as exc:
+        return queue_full_response(exc)
+    try:
+        result = future.result(timeout=timeout_seconds)
+    except (TimeoutError, GenerationCancelled):
+        # Usually the token's deadline stops generation just before the wait times out
+        future.cancel()
+        cancel.cancel("timed out")
+        logger.error("Generation with '%s' timed out after %.1fs", model_name, timeout_seconds)
+        return jsonify({"error": "Generation timed out"}), 504
     except ModelNotConfiguredError:
         return jsonify({"error": f"Unknown model '{model_name}'"}), 404
     except ModelLoadError as exc:
@@ -123,13 +214,109 @@ def generate_text():
         logger.error("Generation failure for '%s': %s", model_name, exc)
         return jsonify({"error": "Generation failed"}), 500
 
-    return jsonify(
+    response = jsonify(
         {
             "model": model_name,
             "completion": result.text,
             "usage": result.usage,
+            "cached": result.cached,
         }
     )
+    response.headers["X-Cache"] = "HIT" if result.cached else "MISS"
+    return response
+
+
+@api_bp.route("/generate/batch", methods=["POST"])
+def generate_batch():
+    """
+    Run many prompts on one model in a single request.
+
+    ``prompts`` is a list of prompt strings or objects with a ``prompt`` and
+    their own /generate options; options at the top level apply to every
+    item. The whole batch is one scheduler job, so local models decode the
+    prompts together instead of taking turns. Results come back in order, or
+    with ``stream`` as one ``result`` event per item as soon as it finishes.
+    """
+    api_guard = _enforce_api_key()
+    if api_guard:
+        return api_guard
+
+    payload = request.get_json(silent=True) or {}
+    raw_items = payload.get("prompts")
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"error": "prompts must be a non-empty list"}), 400
+    limit = current_app.config.get("AI_API_BATCH_LIMIT", 32)
+    if len(raw_items) > limit:
+        return jsonify({"error": f"At most {limit} prompts per batch"}), 400
+
+    model_name = str(
+        payload.get(
+            "model", current_app.config.get("AI_DEFAULT_MODEL", "archdruid")
+        )
+    ).strip()
+    if not model_name:
+        return jsonify({"error": "No model configured"}), 503
+
+    shared_options = _generation_options(payload)
+    items = []
+    for index, raw in enumerate(raw_items):
+        item = raw if isinstance(raw, dict) else {"prompt": raw}
+        prompt = str(item.get("prompt") or "").strip()
+        if not prompt:
+            return jsonify({"error": f"Prompt required for item {index}"}), 400
+        items.append(dict(shared_options, **_generation_options(item), prompt=prompt))
+
+    app = current_app._get_current_object()
+    manager = get_model_manager(app)
+    # Items beyond what the model decodes at once wait their turn inside the batch
+    rounds = math.ceil(len(items) / max(1, manager.parallelism(model_name)))
+    timeout_seconds = generation_timeout(app, model_name) * rounds
+    cancel = CancelToken(timeout_seconds)
+    try:
+        outcomes = get_ai_scheduler(app).stream(
+            lambda: manager.generate_batch(model_name, items, cancel),
+            priority="api",
+            timeout=timeout_seconds,
+            on_close=lambda: cancel.cancel("consumer closed"),
+        )
+        # Wait for the first result so load and configuration errors are still plain JSON
+        first = list(itertools.islice(outcomes, 1))
+    except SchedulerFull as exc:
+        return queue_full_response(exc)
+    except ModelNotConfiguredError:
+        return jsonify({"error": f"Unknown model '{model_name}'"}), 404
+    except ModelLoadError as exc:
+        logger.error("Model '%s' failed to load: %s", model_name, exc)
+        return jsonify({"error": "Model not available"}), 503
+    except TimeoutError:
+        return jsonify({"error": "Generation timed out"}), 504
+    except InferenceError as exc:
+        logger.error("Batch generation failure for '%s': %s", model_name, exc)
+        return jsonify({"error": "Generation failed"}), 500
+
+    def entries():
+        reported = set()
+        try:
+            for index, outcome in itertools.chain(first, outcomes):
+                reported.add(index)
+                yield _batch_entry(model_name, index, outcome)
+        except TimeoutError:
+            logger.error("Batch generation with '%s' timed out after %.1fs", model_name, timeout_seconds)
+            for index in range(len(items)):
+                if index not in reported:
+                    yield {"index": index, "error": "Generation timed out"}
+
+    if payload.get("stream"):
+
+        def events():
+            for entry in entries():
+                yield "result", entry
+            yield "done", {"model": model_name, "count": len(items)}
+
+        return sse_response(events())
+
+    results = sorted(entries(), key=lambda entry: entry["index"])
+    return jsonify({"model": model_name, "results": results})
 
 
 @api_bp.route("/neod/info", methods=["GET"])
@@ -5,7 +5,9 @@ from datetime import datetime, timedelta
 from flask import (
     Blueprint,
     abort,
+    current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -15,7 +17,11 @@ from flask_login import current_user
 
 from .database import db
 from .extensions import login_manager
+from .llm import get_model_manager
+from .metrics import inference_summary, prompt_summary
 from .models import Comment, Post, User
+from .rag import release_file_index
+from .scheduler import get_ai_scheduler
 from .site_settings import ALLOWED_SETTING_KEYS, update_settings
 
 arch_bp = Blueprint("arch", __name__, url_prefix="/arch")
@@ -163,6 +169,8 @@ def delete_user(user_id: int):
         flash("Arch druids cannot be deleted.", "warning")
         return redirect(url_for("arch.dashboard"))
     username = member.username
+    for asset in member.files:
+        release_file_index(asset)
     db.session.delete(member)
     db.session.commit()
     flash(f"Removed {username} and their contributions from the grove.", "warning")
@@ -205,3 +213,19 @@ def remove_comment(comment_id: int):
     db.session.commit()
     flash(f"Removed comment by {author}.", "warning")
     return redirect(url_for("social.feed"))
+
+
+@arch_bp.get("/inference-metrics")
+def inference_metrics():
+    """Per-model inference latency, throughput and prompt token breakdown, for sizing models and budgets."""
+    app = current_app._get_current_object()
+    manager = get_model_manager(app)
+    return jsonify({
+        "inference": inference_summary(),
+        "prompts": prompt_summary(),
+        "scheduler": get_ai_scheduler(app).stats(),
+        "models": {
+            name: {key: model[key] for key in ("state", "replicas", "batching", "threads", "batch_size")}
+            for name, model in manager.describe_models().items()
+        },
+    })
@@ -3,10 +3,12 @@ from __future__ import annotations
 import json
 import os
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from threading import Lock
-from typing import Iterable, Optional
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Iterable, Optional
+from uuid import uuid4
 
 import sqlalchemy as sa
 from sqlalchemy.orm import joinedload, selectinload
@@ -25,7 +27,9 @@ from flask_login import current_user, login_required
 
 from simple_websocket import ConnectionClosed
 
-from .ai import _model_insight
+from .ai import _insight_prompt_budget, _model_insight_stream
+from .prompting import lexical_overlap
+from .scheduler import SchedulerFull
 from .chat_crypto import (
     ChatIdentity,
     WrappedMessageKey,
@@ -573,36 +577,70 @@ def _build_message_payload(
     }
 
 
-def _broadcast_message(thread: ChatThread, message: ChatMessage) -> None:
+def _broadcast_event(
+    thread: ChatThread,
+    payload: dict | Callable[[ChatConnection], dict],
+    *,
+    unlocked_only: bool = False,
+) -> None:
+    """Send ``payload`` (or ``payload(connection)``) to the thread's subscribers, dropping dead sockets."""
     with _connection_lock:
-        subscribers = list(_thread_subscribers.get(thread.id, set()))
+        subscribers = [
+            connection
+            for connection in _thread_subscribers.get(thread.id, set())
+            if not unlocked_only or connection.private_key is not None
+        ]
     if not subscribers:
         return
     stale: list[ChatConnection] = []
     for connection in subscribers:
-        payload = {
-            "type": "message",
-            "thread_id": thread.id,
-            "message": _build_message_payload(thread, message, connection),
-        }
-        if not connection.send_event(payload):
+        event = payload(connection) if callable(payload) else payload
+        if not connection.send_event(event):
             stale.append(connection)
     if stale:
         _cleanup_stale_connections(stale)
 
 
+def _broadcast_message(thread: ChatThread, message: ChatMessage) -> None:
+    # Each subscriber gets the body decrypted with their own key
+    _broadcast_event(
+        thread,
+        lambda connection: {
+            "type": "message",
+            "thread_id": thread.id,
+            "message": _build_message_payload(thread, message, connection),
+        },
+    )
+
+
+def _broadcast_message_delta(thread: ChatThread, sender: User, stream_id: str, delta: str) -> None:
+    """Push a partial reply to unlocked subscribers; the stored message follows as a normal event."""
+    _broadcast_event(
+        thread,
+        {
+            "type": "message_delta",
+            "thread_id": thread.id,
+            "stream_id": stream_id,
+            "sender": _sender_payload(sender),
+            "delta": delta,
+        },
+        unlocked_only=True,
+    )
+
+
+def _broadcast_stream_end(thread: ChatThread, stream_id: str) -> None:
+    _broadcast_event(thread, {"type": "message_stream_end", "thread_id": thread.id, "stream_id": stream_id})
+
+
+def _broadcast_typing(thread: ChatThread, sender: User, typing: bool) -> None:
+    _broadcast_event(
+        thread,
+        {"type": "typing", "thread_id": thread.id, "sender": _sender_payload(sender), "typing": typing},
+    )
+
+
 def _broadcast_message_deleted(thread: ChatThread, message_id: int) -> None:
-    with _connection_lock:
-        subscribers = list(_thread_subscribers.get(thread.id, set()))
-    if not subscribers:
-        return
-    stale: list[ChatConnection] = []
-    payload = {"type": "message_deleted", "thread_id": thread.id, "message_id": message_id}
-    for connection in subscribers:
-        if not connection.send_event(payload):
-            stale.append(connection)
-    if stale:
-        _cleanup_stale_connections(stale)
+    _broadcast_event(thread, {"type": "message_deleted", "thread_id": thread.id, "message_id": message_id})
 
 
 def _fetch_thread_for_user(thread_id: int, user_id: int) -> ChatThread | None:
@@ -829,10 +867,32 @@ def _generate_archdruid_prompt(sender: User, body: str, thread: ChatThread) -> s
         if member.user_id != sender.id
     ]
     participant_list = ", ".join(sorted(participants))
-    knowledge_snippets = _shared_hollow_snippets()
+    app = current_app._get_current_object()
+    budget, provider, model_name = _insight_prompt_budget(app, app.config.get("RAG_CONTEXT_TOKENS", 1500))
+    opening = (
+        "You are Archdruid Eldara replying in the Neo Druidic Society's encrypted chat.\n"
+        f"Participants in this channel: {participant_list or 'just you and the member'}.\n"
+    )
+    closing = "Respond in a warm, compassionate tone with a concise, actionable insight."
+    budget.add("instructions", f"{opening}The member {sender.username} says:\n\"\"\n\n{closing}")
+    message = budget.fit("question", body.strip())
+
+    snippets = _shared_hollow_snippets()
+    knowledge_heading = "Recent wisdom from the Shared Hollow and Knowledge Garden:\n"
+    # Notes that share words with the member's message go first, then the most recent
+    packed = budget.pack(
+        "context",
+        [
+            (lexical_overlap(message, snippet) - rank * 1e-3, "- ", snippet)
+            for rank, snippet in enumerate(snippets)
+        ],
+        overhead=knowledge_heading,
+    )
+    knowledge_snippets = [snippet for snippet in packed if snippet is not None]
+    budget.record(provider, model_name)
     if knowledge_snippets:
         knowledge_section = (
-            "Recent wisdom from the Shared Hollow and Knowledge Garden:\n"
+            knowledge_heading
             + "\n".join(f"- {entry}" for entry in knowledge_snippets)
             + "\n\n"
         )
@@ -841,15 +901,15 @@ def _generate_archdruid_prompt(sender: User, body: str, thread: ChatThread) -> s
             "The Shared Hollow offers no new notes right now; rely on your lived teachings.\n\n"
         )
     return (
-        "You are Archdruid Eldara replying in the Neo Druidic Society's encrypted chat.\n"
-        f"Participants in this channel: {participant_list or 'just you and the member'}.\n"
+        f"{opening}"
         f"{knowledge_section}"
-        f"The member {sender.username} says:\n\"{body.strip()}\"\n\n"
-        "Respond in a warm, compassionate tone with a concise, actionable insight."
+        f"The member {sender.username} says:\n\"{message}\"\n\n"
+        f"{closing}"
     )
 
 
-def _maybe_send_archdruid_reply(thread: ChatThread, sender: User, body: str) -> Optional[ChatMessage]:
+def _archdruid_for_reply(thread: ChatThread, sender: User) -> Optional[User]:
+    """The Archdruid user if it should answer ``sender`` in ``thread``, else None."""
     if sender.username.lower() == ARCHDRUID_USERNAME.lower():
         return None
     if not _thread_has_archdruid(thread):
@@ -857,10 +917,25 @@ def _maybe_send_archdruid_reply(thread: ChatThread, sender: User, body: str) ->
     archdruid = get_archdruid_user()
     if archdruid is None or not archdruid.has_chat_keys:
         return None
+    return archdruid
+
+
+def _maybe_send_archdruid_reply(thread: ChatThread, sender: User, body: str) -> Optional[ChatMessage]:
+    archdruid = _archdruid_for_reply(thread, sender)
+    if archdruid is None:
+        return None
     prompt = _generate_archdruid_prompt(sender, body, thread)
+    stream_id = uuid4().hex
     try:
-        reply, sources = _model_insight(prompt)
-        reply = (reply or "").strip()
+        deltas, sources = _model_insight_stream(prompt, priority="chat")
+        parts: list[str] = []
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                _broadcast_message_delta(thread, archdruid, stream_id, delta)
+        finally:
+            _broadcast_stream_end(thread, stream_id)
+        reply = "".join(parts).strip()
 
         # Append source links if available
         if sources:
@@ -869,6 +944,9 @@ def _maybe_send_archdruid_reply(thread: ChatThread, sender: User, body: str) ->
                 reply += f"\n• {source['name']} (relevance: {source['relevance']})"
                 reply += f" - /files/preview/{source['id']}"
 
+    except SchedulerFull as exc:
+        current_app.logger.warning("Skipping Archdruid reply: %s", exc)
+        return None
     except Exception:
         current_app.logger.exception("Archdruid reply generation failed.")
         return None
@@ -882,6 +960,96 @@ def _maybe_send_archdruid_reply(thread: ChatThread, sender: User, body: str) ->
         return None
 
 
+class _ReplyWorkers:
+    """
+    Worker threads that generate Archdruid replies outside the request that triggered them.
+
+    The reply jobs themselves wait on the AI scheduler for their generation,
+    so they cannot run on its workers; instead this pool admits at most
+    ``workers + max_queue`` jobs, like the scheduler does, and turns the rest away.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="archdruid-reply")
+        self._slots = BoundedSemaphore(max(1, workers) + max(0, max_queue))
+
+    def submit(self, fn, *args) -> Optional[Future]:
+        """Run ``fn(*args)`` on a worker, or return None when the backlog is full."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+_reply_workers_lock = Lock()
+
+
+def _archdruid_reply_workers(app) -> _ReplyWorkers:
+    with _reply_workers_lock:
+        workers: _ReplyWorkers | None = app.extensions.get("archdruid_replies")  # type: ignore[assignment]
+        if workers is None:
+            workers = _ReplyWorkers(app.config.get("AI_WORKERS", 2), app.config.get("AI_QUEUE_DEPTH", 16))
+            app.extensions["archdruid_replies"] = workers
+        return workers
+
+
+def _queue_archdruid_reply(thread: ChatThread, sender: User, body: str) -> Optional[Future]:
+    """
+    Have the Archdruid answer in the background once the member's message is stored.
+
+    The future resolves to the reply's message id, or None when no reply was
+    sent. Returns None straight away when too many replies are already waiting.
+    """
+    if _archdruid_for_reply(thread, sender) is None:
+        return None
+    app = current_app._get_current_object()
+    future = _archdruid_reply_workers(app).submit(
+        _run_archdruid_reply, app, request.url_root, thread.id, sender.id, body
+    )
+    if future is None:
+        current_app.logger.warning("Skipping Archdruid reply: too many replies are already queued")
+    return future
+
+
+def _run_archdruid_reply(app, base_url: str, thread_id: int, sender_id: int, body: str) -> Optional[int]:
+    # Message payloads build avatar URLs, which needs a request context for the member's host
+    with app.test_request_context(base_url=base_url):
+        try:
+            thread = (
+                ChatThread.query.options(
+                    selectinload(ChatThread.members).selectinload(ChatThreadMember.user),
+                )
+                .filter(ChatThread.id == thread_id)
+                .first()
+            )
+            sender = db.session.get(User, sender_id)
+            if thread is None or sender is None:
+                return None
+            archdruid = get_archdruid_user()
+            _broadcast_typing(thread, archdruid, True)
+            try:
+                arch_message = _maybe_send_archdruid_reply(thread, sender, body)
+                if arch_message is None:
+                    return None
+                db.session.commit()
+                fresh_arch = (
+                    ChatMessage.query.options(joinedload(ChatMessage.sender), selectinload(ChatMessage.keys))
+                    .get(arch_message.id)
+                )
+                if fresh_arch:
+                    _broadcast_message(thread, fresh_arch)
+                return arch_message.id
+            finally:
+                _broadcast_typing(thread, archdruid, False)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Archdruid reply failed.")
+            return None
+        finally:
+            db.session.remove()
+
+
 def _collect_thread_messages(thread: ChatThread, private_key: bytes | None) -> list[dict]:
     if private_key is None:
         return []
@@ -1609,8 +1777,6 @@ def send():
         return redirect(url_for("chat.index", thread=thread.id))
 
     message = _persist_message(thread, current_user, body)
-    # AI now uses OpenAI API for fast, reliable responses
-    arch_message = _maybe_send_archdruid_reply(thread, current_user, body)
     db.session.commit()
     fresh_message = (
         ChatMessage.query.options(joinedload(ChatMessage.sender), selectinload(ChatMessage.keys))
@@ -1618,13 +1784,8 @@ def send():
     )
     if fresh_message:
         _broadcast_message(thread, fresh_message)
-    if arch_message:
-        fresh_arch = (
-            ChatMessage.query.options(joinedload(ChatMessage.sender), selectinload(ChatMessage.keys))
-            .get(arch_message.id)
-        )
-        if fresh_arch:
-            _broadcast_message(thread, fresh_arch)
+    # The Archdruid answers from a worker: a typing event, then message_delta tokens, then the stored reply
+    _queue_archdruid_reply(thread, current_user, body)
 
     if is_async:
         return jsonify({"ok": True, "message_id": message.id})
@@ -45,6 +45,27 @@ def _resolve_default_batch_size() -> int | None:
     return 256
 
 
+def _resolve_default_replicas() -> int:
+    try:
+        return max(1, int(os.environ.get("NEO_DRUIDIC_LLM_REPLICAS", "1")))
+    except ValueError:
+        return 1
+
+
+def _resolve_default_batch_sequences() -> int:
+    try:
+        return max(0, int(os.environ.get("NEO_DRUIDIC_LLM_BATCH_SEQUENCES", "0")))
+    except ValueError:
+        return 0
+
+
+def _resolve_default_prompt_cache_mb() -> int:
+    try:
+        return max(0, int(os.environ.get("NEO_DRUIDIC_LLM_PROMPT_CACHE_MB", "0")))
+    except ValueError:
+        return 0
+
+
 def _load_json_from_file(path: str) -> dict | None:
     try:
         data = Path(path).expanduser().read_text(encoding="utf-8")
@@ -80,6 +101,9 @@ def _load_model_registry() -> dict:
     max_tokens = int(os.environ.get("NEO_DRUIDIC_MAX_TOKENS", "128"))
     default_threads = _resolve_default_threads()
     default_batch_size = _resolve_default_batch_size()
+    default_replicas = _resolve_default_replicas()
+    default_batch_sequences = _resolve_default_batch_sequences()
+    default_prompt_cache_mb = _resolve_default_prompt_cache_mb()
     generation_timeout = float(
         os.environ.get("NEO_DRUIDIC_GENERATION_TIMEOUT", "45")
     )
@@ -96,6 +120,9 @@ def _load_model_registry() -> dict:
             "temperature": temperature,
             "max_tokens": max_tokens,
             "timeout": generation_timeout,
+            "replicas": default_replicas,
+            "batch_sequences": default_batch_sequences,
+            "prompt_cache_mb": default_prompt_cache_mb,
         }
     }
 
@@ -117,6 +144,9 @@ def _load_model_registry() -> dict:
                 "temperature": temperature,
                 "max_tokens": max_tokens,
                 "timeout": generation_timeout,
+                "replicas": default_replicas,
+                "batch_sequences": default_batch_sequences,
+                "prompt_cache_mb": default_prompt_cache_mb,
             }
             if default_threads:
                 registry["grove_sage"]["threads"] = default_threads
@@ -163,13 +193,76 @@ class Config:
     AI_GENERATION_TIMEOUT = int(
         os.environ.get("NEO_DRUIDIC_GENERATION_TIMEOUT", "45")
     )
+    # Local generation workers and how many jobs may wait for one before requests get a 503
+    AI_WORKERS = int(os.environ.get("NEO_DRUIDIC_AI_WORKERS", "2"))
+    AI_QUEUE_DEPTH = int(os.environ.get("NEO_DRUIDIC_AI_QUEUE_DEPTH", "16"))
+    # Most prompts one /api/v1/generate/batch request may carry
+    AI_API_BATCH_LIMIT = int(os.environ.get("NEO_DRUIDIC_API_BATCH_LIMIT", "32"))
+    # llama.cpp threads and RAM shared by one model's replicas (0 = no memory cap)
+    AI_THREAD_BUDGET = int(os.environ.get("NEO_DRUIDIC_LLM_THREAD_BUDGET", str(os.cpu_count() or 1)))
+    AI_MEMORY_BUDGET_MB = int(os.environ.get("NEO_DRUIDIC_LLM_MEMORY_MB", "0"))
+    # Total resident size for all local models; idle ones are unloaded LRU-first (0 = unlimited)
+    AI_MODEL_RAM_BUDGET_MB = int(os.environ.get("NEO_DRUIDIC_MODEL_RAM_MB", "0"))
+    # Models to load (and warm with a one-token generation) at startup; "default" = AI_DEFAULT_MODEL
+    AI_PRELOAD_MODELS = [
+        name.strip() for name in os.environ.get("NEO_DRUIDIC_PRELOAD_MODELS", "").split(",") if name.strip()
+    ]
+    AI_PRELOAD_WARMUP = os.environ.get("NEO_DRUIDIC_PRELOAD_WARMUP", "true").lower() in ("true", "1", "yes")
+    # Opt-in cache for deterministic completions (temperature 0 or an explicit seed)
+    AI_COMPLETION_CACHE_ENABLED = os.environ.get("NEO_DRUIDIC_COMPLETION_CACHE", "false").lower() in ("true", "1", "yes")
+    AI_COMPLETION_CACHE_SIZE = int(os.environ.get("NEO_DRUIDIC_COMPLETION_CACHE_SIZE", "256"))
+    AI_COMPLETION_CACHE_TTL = int(os.environ.get("NEO_DRUIDIC_COMPLETION_CACHE_TTL", "3600"))
+    AI_COMPLETION_CACHE_DIR = os.environ.get("NEO_DRUIDIC_COMPLETION_CACHE_DIR", "")
     # OpenAI API configuration (for fast, reliable AI responses)
     AI_USE_OPENAI = os.environ.get("NEO_DRUIDIC_USE_OPENAI", "true").lower() in ("true", "1", "yes")
+    # Shared OpenAI client: per-call timeout, pooled connections, hedging (0 = off) and circuit breaker
+    AI_OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "")
+    AI_OPENAI_TIMEOUT = float(os.environ.get("NEO_DRUIDIC_OPENAI_TIMEOUT", "10"))
+    AI_OPENAI_MAX_CONNECTIONS = int(os.environ.get("NEO_DRUIDIC_OPENAI_MAX_CONNECTIONS", "20"))
+    AI_OPENAI_HEDGE_AFTER = float(os.environ.get("NEO_DRUIDIC_OPENAI_HEDGE_AFTER", "0"))
+    AI_OPENAI_BREAKER_FAILURES = int(os.environ.get("NEO_DRUIDIC_OPENAI_BREAKER_FAILURES", "5"))
+    AI_OPENAI_BREAKER_RESET = float(os.environ.get("NEO_DRUIDIC_OPENAI_BREAKER_RESET", "30"))
     # RAG (Retrieval Augmented Generation) configuration
     RAG_ENABLED = os.environ.get("NEO_DRUIDIC_RAG_ENABLED", "true").lower() in ("true", "1", "yes")
     RAG_TOP_K = int(os.environ.get("NEO_DRUIDIC_RAG_TOP_K", "3"))
+    # Most tokens of retrieved context packed into one prompt (the model's window may allow fewer)
+    RAG_CONTEXT_TOKENS = int(os.environ.get("NEO_DRUIDIC_RAG_CONTEXT_TOKENS", "1500"))
     RAG_CHUNK_SIZE = int(os.environ.get("NEO_DRUIDIC_RAG_CHUNK_SIZE", "512"))
     RAG_CHUNK_OVERLAP = int(os.environ.get("NEO_DRUIDIC_RAG_CHUNK_OVERLAP", "128"))
+    # Near-duplicate chunk folding (MinHash/LSH) at index time
+    RAG_DEDUP_ENABLED = os.environ.get("NEO_DRUIDIC_RAG_DEDUP_ENABLED", "true").lower() in ("true", "1", "yes")
+    RAG_DEDUP_THRESHOLD = float(os.environ.get("NEO_DRUIDIC_RAG_DEDUP_THRESHOLD", "0.85"))
+    # Embedding dimensionality reduction: 0 keeps the full model output.
+    # "truncate" keeps the leading dims (Matryoshka); "pca" fits a projection at index time.
+    RAG_EMBEDDING_DIMENSIONS = int(os.environ.get("NEO_DRUIDIC_RAG_EMBEDDING_DIMENSIONS", "0"))
+    RAG_EMBEDDING_PROJECTION = os.environ.get("NEO_DRUIDIC_RAG_EMBEDDING_PROJECTION", "truncate").lower()
+    # Store chunk text compressed in a side table: "none", "zlib" or "zstd" (needs zstandard)
+    RAG_CHUNK_COMPRESSION = os.environ.get("NEO_DRUIDIC_RAG_CHUNK_COMPRESSION", "none").lower()
+    # Per-file summaries: rank documents by summary first, then search chunks inside the best ones
+    RAG_SUMMARIES_ENABLED = os.environ.get("NEO_DRUIDIC_RAG_SUMMARIES_ENABLED", "true").lower() in ("true", "1", "yes")
+    RAG_SUMMARY_CHARS = int(os.environ.get("NEO_DRUIDIC_RAG_SUMMARY_CHARS", "600"))
+    RAG_COARSE_TOP_DOCS = int(os.environ.get("NEO_DRUIDIC_RAG_COARSE_TOP_DOCS", "8"))
+    RAG_SUMMARY_MIN_SIMILARITY = float(os.environ.get("NEO_DRUIDIC_RAG_SUMMARY_MIN_SIMILARITY", "0.4"))
+    # Extracted PDF/image/DOCX text cached by content hash (default dir: STORAGE_ROOT/.extraction_cache)
+    EXTRACTION_CACHE_ENABLED = os.environ.get("NEO_DRUIDIC_EXTRACTION_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+    EXTRACTION_CACHE_DIR = os.environ.get("NEO_DRUIDIC_EXTRACTION_CACHE_DIR", "")
+    # Trimmed back to this size (MB, 0 = unlimited) after each full index, least recently used first
+    EXTRACTION_CACHE_MAX_MB = int(os.environ.get("NEO_DRUIDIC_EXTRACTION_CACHE_MAX_MB", "1024"))
+    # PaddleOCR engines kept loaded per worker process; recycled after this many pages
+    OCR_POOL_SIZE = int(os.environ.get("NEO_DRUIDIC_OCR_POOL_SIZE", "1"))
+    OCR_RECYCLE_PAGES = int(os.environ.get("NEO_DRUIDIC_OCR_RECYCLE_PAGES", "500"))
+    OCR_WARMUP = os.environ.get("NEO_DRUIDIC_OCR_WARMUP", "false").lower() in ("true", "1", "yes")
+    # Processes OCRing scanned PDF pages in parallel (1 = in-process, one page at a time);
+    # only used with the sandbox off, sandbox workers OCR one page at a time
+    OCR_WORKERS = int(os.environ.get("NEO_DRUIDIC_OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # PDF/image/DOCX extraction runs in subprocess workers with a wall-clock timeout and
+    # an address-space cap (MB, 0 = unlimited); files failing MAX_ATTEMPTS times are skipped.
+    # Indexing runs inside the POST /ai/index-files request, which waits up to the timeout per file.
+    EXTRACTION_SANDBOX_ENABLED = os.environ.get("NEO_DRUIDIC_EXTRACTION_SANDBOX", "true").lower() in ("true", "1", "yes")
+    EXTRACTION_WORKERS = int(os.environ.get("NEO_DRUIDIC_EXTRACTION_WORKERS", "2"))
+    EXTRACTION_TIMEOUT = float(os.environ.get("NEO_DRUIDIC_EXTRACTION_TIMEOUT", "120"))
+    EXTRACTION_MEMORY_MB = int(os.environ.get("NEO_DRUIDIC_EXTRACTION_MEMORY_MB", "4096"))
+    EXTRACTION_MAX_ATTEMPTS = int(os.environ.get("NEO_DRUIDIC_EXTRACTION_MAX_ATTEMPTS", "2"))
     # Surface Solana / NEOD settings so the treasury bootstrap can read them.
     _solana_wallet = os.environ.get("SOLANA_WALLET_ADDRESS")
     if _solana_wallet:
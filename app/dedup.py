@@ -0,0 +1,172 @@
+"""MinHash/LSH near-duplicate detection for Knowledge Garden chunks."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import re
+from collections import defaultdict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 128 permutations split into 32 bands of 4 rows puts the LSH candidate
+# threshold around 0.42 Jaccard; candidates are then verified against the
+# configured similarity threshold using the full signature.
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+# Fixed seed so signatures stored in the database stay comparable across processes.
+_rng = random.Random(0x6E656F64)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def _normalise(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace so OCR noise matters less."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _shingle_hashes(text: str) -> set[int]:
+    normalised = _normalise(text)
+    if not normalised:
+        return set()
+    if len(normalised) <= SHINGLE_SIZE:
+        shingles: Iterable[str] = (normalised,)
+    else:
+        shingles = (
+            normalised[i:i + SHINGLE_SIZE]
+            for i in range(len(normalised) - SHINGLE_SIZE + 1)
+        )
+    return {
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+        for s in shingles
+    }
+
+
+def minhash_signature(text: str) -> Optional[list[int]]:
+    """
+    Compute a MinHash signature over character shingles of a chunk.
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        List of NUM_PERMUTATIONS ints, or None if the text has no shingles
+    """
+    hashes = _shingle_hashes(text)
+    if not hashes:
+        return None
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_jaccard(sig1: list[int], sig2: list[int]) -> float:
+    """Estimate Jaccard similarity from two MinHash signatures."""
+    if not sig1 or len(sig1) != len(sig2):
+        return 0.0
+    matches = sum(1 for a, b in zip(sig1, sig2) if a == b)
+    return matches / len(sig1)
+
+
+def serialize_signature(signature: list[int]) -> str:
+    return json.dumps(signature, separators=(",", ":"))
+
+
+def deserialize_signature(raw: Optional[str]) -> Optional[list[int]]:
+    if not raw:
+        return None
+    try:
+        signature = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(signature, list) or len(signature) != NUM_PERMUTATIONS:
+        return None
+    return signature
+
+
+def _band_keys(signature: list[int]) -> list[tuple[int, tuple[int, ...]]]:
+    return [
+        (band, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]))
+        for band in range(NUM_BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """In-memory LSH index mapping chunk signatures to representative embedding ids."""
+
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+        self._buckets: dict[tuple[int, tuple[int, ...]], list[int]] = defaultdict(list)
+        self._signatures: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, embedding_id: int, signature: list[int]) -> None:
+        """Register a representative chunk."""
+        if embedding_id in self._signatures:
+            return
+        self._signatures[embedding_id] = signature
+        for key in _band_keys(signature):
+            self._buckets[key].append(embedding_id)
+
+    def discard_many(self, embedding_ids: Iterable[int]) -> None:
+        """Forget representatives (e.g. when their file is re-indexed)."""
+        for embedding_id in embedding_ids:
+            signature = self._signatures.pop(embedding_id, None)
+            if signature is None:
+                continue
+            for key in _band_keys(signature):
+                bucket = self._buckets.get(key)
+                if bucket and embedding_id in bucket:
+                    bucket.remove(embedding_id)
+                    if not bucket:
+                        self._buckets.pop(key, None)
+
+    def find(self, signature: list[int]) -> Optional[tuple[int, float]]:
+        """
+        Find the most similar representative above the threshold.
+
+        Returns:
+            (embedding_id, estimated_jaccard) or None
+        """
+        candidates: set[int] = set()
+        for key in _band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket:
+                candidates.update(bucket)
+
+        best: Optional[tuple[int, float]] = None
+        for candidate_id in candidates:
+            similarity = estimate_jaccard(signature, self._signatures[candidate_id])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate_id, similarity)
+        return best
+
+    @classmethod
+    def from_database(cls, threshold: float = 0.85) -> "NearDuplicateIndex":
+        """Build an index from the signatures of all stored representative chunks."""
+        from .models import DocumentEmbedding, db
+
+        index = cls(threshold=threshold)
+        rows = db.session.query(DocumentEmbedding.id, DocumentEmbedding.minhash).filter(
+            DocumentEmbedding.minhash.isnot(None)
+        )
+        for embedding_id, raw in rows:
+            signature = deserialize_signature(raw)
+            if signature is not None:
+                index.add(embedding_id, signature)
+        logger.info("Loaded %d chunk signatures into near-duplicate index", len(index))
+        return index
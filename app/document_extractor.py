@@ -1,141 +1,333 @@
 """Document text extraction with OCR support for PDFs and images."""
 from __future__ import annotations
 
+import codecs
 import logging
+import os
+import struct
+import zipfile
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from xml.etree import ElementTree
 from pathlib import Path
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever extraction output changes so cached results are not reused
+EXTRACTOR_VERSION = 4
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """
-    Extract text from PDF with OCR fallback.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif')
+TEXT_EXTENSIONS = (
+    '.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm',
+    '.py', '.js', '.ts', '.jsx', '.tsx', '.css', '.scss',
+    '.yaml', '.yml', '.ini', '.conf', '.log', '.sql', '.sh'
+)
 
-    Tries multiple methods:
-    1. PyPDF2 for text-based PDFs
-    2. pdfplumber for better text extraction
-    3. PaddleOCR for scanned/image PDFs
-    4. Tesseract as final fallback
+# Extractors worth caching and isolating in sandbox workers; plain text is
+# cheaper to re-read in-process than to hash, look up or ship to a worker
+CACHED_KINDS = ("pdf", "image", "docx")
 
-    Args:
-        file_path: Path to the PDF file
 
-    Returns:
-        Extracted text content
-    """
-    text_parts = []
+@dataclass
+class ExtractionResult:
+    """Extracted text plus where each page starts in it."""
 
-    # Method 1: Try PyPDF2 (fast, works for text PDFs)
-    try:
-        import PyPDF2
-        with open(file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text_parts.append(page_text)
-
-        if text_parts:
-            extracted = '\n\n'.join(text_parts)
-            # Remove null bytes which PostgreSQL doesn't allow
-            extracted = extracted.replace('\x00', '')
-            if len(extracted.strip()) > 100:  # At least 100 chars = likely good extraction
-                logger.info("Extracted %d chars from PDF using PyPDF2", len(extracted))
-                return extracted
-    except Exception as exc:
-        logger.warning("PyPDF2 extraction failed: %s", exc)
+    text: str
+    page_offsets: list[int] = field(default_factory=list)
+    method: str = ""
+    # False when extraction stopped early at a character budget
+    complete: bool = True
 
-    # Method 2: Try pdfplumber (better text extraction)
-    try:
-        import pdfplumber
-        text_parts = []
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text_parts.append(page_text)
-
-        if text_parts:
-            extracted = '\n\n'.join(text_parts)
-            # Remove null bytes which PostgreSQL doesn't allow
-            extracted = extracted.replace('\x00', '')
-            if len(extracted.strip()) > 100:
-                logger.info("Extracted %d chars from PDF using pdfplumber", len(extracted))
-                return extracted
-    except Exception as exc:
-        logger.warning("pdfplumber extraction failed: %s", exc)
 
-    # Method 3: Try PaddleOCR (for scanned PDFs/images)
+@dataclass(frozen=True)
+class SniffResult:
+    """Extractor kind (and text encoding) detected from a file's leading bytes."""
+
+    kind: str
+    encoding: Optional[str] = None
+
+
+# How much of a file the sniffer looks at
+SNIFF_BYTES = 8192
+
+_IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',
+    b'\xff\xd8\xff',          # JPEG
+    b'GIF87a', b'GIF89a',
+    b'II*\x00', b'MM\x00*',    # TIFF
+)
+
+# BITMAPCOREHEADER, BITMAPINFOHEADER and its V2-V5 successors
+_BMP_DIB_HEADER_SIZES = (12, 40, 56, 108, 124)
+
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def _is_bmp(sample: bytes, file_size: int) -> bool:
+    """A "BM" magic alone matches plenty of text; the header's file and DIB sizes must agree too."""
+    if len(sample) < 18 or sample[:2] != b'BM':
+        return False
+    declared_size, = struct.unpack_from('<I', sample, 2)
+    dib_size, = struct.unpack_from('<I', sample, 14)
+    return declared_size == file_size and dib_size in _BMP_DIB_HEADER_SIZES
+
+
+def _is_pdf(sample: bytes) -> bool:
+    """The %PDF- header must open the file; text that merely mentions it further in is still text."""
+    if sample.startswith(codecs.BOM_UTF8):
+        sample = sample[len(codecs.BOM_UTF8):]
+    return sample.lstrip(b' \t\r\n\x0c').startswith(b'%PDF-')
+
+
+def _detect_text_encoding(sample: bytes, complete: bool) -> Optional[str]:
+    """Encoding of a text sample, or None if it looks binary."""
+    for bom, encoding in _BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+    if b'\x00' in sample:
+        return None
+    try:
+        # Incremental so a multi-byte sequence cut at the sample boundary is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=complete)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
     try:
-        from paddleocr import PaddleOCR
-        from pdf2image import convert_from_path
+        sample.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
 
-        logger.info("PDF appears to be scanned, trying PaddleOCR...")
 
-        # Convert PDF pages to images
-        images = convert_from_path(file_path, dpi=200)
+def sniff_file(file_path: str) -> SniffResult:
+    """
+    Pick an extractor from the file's content rather than its name.
 
-        # Initialize PaddleOCR (English)
-        ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+    Reads the first SNIFF_BYTES bytes (plus the zip directory for DOCX), so a
+    mislabelled upload is routed by what it is: a scanned "notes.txt" that is
+    really a PDF goes to the PDF extractor, a text file called "data.bin" is
+    read as text, and text files get their encoding in the same pass.
 
-        text_parts = []
-        for i, image in enumerate(images):
-            # Save temp image
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                image.save(tmp.name)
-                tmp_path = tmp.name
+    Args:
+        file_path: Path to the file
 
-            # Run OCR
-            result = ocr.ocr(tmp_path, cls=True)
+    Returns:
+        SniffResult with kind pdf, image, docx, html, text or unsupported
+    """
+    with open(file_path, 'rb') as handle:
+        sample = handle.read(SNIFF_BYTES)
+        complete = len(sample) < SNIFF_BYTES
+        file_size = os.fstat(handle.fileno()).st_size
+
+    if _is_pdf(sample):
+        return SniffResult("pdf")
+    if (
+        sample.startswith(_IMAGE_SIGNATURES)
+        or _is_bmp(sample, file_size)
+        or (sample[:4] == b'RIFF' and sample[8:12] == b'WEBP')
+    ):
+        return SniffResult("image")
+    if sample.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                if 'word/document.xml' in archive.namelist():
+                    return SniffResult("docx")
+        except (zipfile.BadZipFile, OSError):
+            pass
+        return SniffResult("unsupported")
+
+    encoding = _detect_text_encoding(sample, complete)
+    if encoding is None:
+        return SniffResult("unsupported")
+    head = sample[:1024].decode(encoding, errors='ignore').lstrip('\ufeff \t\r\n').lower()
+    # Only a leading tag counts: Markdown or source files that mention <html> are still text
+    if Path(file_path).suffix.lower() in ('.html', '.htm') or head.startswith(('<!doctype html', '<html')):
+        return SniffResult("html", encoding)
+    return SniffResult("text", encoding)
+
+
+def _join_pages(pages: list[Optional[str]], method: str) -> ExtractionResult:
+    """Join page texts with blank lines, recording each page's start offset (empty pages included)."""
+    parts: list[str] = []
+    offsets: list[int] = []
+    position = 0
+    for page in pages:
+        # Remove null bytes which PostgreSQL doesn't allow
+        page = (page or "").replace('\x00', '')
+        start = position + 2 if parts else position
+        offsets.append(start)
+        if page.strip():
+            parts.append(page)
+            position = start + len(page)
+    return ExtractionResult(text='\n\n'.join(parts), page_offsets=offsets, method=method)
+
+
+# A page whose text layer has fewer characters than this is treated as scanned
+MIN_PAGE_TEXT_CHARS = 25
+
+
+class _TextLayer:
+    """Per-page access to a PDF's text layer: PyPDF2 first, pdfplumber for pages it misses."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._handle = None
+        self._reader = None
+        self._plumber = None
+        self._plumber_tried = False
+        try:
+            import PyPDF2
+            self._handle = open(file_path, 'rb')
+            self._reader = PyPDF2.PdfReader(self._handle)
+        except Exception as exc:
+            logger.warning("PyPDF2 could not open PDF: %s", exc)
+
+    def _open_plumber(self):
+        if not self._plumber_tried:
+            self._plumber_tried = True
+            try:
+                import pdfplumber
+                self._plumber = pdfplumber.open(self.file_path)
+            except Exception as exc:
+                logger.warning("pdfplumber could not open PDF: %s", exc)
+        return self._plumber
+
+    def page_count(self) -> int:
+        if self._reader is not None:
+            return len(self._reader.pages)
+        plumber = self._open_plumber()
+        if plumber is not None:
+            return len(plumber.pages)
+        from .ocr import pdf_page_count
+        return pdf_page_count(self.file_path)
+
+    def page_text(self, index: int) -> tuple[str, str]:
+        """Text of one page and the library that produced it ('' if the page looks scanned)."""
+        text = ''
+        if self._reader is not None:
+            try:
+                text = self._reader.pages[index].extract_text() or ''
+            except Exception as exc:
+                logger.warning("PyPDF2 failed on page %d: %s", index + 1, exc)
+            if len(text.strip()) >= MIN_PAGE_TEXT_CHARS:
+                return text, "pypdf2"
 
-            # Extract text from result
-            if result and result[0]:
-                page_text = ' '.join([line[1][0] for line in result[0]])
-                text_parts.append(page_text)
+        plumber = self._open_plumber()
+        if plumber is not None:
+            try:
+                plumber_text = plumber.pages[index].extract_text() or ''
+                if len(plumber_text.strip()) >= MIN_PAGE_TEXT_CHARS:
+                    return plumber_text, "pdfplumber"
+                if len(plumber_text.strip()) > len(text.strip()):
+                    text = plumber_text
+            except Exception as exc:
+                logger.warning("pdfplumber failed on page %d: %s", index + 1, exc)
+        return text, ''
 
-            # Clean up temp file
-            Path(tmp_path).unlink()
+    def close(self) -> None:
+        if self._plumber is not None:
+            self._plumber.close()
+        if self._handle is not None:
+            self._handle.close()
 
-        if text_parts:
-            extracted = '\n\n'.join(text_parts)
-            # Remove null bytes which PostgreSQL doesn't allow
-            extracted = extracted.replace('\x00', '')
-            logger.info("Extracted %d chars from PDF using PaddleOCR", len(extracted))
-            return extracted
 
-    except Exception as exc:
-        logger.warning("PaddleOCR extraction failed: %s", exc)
+def iter_pdf_pages(file_path: str, char_budget: Optional[int] = None):
+    """
+    Extract a PDF one page at a time.
+
+    Each page uses its text layer (PyPDF2, then pdfplumber) when it has one and
+    is OCRed otherwise, so mixed scanned/text PDFs are handled in a single pass.
+    Scanned pages are rasterized once and that image is shared by PaddleOCR and
+    Tesseract. Extraction stops as soon as char_budget characters were produced.
+
+    Args:
+        file_path: Path to the PDF file
+        char_budget: Stop after this many characters (None = whole document)
+
+    Yields:
+        (page_number, text, method) in page order
+    """
+    from .ocr import ocr_available, ordered_pages
 
-    # Method 4: Try Tesseract OCR as final fallback
+    layer = _TextLayer(file_path)
+    pages = None
     try:
-        from pdf2image import convert_from_path
-        import pytesseract
-        from PIL import Image
+        page_count = layer.page_count()
+        can_ocr = ocr_available()
+        methods: dict[int, str] = {}
+
+        def jobs():
+            for index in range(page_count):
+                text, method = layer.page_text(index)
+                if method or not can_ocr:
+                    methods[index + 1] = method
+                    yield index + 1, text
+                else:
+                    yield index + 1, None
+
+        produced = 0
+        pages = ordered_pages(jobs(), file_path)
+        for page_number, text, ocred in pages:
+            yield page_number, text, "ocr" if ocred else methods.get(page_number, '')
+            produced += len(text)
+            if char_budget and produced >= char_budget:
+                logger.info(
+                    "Stopped PDF extraction at page %d/%d: %d char budget reached",
+                    page_number, page_count, char_budget,
+                )
+                return
+    finally:
+        if pages is not None:
+            pages.close()
+        layer.close()
+
+
+def extract_text_from_pdf(file_path: str, char_budget: Optional[int] = None) -> str:
+    """
+    Extract text from PDF with OCR fallback, page by page.
 
-        logger.info("Trying Tesseract OCR as fallback...")
+    Each page tries, in order:
+    1. PyPDF2 for its text layer
+    2. pdfplumber for better text extraction
+    3. PaddleOCR for scanned pages
+    4. Tesseract on the same rasterized page as final fallback
 
-        images = convert_from_path(file_path, dpi=200)
-        text_parts = []
+    Args:
+        file_path: Path to the PDF file
+        char_budget: Stop once this many characters were extracted
 
-        for image in images:
-            page_text = pytesseract.image_to_string(image)
-            if page_text and page_text.strip():
-                text_parts.append(page_text)
+    Returns:
+        Extracted text content
+    """
+    return _extract_pdf(file_path, char_budget).text
 
-        if text_parts:
-            extracted = '\n\n'.join(text_parts)
-            # Remove null bytes which PostgreSQL doesn't allow
-            extracted = extracted.replace('\x00', '')
-            logger.info("Extracted %d chars from PDF using Tesseract", len(extracted))
-            return extracted
 
+def _extract_pdf(file_path: str, char_budget: Optional[int] = None) -> ExtractionResult:
+    """PDF extraction behind extract_text_from_pdf(), keeping page offsets."""
+    texts: list[str] = []
+    methods: set[str] = set()
+    try:
+        for _, text, method in iter_pdf_pages(file_path, char_budget):
+            texts.append(text)
+            if method and text.strip():
+                methods.add(method)
     except Exception as exc:
-        logger.warning("Tesseract extraction failed: %s", exc)
+        logger.warning("PDF extraction failed: %s", exc)
 
-    logger.error("All PDF extraction methods failed for: %s", file_path)
-    return ""
+    result = _join_pages(texts, "+".join(sorted(methods)))
+    result.complete = not (char_budget and len(result.text) >= char_budget)
+    if result.text:
+        logger.info("Extracted %d chars from %d PDF pages (%s)", len(result.text), len(texts), result.method)
+    else:
+        logger.error("All PDF extraction methods failed for: %s", file_path)
+    return result
 
 
 def extract_text_from_image(file_path: str) -> str:
@@ -152,13 +344,13 @@ def extract_text_from_image(file_path: str) -> str:
     """
     # Method 1: Try PaddleOCR (more accurate)
     try:
-        from paddleocr import PaddleOCR
+        import paddleocr  # noqa: F401
+
+        from .ocr import get_ocr_pool
 
-        ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
-        result = ocr.ocr(file_path, cls=True)
+        text = get_ocr_pool().ocr(file_path)
 
-        if result and result[0]:
-            text = ' '.join([line[1][0] for line in result[0]])
+        if text:
             # Remove null bytes which PostgreSQL doesn't allow
             text = text.replace('\x00', '')
             logger.info("Extracted %d chars from image using PaddleOCR", len(text))
@@ -188,80 +380,358 @@ def extract_text_from_image(file_path: str) -> str:
     return ""
 
 
-def extract_text_from_file(file_path: str, mime_type: Optional[str] = None) -> str:
+def _extraction_kind(path: Path, mime_type: Optional[str]) -> str:
+    """Extractor from the file name/MIME type alone (used when sniffing is not possible)."""
+    ext = path.suffix.lower()
+    if ext == '.pdf' or (mime_type and 'pdf' in mime_type.lower()):
+        return "pdf"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext == '.docx':
+        return "docx"
+    if ext in ('.html', '.htm'):
+        return "html"
+    if ext in TEXT_EXTENSIONS or (mime_type and 'text' in mime_type.lower()):
+        return "text"
+    return "unsupported"
+
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Read size for streamed text/HTML extraction
+TEXT_CHUNK_BYTES = 64 * 1024
+
+
+def _extract_docx(file_path: str, max_chars: Optional[int] = None) -> ExtractionResult:
+    """Stream paragraphs out of word/document.xml without building the whole tree."""
+    paragraphs: list[str] = []
+    total = 0
+    complete = True
+    try:
+        with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+            runs: list[str] = []
+            for _, elem in ElementTree.iterparse(xml, events=('end',)):
+                tag = elem.tag
+                if tag == _W + 't':
+                    runs.append(elem.text or '')
+                elif tag == _W + 'tab':
+                    runs.append('\t')
+                elif tag in (_W + 'br', _W + 'cr'):
+                    runs.append('\n')
+                elif tag == _W + 'p':
+                    # Remove null bytes which PostgreSQL doesn't allow
+                    paragraph = ''.join(runs).replace('\x00', '')
+                    runs = []
+                    elem.clear()  # Drop the finished paragraph's subtree
+                    if paragraph.strip():
+                        paragraphs.append(paragraph)
+                        total += len(paragraph) + 2
+                        if max_chars and total >= max_chars:
+                            complete = False
+                            break
+    except Exception as exc:
+        logger.warning("DOCX extraction failed: %s", exc)
+        return ExtractionResult(text="")
+
+    text = '\n\n'.join(paragraphs)
+    logger.info("Extracted %d chars from DOCX", len(text))
+    return ExtractionResult(text=text, page_offsets=[0], method="docx-stream", complete=complete)
+
+
+def _iter_decoded(path: Path, encoding: Optional[str]):
+    """Decode a file in TEXT_CHUNK_BYTES pieces; undecodable bytes become U+FFFD."""
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(TEXT_CHUNK_BYTES), b''):
+            piece = decoder.decode(block)
+            if piece:
+                yield piece
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _extract_plain_text(
+    path: Path,
+    encoding: Optional[str] = None,
+    max_chars: Optional[int] = None,
+) -> ExtractionResult:
+    encoding = encoding or 'utf-8'
+    parts: list[str] = []
+    total = 0
+    complete = True
+    try:
+        # Single pass with the sniffed encoding, reading no further than the budget
+        for piece in _iter_decoded(path, encoding):
+            # Remove null bytes which PostgreSQL doesn't allow
+            piece = piece.replace('\x00', '')
+            parts.append(piece)
+            total += len(piece)
+            if max_chars and total >= max_chars:
+                complete = False
+                break
+    except Exception as exc:
+        logger.error("Text file reading failed: %s", exc)
+        return ExtractionResult(text="")
+
+    text = ''.join(parts)
+    if max_chars:
+        text = text[:max_chars]
+    logger.info("Extracted %d chars from text file (%s)", len(text), encoding)
+    return ExtractionResult(text=text, page_offsets=[0], method=encoding, complete=complete)
+
+
+_HTML_SKIP_TAGS = frozenset({'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'object'})
+_HTML_BLOCK_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'title', 'tr', 'ul',
+})
+
+
+class _HTMLTextParser(HTMLParser):
+    """Incremental HTML-to-text: drops markup and script/style bodies, one line per block."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._line: list[str] = []
+        self.blocks: list[str] = []
+        self.chars = 0
+
+    def _end_block(self) -> None:
+        line = ' '.join(''.join(self._line).split())
+        self._line = []
+        if line:
+            self.blocks.append(line)
+            self.chars += len(line) + 2
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _HTML_BLOCK_TAGS:
+            self._end_block()
+
+    def handle_endtag(self, tag):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _HTML_BLOCK_TAGS:
+            self._end_block()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._line.append(data)
+
+    def close(self):
+        super().close()
+        self._end_block()
+
+
+def _extract_html(
+    path: Path,
+    encoding: Optional[str] = None,
+    max_chars: Optional[int] = None,
+) -> ExtractionResult:
+    parser = _HTMLTextParser()
+    complete = True
+    try:
+        for piece in _iter_decoded(path, encoding):
+            parser.feed(piece.replace('\x00', ''))
+            if max_chars and parser.chars >= max_chars:
+                complete = False
+                break
+        parser.close()
+    except Exception as exc:
+        logger.error("HTML extraction failed: %s", exc)
+        return ExtractionResult(text="")
+
+    text = '\n\n'.join(parser.blocks)
+    if max_chars:
+        text = text[:max_chars]
+    logger.info("Extracted %d chars of text from HTML", len(text))
+    return ExtractionResult(text=text, page_offsets=[0], method="html", complete=complete)
+
+
+def _run_extractor(
+    kind: str,
+    path: Path,
+    max_chars: Optional[int],
+    encoding: Optional[str] = None,
+) -> ExtractionResult:
+    if kind == "pdf":
+        return _extract_pdf(str(path), max_chars)
+    if kind == "image":
+        text = extract_text_from_image(str(path))
+        return ExtractionResult(text=text, page_offsets=[0], method="ocr")
+    if kind == "docx":
+        return _extract_docx(str(path), max_chars)
+    if kind == "html":
+        return _extract_html(path, encoding, max_chars)
+    return _extract_plain_text(path, encoding, max_chars)
+
+
+def extract_document(
+    file_path: str,
+    mime_type: Optional[str] = None,
+    max_chars: Optional[int] = None,
+    sniffed: Optional[SniffResult] = None,
+) -> ExtractionResult:
     """
-    Extract text from any supported file type.
+    Extract text and page offsets from a file, consulting the extraction cache first.
 
-    Supports:
-    - Plain text (.txt, .md, .csv, .json, .xml, .html, .py, .js, etc.)
-    - PDFs (.pdf) with OCR fallback
-    - Images (.png, .jpg, .jpeg, .tiff, .bmp) with OCR
-    - Word documents (.docx) - future enhancement
+    PDF, image and DOCX results are cached by sha256 of the file bytes and
+    EXTRACTOR_VERSION (see app.extraction_cache), so re-indexing or previewing
+    an unchanged file skips PyPDF2/pdfplumber/OCR entirely. Empty results are
+    not cached, so installing a missing OCR backend takes effect immediately.
+    On a cache miss they are extracted in a sandbox worker process with a
+    timeout and memory cap (see app.extraction_sandbox); content that keeps
+    failing is recorded and skipped.
 
     Args:
         file_path: Path to the file
         mime_type: Optional MIME type hint
+        max_chars: Character budget; PDF extraction stops once it is reached
+        sniffed: Previously detected type/encoding (sniffed from the content if omitted)
 
     Returns:
-        Extracted text content
+        ExtractionResult (text is empty if nothing could be extracted)
     """
     path = Path(file_path)
 
     if not path.exists():
         logger.error("File not found: %s", file_path)
-        return ""
-
-    # Get file extension
-    ext = path.suffix.lower()
+        return ExtractionResult(text="")
 
-    # PDF files
-    if ext == '.pdf' or (mime_type and 'pdf' in mime_type.lower()):
-        return extract_text_from_pdf(file_path)
+    if sniffed is None:
+        try:
+            sniffed = sniff_file(file_path)
+        except OSError as exc:
+            logger.warning("Could not sniff %s, routing by name: %s", file_path, exc)
+            sniffed = SniffResult(_extraction_kind(path, mime_type))
+    kind = sniffed.kind
+    if kind == "unsupported":
+        logger.warning(
+            "Unsupported file type: %s (ext=%s, mime=%s)", file_path, path.suffix.lower(), mime_type
+        )
+        return ExtractionResult(text="")
+
+    if kind not in CACHED_KINDS:
+        return _run_extractor(kind, path, max_chars, sniffed.encoding)
+    return _extract_heavy(kind, path, max_chars)
+
+
+def _cached_pages(result: ExtractionResult) -> list[str]:
+    """Split a joined result back into its page texts (empty pages included), undoing _join_pages()."""
+    offsets = result.page_offsets or [0]
+    pages = []
+    for index, start in enumerate(offsets):
+        if index + 1 < len(offsets):
+            following = offsets[index + 1]
+            pages.append(result.text[start:following - 2] if following > start else "")
+        else:
+            pages.append(result.text[start:])
+    return pages
+
+
+def _limit_to_budget(kind: str, result: ExtractionResult, max_chars: Optional[int]) -> ExtractionResult:
+    """
+    Cut a cached result where the extractor would have stopped for ``max_chars``.
 
-    # Image files
-    if ext in ('.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif'):
-        return extract_text_from_image(file_path)
+    PDFs keep whole pages up to and including the one that reaches the
+    budget, DOCX whole paragraphs; images are never cut.
+    """
+    if not max_chars or kind == "image":
+        return result
+    if kind == "pdf":
+        if len(result.text) < max_chars:
+            return result
+        kept: list[str] = []
+        produced = 0
+        for page in _cached_pages(result):
+            kept.append(page)
+            produced += len(page)
+            if produced >= max_chars:
+                break
+        limited = _join_pages(kept, result.method)
+        limited.complete = len(limited.text) < max_chars
+        return limited
+    # DOCX: extraction stops after the paragraph that brings text plus separators to the budget
+    if len(result.text) + 2 < max_chars:
+        return result
+    cut = result.text.find('\n\n', max(0, max_chars - 2))
+    text = result.text if cut == -1 else result.text[:cut]
+    return ExtractionResult(text=text, page_offsets=[0], method=result.method, complete=False)
+
+
+def _extract_heavy(kind: str, path: Path, max_chars: Optional[int]) -> ExtractionResult:
+    """Cache lookup, then extraction in a sandbox worker (in-process when the sandbox is off)."""
+    from .extraction_cache import file_digest, get_extraction_cache
+    from .extraction_sandbox import ExtractionError, get_extraction_sandbox, is_poisoned, record_failure
+    from .metrics import record_cache
 
-    # Word documents (DOCX)
-    if ext == '.docx':
+    try:
+        digest = file_digest(path)
+    except OSError as exc:
+        logger.warning("Could not hash %s: %s", path, exc)
+        digest = None
+
+    cache = get_extraction_cache() if digest else None
+    cache_key = cache.key(digest, kind) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None and not cached.complete and (
+            not max_chars or len(cached.text) < max_chars
+        ):
+            # Cut short for a smaller budget than this caller needs
+            cached = None
+        record_cache("extraction", cached is not None)
+        if cached is not None:
+            logger.info("Extraction cache hit for %s (%d chars)", path.name, len(cached.text))
+            return _limit_to_budget(kind, cached, max_chars)
+
+    sandbox = get_extraction_sandbox()
+    if sandbox is None:
+        result = _run_extractor(kind, path, max_chars)
+    else:
+        if digest and is_poisoned(digest):
+            logger.warning("Skipping %s: its content failed extraction repeatedly", path.name)
+            return ExtractionResult(text="")
         try:
-            from docx import Document
-            doc = Document(file_path)
-            text = '\n\n'.join([para.text for para in doc.paragraphs if para.text])
-            # Remove null bytes which PostgreSQL doesn't allow
-            text = text.replace('\x00', '')
-            logger.info("Extracted %d chars from DOCX", len(text))
-            return text
-        except Exception as exc:
-            logger.warning("DOCX extraction failed: %s", exc)
-            return ""
+            result = sandbox.extract(kind, str(path), max_chars)
+        except ExtractionError as exc:
+            logger.error("Extraction of %s failed: %s", path.name, exc)
+            if digest:
+                record_failure(digest, kind, str(path), str(exc))
+            return ExtractionResult(text="")
+
+    if cache is not None and result.text:
+        cache.put(cache_key, result)
+    return result
+
+
+def extract_text_from_file(
+    file_path: str,
+    mime_type: Optional[str] = None,
+    max_chars: Optional[int] = None,
+    sniffed: Optional[SniffResult] = None,
+) -> str:
+    """
+    Extract text from any supported file type.
 
-    # Plain text files
-    text_extensions = (
-        '.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm',
-        '.py', '.js', '.ts', '.jsx', '.tsx', '.css', '.scss',
-        '.yaml', '.yml', '.ini', '.conf', '.log', '.sql', '.sh'
-    )
+    Supports:
+    - Plain text (.txt, .md, .csv, .json, .xml, .py, .js, etc.), read in chunks
+    - HTML (.html, .htm), markup and scripts stripped
+    - PDFs (.pdf) with OCR fallback
+    - Images (.png, .jpg, .jpeg, .tiff, .bmp) with OCR
+    - Word documents (.docx), streamed from word/document.xml
 
-    if ext in text_extensions or (mime_type and 'text' in mime_type.lower()):
-        try:
-            # Try UTF-8 first
-            text = path.read_text(encoding='utf-8')
-            # Remove null bytes which PostgreSQL doesn't allow
-            text = text.replace('\x00', '')
-            logger.info("Extracted %d chars from text file", len(text))
-            return text
-        except UnicodeDecodeError:
-            # Fallback to latin-1
-            try:
-                text = path.read_text(encoding='latin-1')
-                # Remove null bytes which PostgreSQL doesn't allow
-                text = text.replace('\x00', '')
-                logger.info("Extracted %d chars from text file (latin-1)", len(text))
-                return text
-            except Exception as exc:
-                logger.error("Text file reading failed: %s", exc)
-                return ""
+    Args:
+        file_path: Path to the file
+        mime_type: Optional MIME type hint
+        max_chars: Character budget (PDF extraction stops early once reached)
+        sniffed: Previously detected type/encoding (sniffed from the content if omitted)
 
-    logger.warning("Unsupported file type: %s (ext=%s, mime=%s)", file_path, ext, mime_type)
-    return ""
+    Returns:
+        Extracted text content
+    """
+    return extract_document(file_path, mime_type, max_chars, sniffed).text
@@ -3,25 +3,16 @@ from __future__ import annotations
 
 import json
 import logging
-import os
+import re
+from collections import Counter
 from typing import Optional
 
-logger = logging.getLogger(__name__)
-
-# OpenAI client (lazy loaded)
-_openai_client = None
+from .providers import get_openai_provider
 
+logger = logging.getLogger(__name__)
 
-def _get_openai_client():
-    """Get or create OpenAI client (lazy initialization)."""
-    global _openai_client
-    if _openai_client is None:
-        import openai
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable not set")
-        _openai_client = openai.OpenAI(api_key=api_key)
-    return _openai_client
+# Output size of text-embedding-3-small
+EMBEDDING_DIMENSIONS = 1536
 
 
 def generate_embedding(text: str) -> list[float]:
@@ -38,10 +29,8 @@ def generate_embedding(text: str) -> list[float]:
         Exception: If embedding generation fails
     """
     try:
-        client = _get_openai_client()
-
         # Use OpenAI's text-embedding-3-small model (fast and cheap)
-        response = client.embeddings.create(
+        response = get_openai_provider().embed(
             model="text-embedding-3-small",
             input=text,
             encoding_format="float"
@@ -96,32 +85,73 @@ def chunk_text(text: str, chunk_size: int = 512, overlap: int = 128) -> list[str
     return chunks
 
 
-def embed_document(content: str, chunk_size: int = 512, overlap: int = 128) -> list[tuple[str, list[float]]]:
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_WORD = re.compile(r"[a-z][a-z0-9']{2,}")
+_STOPWORDS = frozenset(
+    "the and for that with this from are was were have has had not but you your they them their "
+    "its into about which when where what who will would can could should there here than then "
+    "also been being each other some such only over more most very our out all any".split()
+)
+
+# How far into the document sentences are scanned when summarising large files
+SUMMARY_SCAN_CHARS = 200_000
+
+
+def summarize_text(text: str, max_chars: int = 600) -> str:
     """
-    Embed a document by chunking and generating embeddings for each chunk.
+    Build a short extractive summary of a document.
+
+    Sentences are scored by how many of the document's frequent terms they
+    contain (with a small bonus for the opening sentences) and the best ones are
+    returned in their original order until max_chars is reached.
 
     Args:
-        content: The document content
-        chunk_size: Maximum size of each chunk
-        overlap: Overlap between chunks
+        text: Full document text
+        max_chars: Maximum summary length in characters
 
     Returns:
-        List of (chunk_text, embedding_vector) tuples
+        Summary text (empty if the document has no usable sentences)
     """
-    chunks = chunk_text(content, chunk_size, overlap)
-    logger.info("Split document into %d chunks", len(chunks))
-
-    results = []
-    for i, chunk in enumerate(chunks):
-        try:
-            embedding = generate_embedding(chunk)
-            results.append((chunk, embedding))
-            logger.debug("Embedded chunk %d/%d", i + 1, len(chunks))
-        except Exception as exc:
-            logger.error("Failed to embed chunk %d: %s", i, exc)
-            # Continue with other chunks even if one fails
-
-    return results
+    sentences = [
+        " ".join(sentence.split())
+        for sentence in _SENTENCE_SPLIT.split(text[:SUMMARY_SCAN_CHARS])
+    ]
+    sentences = [sentence for sentence in sentences if len(sentence) >= 20]
+    if not sentences:
+        return " ".join(text.split())[:max_chars]
+
+    frequencies = Counter(
+        word
+        for sentence in sentences
+        for word in _WORD.findall(sentence.lower())
+        if word not in _STOPWORDS
+    )
+    if not frequencies:
+        return " ".join(sentences)[:max_chars]
+    top_frequency = frequencies.most_common(1)[0][1]
+
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = [word for word in _WORD.findall(sentence.lower()) if word not in _STOPWORDS]
+        if not words:
+            continue
+        score = sum(frequencies[word] for word in set(words)) / (top_frequency * len(words) ** 0.5)
+        if position < 3:
+            score *= 1.5 - position * 0.15
+        scored.append((score, position))
+
+    chosen: list[int] = []
+    length = 0
+    for _, position in sorted(scored, key=lambda item: (-item[0], item[1])):
+        sentence_length = len(sentences[position]) + 1
+        if length + sentence_length > max_chars:
+            if not chosen:
+                chosen.append(position)
+            continue
+        chosen.append(position)
+        length += sentence_length
+
+    return " ".join(sentences[position] for position in sorted(chosen))[:max_chars]
 
 
 def cosine_similarity(vec1: list[float], vec2: list[float]) -> float:
@@ -145,3 +175,74 @@ def cosine_similarity(vec1: list[float], vec2: list[float]) -> float:
         return 0.0
 
     return dot_product / (magnitude1 * magnitude2)
+
+
+def _normalise(vector: list[float]) -> list[float]:
+    import math
+
+    magnitude = math.sqrt(sum(v * v for v in vector))
+    if magnitude == 0:
+        return vector
+    return [v / magnitude for v in vector]
+
+
+def truncate_embedding(embedding: list[float], dimensions: int) -> list[float]:
+    """
+    Matryoshka-style reduction: keep the leading dimensions and re-normalise.
+
+    text-embedding-3 models are trained so that prefixes of the vector remain
+    meaningful embeddings on their own.
+
+    Args:
+        embedding: Full embedding vector
+        dimensions: Number of leading dimensions to keep
+
+    Returns:
+        Unit-length vector of the requested size
+    """
+    return _normalise(list(embedding[:dimensions]))
+
+
+def pca_project(embedding: list[float], mean: list[float], components: list[list[float]]) -> list[float]:
+    """
+    Project an embedding onto fitted principal components.
+
+    Args:
+        embedding: Full embedding vector
+        mean: Per-dimension mean of the fitting sample
+        components: Principal axes (one row per output dimension)
+
+    Returns:
+        Unit-length projected vector
+    """
+    centred = [value - offset for value, offset in zip(embedding, mean)]
+    projected = [sum(a * b for a, b in zip(axis, centred)) for axis in components]
+    return _normalise(projected)
+
+
+def fit_pca(vectors: list[list[float]], dimensions: int) -> tuple[list[float], list[list[float]]]:
+    """
+    Fit a PCA projection to a sample of embeddings.
+
+    Args:
+        vectors: Sample of full embedding vectors (needs more rows than dimensions)
+        dimensions: Number of principal components to keep
+
+    Returns:
+        Tuple of (mean, components)
+
+    Raises:
+        ImportError: If numpy is not installed
+        ValueError: If the sample is too small for the requested dimensions
+    """
+    import numpy as np
+
+    if len(vectors) <= dimensions:
+        raise ValueError(
+            f"PCA to {dimensions} dims needs more than {dimensions} sample vectors (got {len(vectors)})"
+        )
+    matrix = np.asarray(vectors, dtype=np.float64)
+    mean = matrix.mean(axis=0)
+    # Rows of vt are the principal axes ordered by explained variance
+    _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    return mean.tolist(), vt[:dimensions].tolist()
@@ -0,0 +1,148 @@
+"""On-disk cache of extracted document text, keyed by content hash and extractor version."""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from .document_extractor import EXTRACTOR_VERSION, ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+# (path, size, mtime_ns) -> sha256, so unchanged files are not re-hashed on every read
+_digest_memo: dict[tuple[str, int, int], str] = {}
+_digest_lock = Lock()
+_DIGEST_MEMO_SIZE = 4096
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of a file's bytes (memoised on path, size and mtime)."""
+    stat = path.stat()
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        cached = _digest_memo.get(memo_key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+
+    with _digest_lock:
+        if len(_digest_memo) >= _DIGEST_MEMO_SIZE:
+            _digest_memo.clear()
+        _digest_memo[memo_key] = value
+    return value
+
+
+class ExtractionCache:
+    """
+    Directory of zlib-compressed JSON entries, one per (content hash, kind, extractor version).
+
+    A changed file hashes differently and an extractor change bumps
+    EXTRACTOR_VERSION, so stale entries are never read; they are simply left
+    behind for prune() to remove, along with the least recently used entries
+    once the directory grows past ``max_bytes`` (0 = unlimited).
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 0):
+        self.root = Path(root)
+        self.max_bytes = max(0, max_bytes)
+
+    def key(self, digest: str, kind: str) -> str:
+        return f"{digest}-{kind}-v{EXTRACTOR_VERSION}"
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json.z"
+
+    def get(self, key: str) -> Optional[ExtractionResult]:
+        path = self._path(key)
+        try:
+            payload = json.loads(zlib.decompress(path.read_bytes()).decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as exc:
+            logger.warning("Discarding unreadable extraction cache entry %s: %s", path.name, exc)
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            # Mark it recently used so prune() evicts colder entries first
+            os.utime(path)
+        except OSError:
+            pass
+        return ExtractionResult(
+            text=payload.get("text", ""),
+            page_offsets=payload.get("page_offsets", []),
+            method=payload.get("method", ""),
+            complete=payload.get("complete", True),
+        )
+
+    def put(self, key: str, result: ExtractionResult) -> None:
+        path = self._path(key)
+        payload = json.dumps({
+            "version": EXTRACTOR_VERSION,
+            "method": result.method,
+            "page_offsets": result.page_offsets,
+            "complete": result.complete,
+            "text": result.text,
+        }).encode("utf-8")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial entry
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(zlib.compress(payload, 6))
+            os.replace(tmp_name, path)
+        except OSError as exc:
+            logger.warning("Could not write extraction cache entry %s: %s", path.name, exc)
+
+    def prune(self) -> int:
+        """
+        Delete entries from older extractor versions, then the least recently
+        used ones until the cache fits in ``max_bytes``; returns the number removed.
+        """
+        removed = 0
+        suffix = f"-v{EXTRACTOR_VERSION}.json.z"
+        entries = []
+        for path in self.root.glob("*/*.json.z"):
+            if not path.name.endswith(suffix):
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes and total > self.max_bytes:
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+        return removed
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Cache for the current app, or None when disabled or outside an app context."""
+    from flask import current_app, has_app_context
+
+    if not has_app_context() or not current_app.config.get("EXTRACTION_CACHE_ENABLED", True):
+        return None
+    root = current_app.config.get("EXTRACTION_CACHE_DIR") or os.path.join(
+        current_app.config.get("STORAGE_ROOT", "storage"), ".extraction_cache"
+    )
+    return ExtractionCache(Path(root), max_bytes=current_app.config.get("EXTRACTION_CACHE_MAX_MB", 0) * 1024 * 1024)
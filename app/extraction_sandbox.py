@@ -0,0 +1,265 @@
+"""Subprocess workers that run document extraction with timeouts and memory caps."""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import signal
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from .document_extractor import ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+# How often an idle worker checks that the process that started it is still alive
+_PARENT_POLL_SECONDS = 2.0
+
+
+class ExtractionError(Exception):
+    """Extraction failed inside a sandbox worker."""
+
+
+class ExtractionTimeout(ExtractionError):
+    """The worker exceeded its wall-clock budget and was killed."""
+
+
+class ExtractionCrashed(ExtractionError):
+    """The worker died (e.g. hit its memory cap) while extracting."""
+
+
+def _worker_main(conn, memory_limit_bytes: int, ocr_settings: dict) -> None:
+    """Worker loop: receive (kind, path, max_chars) jobs and send back results."""
+    parent_pid = os.getppid()
+    # Own process group, so a kill also takes down any OCR page workers we spawn
+    try:
+        os.setsid()
+    except OSError:
+        pass
+    if memory_limit_bytes:
+        try:
+            import resource
+
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+        except (ImportError, ValueError, OSError) as exc:
+            logger.warning("Could not cap extraction worker memory: %s", exc)
+
+    from .document_extractor import _run_extractor
+    from .ocr import configure_ocr_pool, warm_ocr_pool_async
+
+    warmup = ocr_settings.pop("warmup", False)
+    configure_ocr_pool(**ocr_settings)
+    if warmup:
+        warm_ocr_pool_async()
+
+    while True:
+        try:
+            if not conn.poll(_PARENT_POLL_SECONDS):
+                # Reparented: the sandbox's process died without stopping us
+                if os.getppid() != parent_pid:
+                    return
+                continue
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        kind, path, max_chars = job
+        try:
+            conn.send(("ok", _run_extractor(kind, Path(path), max_chars)))
+        except MemoryError:
+            conn.send(("error", "memory limit exceeded"))
+        except Exception as exc:
+            conn.send(("error", f"{type(exc).__name__}: {exc}"))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_bytes: int, ocr_settings: dict):
+        parent_conn, child_conn = context.Pipe()
+        # Not a daemon: daemonic processes may not start the OCR page pool
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_bytes, ocr_settings),
+            name="extraction-worker",
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def run(self, kind: str, path: str, max_chars: Optional[int], timeout: float) -> ExtractionResult:
+        try:
+            self.conn.send((kind, path, max_chars))
+            if not self.conn.poll(timeout):
+                raise ExtractionTimeout(f"extraction exceeded {timeout:g}s")
+            status, payload = self.conn.recv()
+        except (EOFError, OSError) as exc:
+            raise ExtractionCrashed(f"extraction worker died: {exc or 'connection closed'}") from None
+        if status != "ok":
+            raise ExtractionError(payload)
+        return payload
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (OSError, AttributeError):
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ExtractionSandbox:
+    """
+    Pool of persistent extraction worker processes.
+
+    Each worker runs under an RLIMIT_AS cap in its own process group. A job
+    that runs past the timeout gets its worker (and that worker's OCR page
+    processes) killed, and a fresh worker is started for the next job. Web
+    workers therefore only ever wait; they never run PyPDF2, pdfplumber or OCR
+    themselves.
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 120.0, memory_mb: int = 0, ocr_settings: Optional[dict] = None):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.memory_limit_bytes = max(0, memory_mb) * 1024 * 1024
+        self.ocr_settings = {"size": 1, "recycle_pages": 500, "workers": 1, **(ocr_settings or {})}
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.LifoQueue[_Worker]" = queue.LifoQueue()
+        self._workers: set[_Worker] = set()
+        self._lock = Lock()
+        self.restarts = 0
+        # Runs before multiprocessing joins its non-daemon children at interpreter
+        # exit (a plain atexit handler would run after that join and never be reached)
+        multiprocessing.util.Finalize(self, _stop_workers, args=(self._workers, self._lock), exitpriority=10)
+
+    def start(self) -> None:
+        """Start every worker now rather than on first use (they warm OCR if configured to)."""
+        with self._lock:
+            while len(self._workers) < self.size:
+                worker = _Worker(self._context, self.memory_limit_bytes, self.ocr_settings)
+                self._workers.add(worker)
+                self._idle.put(worker)
+
+    def _acquire(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = len(self._workers) < self.size
+            if create:
+                worker = _Worker(self._context, self.memory_limit_bytes, self.ocr_settings)
+                self._workers.add(worker)
+                return worker
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ExtractionTimeout("no extraction worker became available") from None
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+            self.restarts += 1
+
+    def extract(self, kind: str, path: str, max_chars: Optional[int] = None) -> ExtractionResult:
+        """Run one extraction in a worker; raises ExtractionError subclasses on failure."""
+        worker = self._acquire()
+        try:
+            result = worker.run(kind, path, max_chars, self.timeout)
+        except (ExtractionTimeout, ExtractionCrashed) as exc:
+            logger.error("Extraction worker killed while reading %s: %s", path, exc)
+            self._discard(worker)
+            raise
+        except BaseException:
+            self._idle.put(worker)
+            raise
+        self._idle.put(worker)
+        return result
+
+    def shutdown(self) -> None:
+        _stop_workers(self._workers, self._lock)
+
+
+def _stop_workers(workers: set, lock: Lock) -> None:
+    with lock:
+        stopping = list(workers)
+        workers.clear()
+    for worker in stopping:
+        worker.stop()
+
+
+_sandbox: Optional[ExtractionSandbox] = None
+_sandbox_pid: Optional[int] = None
+_sandbox_lock = Lock()
+
+
+def get_extraction_sandbox() -> Optional[ExtractionSandbox]:
+    """The sandbox configured for the current app, or None when disabled or outside an app context."""
+    global _sandbox, _sandbox_pid
+    from flask import current_app, has_app_context
+
+    if not has_app_context() or not current_app.config.get("EXTRACTION_SANDBOX_ENABLED", True):
+        return None
+    with _sandbox_lock:
+        if _sandbox is None or _sandbox_pid != os.getpid():
+            config = current_app.config
+            _sandbox = ExtractionSandbox(
+                size=config.get("EXTRACTION_WORKERS", 2),
+                timeout=config.get("EXTRACTION_TIMEOUT", 120),
+                memory_mb=config.get("EXTRACTION_MEMORY_MB", 0),
+                ocr_settings={
+                    "size": config.get("OCR_POOL_SIZE", 1),
+                    "recycle_pages": config.get("OCR_RECYCLE_PAGES", 500),
+                    # Page processes would share the worker's RLIMIT_AS cap each; the
+                    # sandbox already runs EXTRACTION_WORKERS extractions side by side
+                    "workers": 1,
+                    "warmup": config.get("OCR_WARMUP", False),
+                },
+            )
+            _sandbox_pid = os.getpid()
+        return _sandbox
+
+
+def is_poisoned(digest: str) -> bool:
+    """Whether these exact bytes already failed extraction too often to retry."""
+    from flask import current_app
+
+    from .models import ExtractionFailure
+
+    failure = ExtractionFailure.query.filter_by(content_sha256=digest).first()
+    return failure is not None and failure.attempts >= current_app.config.get("EXTRACTION_MAX_ATTEMPTS", 2)
+
+
+def record_failure(digest: str, kind: str, path: str, error: str) -> None:
+    """Count a failed extraction of these bytes (new bytes get a new digest and a clean slate)."""
+    from .models import ExtractionFailure, db
+
+    try:
+        failure = ExtractionFailure.query.filter_by(content_sha256=digest).first()
+        if failure is None:
+            failure = ExtractionFailure(content_sha256=digest, kind=kind, attempts=0)
+            db.session.add(failure)
+        failure.attempts += 1
+        failure.error = error[:1000]
+        failure.file_name = os.path.basename(path)[:255]
+        failure.last_failed_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as exc:
+        logger.error("Could not record extraction failure for %s: %s", path, exc)
+        db.session.rollback()
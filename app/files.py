@@ -23,6 +23,7 @@ from werkzeug.utils import secure_filename
 
 from .database import db
 from .models import FileAsset, FileFolder
+from .rag import release_file_index
 
 files_bp = Blueprint("files", __name__, url_prefix="/files")
 
@@ -394,6 +395,8 @@ def upload():
         size=size,
         folder=target_folder,
     )
+    # Route extraction by content, not by the (possibly wrong) upload name
+    asset.sniff_content()
     db.session.add(asset)
     db.session.commit()
     flash("Your file now rests in the shared hollow.", "success")
@@ -538,6 +541,7 @@ def delete(file_id: int):
             current_app.logger.warning("Unable to delete file at %s", file_path)
     _cleanup_empty_dirs(file_path.parent, user_root)
 
+    release_file_index(asset)
     db.session.delete(asset)
     db.session.commit()
     flash("The file has been released back to the earth.", "info")
@@ -1,19 +1,48 @@
 from __future__ import annotations
 
+import codecs
+import hashlib
+import heapq
+import json
 import logging
-from dataclasses import dataclass
+import math
+import os
+import queue
+import random
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Iterable, List, Optional
-from time import perf_counter
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from time import perf_counter, time
+
+from .metrics import current_queue_wait, record_cache, record_inference
 
 logger = logging.getLogger(__name__)
 
 try:
-    from llama_cpp import Llama
+    from llama_cpp import Llama, LogitsProcessorList, StoppingCriteriaList
 except ImportError:  # pragma: no cover - optional dependency
     Llama = None  # type: ignore[misc]  # pragma: no cover
 
+    class LogitsProcessorList(list):  # type: ignore[no-redef]  # pragma: no cover
+        """Same call contract as llama_cpp.LogitsProcessorList."""
+
+        def __call__(self, input_ids, scores):
+            for processor in self:
+                scores = processor(input_ids, scores)
+            return scores
+
+    class StoppingCriteriaList(list):  # type: ignore[no-redef]  # pragma: no cover
+        """Same call contract as llama_cpp.StoppingCriteriaList."""
+
+        def __call__(self, input_ids, logits) -> bool:
+            return any(criterion(input_ids, logits) for criterion in self)
+
 
 class LLMError(RuntimeError):
     """Base exception for local model issues."""
@@ -31,6 +60,90 @@ class InferenceError(LLMError):
     """A model failed while generating output."""
 
 
+class GenerationCancelled(InferenceError):
+    """A generation was stopped by its CancelToken (deadline or caller went away)."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one generation.
+
+    llama.cpp checks the token after every sampled token (as a stopping
+    criterion), and the batch scheduler checks it between decode steps, so a
+    cancelled request stops within one token and releases its replica or
+    sequence. Prompt prefill is a single llama.cpp call and is not interrupted.
+    A token with a ``parent`` is also cancelled when the parent is, which lets
+    one generation in a batch stop without stopping the others.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["CancelToken"] = None):
+        self._event = Event()
+        self.deadline = perf_counter() + timeout if timeout is not None else None
+        self.parent = parent
+        self.reason = ""
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set():
+            if self.parent is not None and self.parent.cancelled:
+                self.cancel(self.parent.reason)
+            elif self.deadline is not None and perf_counter() >= self.deadline:
+                self.cancel("deadline passed")
+        return self._event.is_set()
+
+    def stopping_criteria(self):
+        def check(input_ids, logits) -> bool:
+            return self.cancelled
+
+        return StoppingCriteriaList([check])
+
+
+class _TokenClock:
+    """
+    Logits processor that timestamps decoding for the inference metrics.
+
+    llama.cpp calls it once per sampled token, the first time right after the
+    prompt has been evaluated, which splits a completion into prefill and
+    decode without relying on llama.cpp's own perf counters.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.prompt_tokens = 0
+        self.decode_tokens = 0
+
+    def start(self) -> None:
+        self.started = perf_counter()
+
+    def __call__(self, input_ids, scores):
+        if self.first_token_at is None:
+            self.first_token_at = perf_counter()
+            self.prompt_tokens = len(input_ids)
+        self.decode_tokens += 1
+        return scores
+
+    def record(self, model_name: str, *, queue_wait: float, load_seconds: float) -> None:
+        finished = perf_counter()
+        first = self.first_token_at or finished
+        record_inference(
+            "local",
+            model_name,
+            total_seconds=queue_wait + load_seconds + finished - self.started,
+            queue_wait=queue_wait,
+            load_seconds=load_seconds,
+            prefill_tokens=self.prompt_tokens or None,
+            prefill_seconds=first - self.started,
+            decode_tokens=self.decode_tokens,
+            decode_seconds=finished - first,
+        )
+
+
 @dataclass
 class ModelSettings:
     """Normalised settings for a configured model."""
@@ -45,6 +158,9 @@ class ModelSettings:
     threads: Optional[int] = None
     batch_size: Optional[int] = None
     timeout: Optional[float] = None
+    replicas: int = 1
+    batch_sequences: int = 0
+    prompt_cache_mb: int = 0
 
 
 @dataclass
@@ -54,18 +170,829 @@ class GenerationResult:
     text: str
     usage: Dict[str, Any]
     raw: Dict[str, Any]
+    cached: bool = False
+
+
+class CompletionCache:
+    """
+    LRU of deterministic completions with a TTL and an optional on-disk copy.
+
+    Only requests that must reproduce the same text are cached: temperature 0
+    or an explicit seed. Keys cover the model file (path, size and mtime),
+    the full message list and every sampling option, so changing any of them
+    misses.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, directory: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.directory = Path(directory) if directory else None
+        self._entries: "OrderedDict[str, tuple[float, GenerationResult]]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def cacheable(completion_kwargs: Dict[str, Any]) -> bool:
+        return completion_kwargs.get("temperature") == 0 or completion_kwargs.get("seed") is not None
+
+    @staticmethod
+    def key(settings: ModelSettings, completion_kwargs: Dict[str, Any]) -> str:
+        try:
+            stat = Path(settings.path).stat()
+            fingerprint = f"{settings.path}:{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            fingerprint = settings.path
+        payload = json.dumps(
+            {"model": settings.name, "file": fingerprint, "request": completion_kwargs},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[GenerationResult]:
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning("Discarding unreadable completion cache entry %s: %s", path.name, exc)
+            path.unlink(missing_ok=True)
+            return None
+        if now - payload.get("created", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        result = GenerationResult(
+            text=payload.get("text", ""),
+            usage=payload.get("usage", {}),
+            raw=payload.get("raw", {}),
+            cached=True,
+        )
+        self._remember(key, payload["created"], result)
+        return result
+
+    def _remember(self, key: str, created: float, result: GenerationResult) -> None:
+        with self._lock:
+            self._entries[key] = (created, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key: str, result: GenerationResult) -> None:
+        created = time()
+        self._remember(key, created, replace(result, cached=True))
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump({"created": created, "text": result.text, "usage": result.usage, "raw": result.raw}, handle)
+            os.replace(tmp_name, path)
+        except (OSError, TypeError, ValueError) as exc:
+            logger.warning("Could not write completion cache entry %s: %s", path.name, exc)
+
+
+class _Replica:
+    """One loaded Llama instance; llama-cpp-python objects are not thread-safe."""
+
+    def __init__(self, index: int, llm: Any):
+        self.index = index
+        self.llm = llm
+        self.lock = Lock()
+        self.in_flight = 0
+
+
+class ReplicaPool:
+    """
+    Up to ``size`` independently loaded copies of one model.
+
+    Each lease goes to the replica with the fewest requests in flight. A new
+    replica is only loaded when every existing one is busy, so a quiet model
+    never costs more than one copy of its KV cache and thread budget.
+    """
+
+    def __init__(self, name: str, size: int, threads: Optional[int], loader: Callable[[], Any]):
+        self.name = name
+        self.size = max(1, size)
+        self.threads = threads
+        self._loader = loader
+        self._replicas: List[_Replica] = []
+        self._loading = 0
+        self._ready = Condition()
+        self.last_used = 0.0
+
+    def ensure_loaded(self) -> None:
+        """Load the first replica now so load errors surface before any work is queued."""
+        with self._ready:
+            while not self._replicas:
+                if not self._loading:
+                    self._loading += 1
+                    break
+                self._ready.wait()
+            else:
+                return
+        self._add_replica()
+
+    def _add_replica(self) -> _Replica:
+        try:
+            llm = self._loader()
+        except BaseException:
+            with self._ready:
+                self._loading -= 1
+                self._ready.notify_all()
+            raise
+        with self._ready:
+            self._loading -= 1
+            replica = _Replica(len(self._replicas), llm)
+            self._replicas.append(replica)
+            self._ready.notify_all()
+            return replica
+
+    def _pick(self) -> Optional[_Replica]:
+        """Reserve the least-loaded replica, or None if the caller should load a new one."""
+        with self._ready:
+            while True:
+                idle = min(self._replicas, key=lambda replica: replica.in_flight, default=None)
+                can_grow = len(self._replicas) + self._loading < self.size
+                if idle is not None and (not idle.in_flight or not can_grow):
+                    idle.in_flight += 1
+                    return idle
+                if can_grow:
+                    self._loading += 1
+                    return None
+                # Only the first replica is still loading; wait for it
+                self._ready.wait()
+
+    @contextmanager
+    def lease(self) -> Iterator[Any]:
+        """Hold one replica exclusively for the duration of the block."""
+        self.last_used = time()
+        replica = self._pick()
+        if replica is None:
+            try:
+                replica = self._add_replica()
+                logger.info(
+                    "Loaded replica %d/%d of model '%s'", replica.index + 1, self.size, self.name
+                )
+            except Exception:  # pylint: disable=broad-except
+                # Serve from an existing copy rather than failing the request
+                with self._ready:
+                    if not self._replicas:
+                        raise
+                    replica = min(self._replicas, key=lambda candidate: candidate.in_flight)
+                    replica.in_flight += 1
+                logger.exception("Could not load an extra replica of model '%s'", self.name)
+            else:
+                with self._ready:
+                    replica.in_flight += 1
+        try:
+            with replica.lock:
+                yield replica.llm
+        finally:
+            with self._ready:
+                replica.in_flight -= 1
+
+    @property
+    def loaded(self) -> int:
+        return len(self._replicas)
+
+    def vocabulary(self) -> Optional[Any]:
+        """A loaded copy for read-only vocabulary use such as tokenizing (no lease needed), or None."""
+        with self._ready:
+            return self._replicas[0].llm if self._replicas else None
+
+    @property
+    def state(self) -> str:
+        if self._replicas:
+            return "loaded"
+        return "loading" if self._loading else "unloaded"
+
+    def unload(self) -> int:
+        """Drop every replica if none is busy or loading; returns how many were freed."""
+        with self._ready:
+            if self._loading or any(replica.in_flight for replica in self._replicas):
+                return 0
+            replicas, self._replicas = self._replicas, []
+        for replica in replicas:
+            close = getattr(replica.llm, "close", None)
+            if close is not None:
+                close()
+        return len(replicas)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._ready:
+            return {
+                "replicas": self.size,
+                "loaded": len(self._replicas),
+                "threads_per_replica": self.threads,
+                "in_flight": [replica.in_flight for replica in self._replicas],
+            }
+
+
+_FINISHED = object()
+# How long a consumer waits past its cancellation for the scheduler to retire the request
+_CANCEL_GRACE_SECONDS = 5.0
+
+
+class BatchEngine(ABC):
+    """
+    Step-level interface the BatchScheduler drives.
+
+    ``decode`` receives ``(seq_id, tokens, want_logits)`` entries that are
+    evaluated together in one llama.cpp batch and returns next-token logits
+    for every entry that asked for them.
+    """
+
+    n_batch = 512
+
+    @abstractmethod
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> List[int]:
+        """Tokenize a chat prompt the way the model's chat template lays it out."""
+
+    @abstractmethod
+    def decode(self, entries: List[tuple[int, List[int], bool]]) -> Dict[int, Any]:
+        """Evaluate one batch; returns logits by sequence for the entries that want them."""
+
+    def reuse_prefix(self, seq_id: int, tokens: List[int]) -> int:
+        """Seed a new sequence from cached KV state; returns how many prompt tokens it covers."""
+        return 0
+
+    @abstractmethod
+    def sample(self, logits: Any, temperature: float, top_p: float) -> int:
+        """Pick the next token from one logits row."""
+
+    @abstractmethod
+    def is_eog(self, token: int) -> bool:
+        """Whether ``token`` ends generation."""
+
+    @abstractmethod
+    def token_bytes(self, token: int) -> bytes:
+        """UTF-8 bytes of one token (possibly part of a character)."""
+
+    @abstractmethod
+    def release(self, seq_id: int) -> None:
+        """Free a sequence's KV cache so the slot can be reused."""
+
+
+def _llama_fn(*names: str):
+    """First llama_cpp binding that exists; names moved between llama-cpp-python releases."""
+    import llama_cpp
+
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return fn
+    raise ModelLoadError(f"llama_cpp lacks {names[0]}; upgrade llama-cpp-python for batched decoding.")
+
+
+def _chat_formatter(llm: Any):
+    """The GGUF's own chat template, formatted the way create_chat_completion does, or None."""
+    template = (llm.metadata or {}).get("tokenizer.chat_template")
+    if not template:
+        return None
+    from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+    return Jinja2ChatFormatter(
+        template=template,
+        eos_token=llm.detokenize([llm.token_eos()]).decode("utf-8", "ignore"),
+        bos_token=llm.detokenize([llm.token_bos()]).decode("utf-8", "ignore"),
+    )
+
+
+def _chat_prompt_tokens(llm: Any, formatter: Any, messages: List[Dict[str, str]]) -> List[int]:
+    if formatter is not None:
+        prompt = formatter(messages=messages).prompt
+        return llm.tokenize(prompt.encode("utf-8"), add_bos=False, special=True)
+    prompt = "".join(f"{message['role']}: {message['content']}\n" for message in messages)
+    return llm.tokenize(f"{prompt}assistant:".encode("utf-8"), add_bos=True)
+
+
+def _system_prefix_tokens(llm: Any, formatter: Any, system_prompt: str) -> List[int]:
+    """Tokens every chat prompt with this system prompt starts with, whatever the user says."""
+    first, second = (
+        _chat_prompt_tokens(llm, formatter, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": probe},
+        ])
+        for probe in ("A", "Z")
+    )
+    return first[:_common_prefix_length(first, second)]
+
+
+def _common_prefix_length(left: List[int], right: List[int]) -> int:
+    length = 0
+    for a, b in zip(left, right):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+def _prime_prompt_cache(llm: Any, settings: ModelSettings) -> None:
+    """
+    Attach a RAM state cache and pre-evaluate the default system prompt.
+
+    llama-cpp-python restores the longest cached token prefix before each
+    completion, so requests only prefill what follows the system prompt; the
+    cache also keeps recent full prompts (RAG preambles, chat history) in LRU
+    order up to ``prompt_cache_mb``.
+    """
+    from llama_cpp import LlamaRAMCache
+
+    llm.set_cache(LlamaRAMCache(capacity_bytes=settings.prompt_cache_mb * 1024 * 1024))
+    formatter = _chat_formatter(llm)
+    if formatter is None:
+        # Without the GGUF template we cannot reproduce the chat prefix; the
+        # cache still fills from the first completion onwards.
+        return
+    prefix = _system_prefix_tokens(llm, formatter, settings.system_prompt)
+    if not prefix:
+        return
+    started = perf_counter()
+    llm.reset()
+    llm.eval(prefix)
+    llm.cache[prefix] = llm.save_state()
+    logger.info(
+        "Cached %d-token system prompt for model '%s' in %.2fs",
+        len(prefix),
+        settings.name,
+        perf_counter() - started,
+    )
+
+
+class LlamaBatchEngine(BatchEngine):
+    """
+    Multi-sequence decoding on one llama.cpp context.
+
+    The weights and tokenizer come from an already loaded ``Llama``; a second
+    context is created on the same model with ``n_seq_max`` KV-cache sequences
+    so several requests share every forward pass. One extra sequence holds the
+    most recently used system prompt, whose KV entries are copied into each
+    new request instead of being prefilled again.
+
+    Logits are read as numpy views (numpy ships with llama-cpp-python) so
+    sampling never copies a vocabulary-sized row into Python objects.
+    """
+
+    def __init__(self, llm: Any, settings: ModelSettings, n_seq: int, threads: Optional[int]):
+        import llama_cpp
+        import numpy
+
+        self._llama_cpp = llama_cpp
+        self._numpy = numpy
+        self._llm = llm
+        self.n_batch = settings.batch_size or 512
+        params = llama_cpp.llama_context_default_params()
+        # Every sequence, the shared system-prompt one included, gets a full context window
+        params.n_ctx = settings.context_window * (n_seq + 1)
+        params.n_batch = self.n_batch
+        params.n_seq_max = n_seq + 1
+        if threads:
+            params.n_threads = threads
+            params.n_threads_batch = threads
+        new_context = _llama_fn("llama_init_from_model", "llama_new_context_with_model")
+        self._ctx = new_context(llm._model.model, params)  # pylint: disable=protected-access
+        if not self._ctx:
+            raise ModelLoadError(f"Could not create a batched context for '{settings.name}'.")
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, n_seq + 1)
+        self._n_vocab = llm.n_vocab()
+        self._seq_rm = _llama_fn("llama_kv_self_seq_rm", "llama_kv_cache_seq_rm")
+        self._seq_cp = _llama_fn("llama_kv_self_seq_cp", "llama_kv_cache_seq_cp")
+        self._positions: Dict[int, int] = {}
+        self._formatter = _chat_formatter(llm)
+        self._prefix_seq = n_seq
+        self._prefix: List[int] = []
+        # Filled from submitting threads, read from the scheduler thread
+        self._system_prefixes: Dict[str, List[int]] = {}
+        self._system_prefixes_lock = Lock()
+        self.reuse_prefixes = settings.prompt_cache_mb > 0
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> List[int]:
+        if self.reuse_prefixes and messages and messages[0]["role"] == "system":
+            system_prompt = messages[0]["content"]
+            with self._system_prefixes_lock:
+                known = system_prompt in self._system_prefixes
+            if not known:
+                prefix = _system_prefix_tokens(self._llm, self._formatter, system_prompt)
+                with self._system_prefixes_lock:
+                    if len(self._system_prefixes) >= 16:
+                        self._system_prefixes.clear()
+                    self._system_prefixes[system_prompt] = prefix
+        return _chat_prompt_tokens(self._llm, self._formatter, messages)
+
+    def reuse_prefix(self, seq_id: int, tokens: List[int]) -> int:
+        with self._system_prefixes_lock:
+            candidates = list(self._system_prefixes.values())
+        prefix = max(
+            (
+                candidate
+                for candidate in candidates
+                if 0 < len(candidate) < len(tokens) and tokens[: len(candidate)] == candidate
+            ),
+            key=len,
+            default=None,
+        )
+        if prefix is None:
+            return 0
+        if prefix != self._prefix:
+            self.release(self._prefix_seq)
+            self._prefix = []
+            for start in range(0, len(prefix), self.n_batch):
+                self.decode([(self._prefix_seq, prefix[start:start + self.n_batch], False)])
+            self._prefix = prefix
+        self._seq_cp(self._ctx, self._prefix_seq, seq_id, -1, -1)
+        self._positions[seq_id] = len(prefix)
+        return len(prefix)
+
+    def decode(self, entries: List[tuple[int, List[int], bool]]) -> Dict[int, Any]:
+        batch = self._batch
+        rows: Dict[int, int] = {}
+        n = 0
+        for seq_id, tokens, want_logits in entries:
+            position = self._positions.get(seq_id, 0)
+            for offset, token in enumerate(tokens):
+                batch.token[n] = token
+                batch.pos[n] = position + offset
+                batch.n_seq_id[n] = 1
+                batch.seq_id[n][0] = seq_id
+                batch.logits[n] = want_logits and offset == len(tokens) - 1
+                n += 1
+            self._positions[seq_id] = position + len(tokens)
+            if want_logits:
+                rows[seq_id] = n - 1
+        if n == 0:
+            return {}
+        batch.n_tokens = n
+        status = self._llama_cpp.llama_decode(self._ctx, batch)
+        if status != 0:
+            raise InferenceError(f"llama_decode returned {status}")
+        # Views into the context's logits buffer; valid until the next decode, by which time they are sampled
+        return {
+            seq_id: self._numpy.ctypeslib.as_array(
+                self._llama_cpp.llama_get_logits_ith(self._ctx, row), shape=(self._n_vocab,)
+            )
+            for seq_id, row in rows.items()
+        }
+
+    def sample(self, logits: Any, temperature: float, top_p: float) -> int:
+        return _sample_token(logits, temperature, top_p)
+
+    def is_eog(self, token: int) -> bool:
+        return token == self._llm.token_eos()
+
+    def token_bytes(self, token: int) -> bytes:
+        return self._llm.detokenize([token])
+
+    def release(self, seq_id: int) -> None:
+        self._seq_rm(self._ctx, seq_id, -1, -1)
+        self._positions.pop(seq_id, None)
+
+
+def _sample_token(logits: Any, temperature: float, top_p: float, top_k: int = 40) -> int:
+    """Greedy at temperature 0, otherwise top-k/top-p sampling over the logits row."""
+    if hasattr(logits, "argpartition"):
+        # numpy row: scan the vocabulary in C so only top_k values reach Python
+        if temperature <= 0:
+            return int(logits.argmax())
+        top_k = min(top_k, len(logits))
+        candidates = logits.argpartition(-top_k)[-top_k:]
+        candidates = candidates[logits[candidates].argsort()[::-1]]
+        return _pick_top_p(list(zip(candidates.tolist(), logits[candidates].tolist())), temperature, top_p)
+    if temperature <= 0:
+        return max(range(len(logits)), key=logits.__getitem__)
+    candidates = heapq.nlargest(top_k, range(len(logits)), key=logits.__getitem__)
+    return _pick_top_p([(token, logits[token]) for token in candidates], temperature, top_p)
+
+
+def _pick_top_p(candidates: List[tuple[int, float]], temperature: float, top_p: float) -> int:
+    """Sample from (token, logit) pairs, best first, keeping the smallest set reaching top_p."""
+    peak = candidates[0][1]
+    weights = [math.exp((logit - peak) / temperature) for _, logit in candidates]
+    total = sum(weights)
+    kept, mass = [], 0.0
+    for (token, _), weight in zip(candidates, weights):
+        kept.append((token, weight))
+        mass += weight / total
+        if mass >= top_p:
+            break
+    pick = random.random() * sum(weight for _, weight in kept)
+    for token, weight in kept:
+        pick -= weight
+        if pick <= 0:
+            return token
+    return kept[-1][0]
+
+
+class BatchRequest:
+    """One sequence in the batch; its text arrives on ``deltas`` as it decodes."""
+
+    def __init__(
+        self,
+        prompt_tokens: List[int],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: List[str],
+        cancel: Optional[CancelToken] = None,
+        on_finish: Optional[Callable[["BatchRequest"], None]] = None,
+    ):
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop = stop
+        self.seq_id: Optional[int] = None
+        self.prefilled = 0
+        self.last_token: Optional[int] = None
+        self.completion_tokens = 0
+        self.text = ""
+        self.emitted = 0
+        self.cancel = cancel or CancelToken()
+        self.submitted_at = perf_counter()
+        self.admitted_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.reused_tokens = 0
+        self.on_finish = on_finish
+        self.deltas: "queue.Queue[Any]" = queue.Queue()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # Hold back enough text that a stop sequence split across tokens is never emitted
+        self._hold = max((len(sequence) for sequence in stop), default=1) - 1
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel.cancelled
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "prompt_tokens": len(self.prompt_tokens),
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": len(self.prompt_tokens) + self.completion_tokens,
+        }
+
+    def _append(self, piece: bytes) -> bool:
+        """Add decoded bytes; returns True once a stop sequence has been reached."""
+        self.text += self._decoder.decode(piece)
+        search_from = max(0, self.emitted - self._hold)
+        cut = min(
+            (index for index in (self.text.find(sequence, search_from) for sequence in self.stop) if index >= 0),
+            default=-1,
+        )
+        if cut >= 0:
+            self.text = self.text[:cut]
+            return True
+        safe = len(self.text) - self._hold
+        if safe > self.emitted:
+            self.deltas.put(self.text[self.emitted:safe])
+            self.emitted = safe
+        return False
+
+    def _finish(self, error: Optional[Exception] = None) -> None:
+        self.finished_at = perf_counter()
+        if error is None:
+            self.text += self._decoder.decode(b"", final=True)
+            if len(self.text) > self.emitted:
+                self.deltas.put(self.text[self.emitted:])
+                self.emitted = len(self.text)
+        else:
+            self.deltas.put(error)
+        self.deltas.put(_FINISHED)
+        if self.on_finish is not None:
+            # Runs on the scheduler thread, so callbacks must only hand the request off
+            self.on_finish(self)
+
+    def stream(self) -> Iterator[str]:
+        abandon_at: Optional[float] = None
+        try:
+            while True:
+                try:
+                    item = self.deltas.get(timeout=0.5)
+                except queue.Empty:
+                    # The scheduler normally retires a cancelled request within a step;
+                    # if it never does, the deadline still holds for the consumer
+                    if self.cancel.cancelled:
+                        abandon_at = abandon_at or perf_counter() + _CANCEL_GRACE_SECONDS
+                        if perf_counter() >= abandon_at:
+                            raise GenerationCancelled(
+                                f"Generation was cancelled ({self.cancel.reason}) but never stopped."
+                            ) from None
+                    continue
+                if item is _FINISHED:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumer went away early: let the scheduler free the sequence
+            self.cancel.cancel("consumer closed")
+
+    def result(self) -> str:
+        return "".join(self.stream())
+
+    def record(self, model_name: str, *, queue_wait: float, load_seconds: float) -> None:
+        """Observe this request's inference metrics once it has finished."""
+        finished = self.finished_at or perf_counter()
+        admitted = self.admitted_at or finished
+        first = self.first_token_at or finished
+        record_inference(
+            "local",
+            model_name,
+            total_seconds=queue_wait + load_seconds + finished - self.submitted_at,
+            queue_wait=queue_wait + admitted - self.submitted_at,
+            load_seconds=load_seconds,
+            prefill_tokens=len(self.prompt_tokens) - self.reused_tokens,
+            prefill_seconds=first - admitted,
+            decode_tokens=self.completion_tokens,
+            decode_seconds=finished - first,
+        )
+
+
+class BatchScheduler:
+    """
+    Continuous batching for one model: requests join and leave between decode steps.
+
+    A single scheduler thread owns the llama.cpp context. Each step packs one
+    token for every sequence already generating plus as much pending prompt
+    prefill as fits in ``n_batch``, decodes them together and samples the
+    next token per sequence. Finished or abandoned sequences free their KV
+    slot immediately so a queued request can take it on the next step.
+    """
+
+    def __init__(self, name: str, engine: BatchEngine, max_sequences: int, context_window: int):
+        self.name = name
+        self._engine = engine
+        self.max_sequences = max(1, max_sequences)
+        self.context_window = context_window
+        self._pending: "queue.Queue[BatchRequest]" = queue.Queue()
+        self._active: List[BatchRequest] = []
+        self._free = list(range(self.max_sequences))
+        self.steps = 0
+        self._thread = Thread(target=self._run, name=f"llm-batch-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        max_tokens: int,
+        temperature: float,
+        top_p: float = 0.95,
+        stop: Optional[List[str]] = None,
+        cancel: Optional[CancelToken] = None,
+        on_finish: Optional[Callable[[BatchRequest], None]] = None,
+    ) -> BatchRequest:
+        tokens = self._engine.prompt_tokens(messages)
+        if len(tokens) >= self.context_window:
+            raise InferenceError(
+                f"Prompt of {len(tokens)} tokens does not fit model '{self.name}' context."
+            )
+        # Every sequence owns one context window's worth of KV cache
+        max_tokens = min(max_tokens, self.context_window - len(tokens))
+        request = BatchRequest(tokens, max_tokens, temperature, top_p, list(stop or []), cancel, on_finish)
+        self._pending.put(request)
+        return request
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_sequences": self.max_sequences,
+            "active": len(self._active),
+            "queued": self._pending.qsize(),
+            "steps": self.steps,
+        }
+
+    def _admit(self, block: bool) -> None:
+        while self._free:
+            try:
+                request = self._pending.get(block=block and not self._active, timeout=1.0)
+            except queue.Empty:
+                return
+            if request.cancelled:
+                request._finish(self._cancelled_error(request))  # pylint: disable=protected-access
+                continue
+            request.seq_id = self._free.pop()
+            request.admitted_at = perf_counter()
+            # Active before touching the engine, so a failure below retires it with the rest
+            self._active.append(request)
+            try:
+                request.prefilled = self._engine.reuse_prefix(request.seq_id, request.prompt_tokens)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Prefix reuse failed for model '%s'; prefilling in full", self.name)
+                self._engine.release(request.seq_id)
+                request.prefilled = 0
+            request.reused_tokens = request.prefilled
+
+    def _retire(self, request: BatchRequest, error: Optional[Exception] = None) -> None:
+        self._active.remove(request)
+        try:
+            self._engine.release(request.seq_id)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not release sequence %s of model '%s'", request.seq_id, self.name)
+        self._free.append(request.seq_id)
+        try:
+            request._finish(error)  # pylint: disable=protected-access
+        except Exception:  # pylint: disable=broad-except
+            # The request already got its result; only its on_finish callback failed
+            logger.exception("Finishing a request of model '%s' failed", self.name)
+
+    def _cancelled_error(self, request: BatchRequest) -> GenerationCancelled:
+        return GenerationCancelled(f"Generation with model '{self.name}' was cancelled ({request.cancel.reason}).")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._step()
+            except Exception as exc:  # pylint: disable=broad-except
+                # Whatever broke, fail the requests in flight rather than the thread,
+                # which would leave every current and future request waiting forever
+                logger.exception("Batched generation step failed for model '%s'", self.name)
+                error = InferenceError(f"Model '{self.name}' failed during generation.")
+                error.__cause__ = exc
+                for request in list(self._active):
+                    self._retire(request, error)
+
+    def _step(self) -> None:
+        """Admit what fits, then decode one token (or prefill chunk) for every active sequence."""
+        self._admit(block=True)
+        for request in [request for request in self._active if request.cancelled]:
+            self._retire(request, self._cancelled_error(request))
+        if not self._active:
+            return
+
+        budget = self._engine.n_batch
+        entries: List[tuple[int, List[int], bool]] = []
+        for request in self._active:
+            if request.last_token is not None:
+                entries.append((request.seq_id, [request.last_token], True))
+                budget -= 1
+        for request in self._active:
+            remaining = len(request.prompt_tokens) - request.prefilled
+            if request.last_token is None and remaining and budget > 0:
+                take = min(remaining, budget)
+                chunk = request.prompt_tokens[request.prefilled:request.prefilled + take]
+                request.prefilled += take
+                budget -= take
+                entries.append((request.seq_id, chunk, request.prefilled == len(request.prompt_tokens)))
+        if not entries:
+            return
+
+        logits = self._engine.decode(entries)
+        self.steps += 1
+
+        for request in list(self._active):
+            row = logits.get(request.seq_id)
+            if row is None:
+                continue
+            token = self._engine.sample(row, request.temperature, request.top_p)
+            if request.first_token_at is None:
+                request.first_token_at = perf_counter()
+            if self._engine.is_eog(token):
+                self._retire(request)
+                continue
+            request.completion_tokens += 1
+            request.last_token = token
+            stopped = request._append(self._engine.token_bytes(token))  # pylint: disable=protected-access
+            if stopped or request.completion_tokens >= request.max_tokens:
+                self._retire(request)
 
 
 class ModelManager:
     """Lazy loader and orchestrator for llama.cpp-compatible models."""
 
-    def __init__(self, registry: Dict[str, Dict[str, Any]]):
+    def __init__(
+        self,
+        registry: Dict[str, Dict[str, Any]],
+        *,
+        thread_budget: Optional[int] = None,
+        memory_budget_mb: int = 0,
+        completion_cache: Optional[CompletionCache] = None,
+        ram_budget_mb: int = 0,
+    ):
         self._registry = {
             name: self._build_settings(name, settings)
             for name, settings in registry.items()
         }
-        self._models: Dict[str, Any] = {}
-        self._locks: Dict[str, Lock] = {}
+        self._thread_budget = thread_budget
+        self._memory_budget_bytes = max(0, memory_budget_mb) * 1024 * 1024
+        self._pools: Dict[str, ReplicaPool] = {}
+        self._pools_lock = Lock()
+        self._schedulers: Dict[str, BatchScheduler] = {}
+        self._completion_cache = completion_cache
+        self._ram_budget_bytes = max(0, ram_budget_mb) * 1024 * 1024
+        self._evict_lock = Lock()
 
     @staticmethod
     def _build_settings(name: str, data: Dict[str, Any]) -> ModelSettings:
@@ -89,6 +1016,9 @@ class ModelManager:
         threads_raw = data.get("threads")
         batch_size_raw = data.get("batch_size")
         timeout_raw = data.get("timeout")
+        replicas_raw = data.get("replicas", 1)
+        batch_sequences_raw = data.get("batch_sequences", 0)
+        prompt_cache_raw = data.get("prompt_cache_mb", 0)
 
         try:
             threads = (
@@ -123,6 +1053,27 @@ class ModelManager:
                 f"Model '{name}' has invalid 'timeout' setting."
             ) from exc
 
+        try:
+            replicas = max(1, int(replicas_raw))
+        except (TypeError, ValueError) as exc:
+            raise ModelNotConfiguredError(
+                f"Model '{name}' has invalid 'replicas' setting."
+            ) from exc
+
+        try:
+            batch_sequences = max(0, int(batch_sequences_raw))
+        except (TypeError, ValueError) as exc:
+            raise ModelNotConfiguredError(
+                f"Model '{name}' has invalid 'batch_sequences' setting."
+            ) from exc
+
+        try:
+            prompt_cache_mb = max(0, int(prompt_cache_raw))
+        except (TypeError, ValueError) as exc:
+            raise ModelNotConfiguredError(
+                f"Model '{name}' has invalid 'prompt_cache_mb' setting."
+            ) from exc
+
         return ModelSettings(
             name=name,
             path=str(path),
@@ -134,6 +1085,9 @@ class ModelManager:
             threads=threads,
             batch_size=batch_size,
             timeout=timeout,
+            replicas=replicas,
+            batch_sequences=batch_sequences,
+            prompt_cache_mb=prompt_cache_mb,
         )
 
     def available_models(self) -> List[str]:
@@ -152,21 +1106,36 @@ class ModelManager:
                 "threads": settings.threads,
                 "batch_size": settings.batch_size,
                 "timeout": settings.timeout,
+                "replicas": (
+                    self._pools[name].stats()
+                    if name in self._pools
+                    else {"replicas": settings.replicas, "loaded": 0}
+                ),
+                "state": self._pools[name].state if name in self._pools else "unloaded",
+                "memory_bytes": (
+                    self._pools[name].loaded * self._replica_bytes(settings) if name in self._pools else 0
+                ),
+                "last_used": self._pools[name].last_used or None if name in self._pools else None,
+                "batching": (
+                    self._schedulers[name].stats()
+                    if name in self._schedulers
+                    else {"max_sequences": settings.batch_sequences}
+                ) if settings.batch_sequences > 1 else None,
             }
             for name, settings in self._registry.items()
         }
 
-    def generate(
+    def _prepare_completion(
         self,
         *,
         model_name: str,
         prompt: str,
-        system_prompt: Optional[str] = None,
-        temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None,
-        stop: Optional[Iterable[str]] = None,
-        **extra_options: Any,
-    ) -> GenerationResult:
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        stop: Optional[Iterable[str]],
+        extra_options: Dict[str, Any],
+    ) -> tuple[ModelSettings, Dict[str, Any]]:
         if not prompt:
             raise ValueError("Prompt must be non-empty.")
 
@@ -176,15 +1145,6 @@ class ModelManager:
                 f"Model '{model_name}' is not configured."
             )
 
-        llm = self._ensure_model(settings)
-        logger.info(
-            "Starting generation with model '%s' (%s); prompt length=%d",
-            model_name,
-            settings.path,
-            len(prompt),
-        )
-        start_time = perf_counter()
-
         chat_messages = [
             {"role": "system", "content": system_prompt or settings.system_prompt},
             {"role": "user", "content": prompt},
@@ -203,15 +1163,113 @@ class ModelManager:
             completion_kwargs["stop"] = stop_sequences
 
         completion_kwargs.update(extra_options)
+        return settings, completion_kwargs
+
+    def _cache_key(self, settings: ModelSettings, completion_kwargs: Dict[str, Any]) -> Optional[str]:
+        if self._completion_cache is None or not self._completion_cache.cacheable(completion_kwargs):
+            return None
+        return self._completion_cache.key(settings, completion_kwargs)
+
+    def generate(
+        self,
+        *,
+        model_name: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[Iterable[str]] = None,
+        cancel: Optional[CancelToken] = None,
+        **extra_options: Any,
+    ) -> GenerationResult:
+        """
+        Run one chat completion and return its text.
+
+        Pass a CancelToken to stop the generation early; a cancelled request
+        raises GenerationCancelled and frees its replica within one token.
+        """
+        settings, completion_kwargs = self._prepare_completion(
+            model_name=model_name,
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stop=stop,
+            extra_options=extra_options,
+        )
+        cache_key = self._cache_key(settings, completion_kwargs)
+        if cache_key is not None:
+            cached = self._completion_cache.get(cache_key)
+            record_cache("completion", cached is not None)
+            if cached is not None:
+                logger.info("Serving cached completion for model '%s'", model_name)
+                return cached
+
+        result = self._generate_uncached(settings, completion_kwargs, cancel)
+        if cache_key is not None and result.text:
+            self._completion_cache.put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _check_cancelled(model_name: str, cancel: Optional[CancelToken], start_time: float) -> None:
+        if cancel is not None and cancel.cancelled:
+            logger.warning(
+                "Generation with model '%s' cancelled after %.2fs (%s)",
+                model_name,
+                perf_counter() - start_time,
+                cancel.reason,
+            )
+            raise GenerationCancelled(f"Generation with model '{model_name}' was cancelled ({cancel.reason}).")
+
+    def _generate_uncached(
+        self,
+        settings: ModelSettings,
+        completion_kwargs: Dict[str, Any],
+        cancel: Optional[CancelToken] = None,
+    ) -> GenerationResult:
+        model_name = settings.name
+        queue_wait = current_queue_wait()
+        load_started = perf_counter()
+        pool = self._ensure_model(settings)
+        load_seconds = perf_counter() - load_started
+        logger.info(
+            "Starting generation with model '%s' (%s); prompt length=%d",
+            model_name,
+            settings.path,
+            len(completion_kwargs["messages"][-1]["content"]),
+        )
+        start_time = perf_counter()
 
-        # Use the same lock to serialize inference calls (llama-cpp-python is not thread-safe)
-        lock = self._locks.get(settings.name)
-        if lock is None:
-            lock = self._locks.setdefault(settings.name, Lock())
+        if settings.batch_sequences > 1:
+            request = self._submit_batched(settings, pool, completion_kwargs, cancel)
+            text = request.result().strip()
+            request.record(model_name, queue_wait=queue_wait, load_seconds=load_seconds)
+            usage = request.usage()
+            logger.info(
+                "Completed batched generation with model '%s' in %.2fs; usage=%s",
+                model_name,
+                perf_counter() - start_time,
+                usage,
+            )
+            return GenerationResult(
+                text=text,
+                usage=usage,
+                raw={"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage},
+            )
 
+        clock = _TokenClock()
+        call_kwargs = dict(completion_kwargs, logits_processor=LogitsProcessorList([clock]))
+        if cancel is not None:
+            call_kwargs["stopping_criteria"] = cancel.stopping_criteria()
         try:
-            with lock:
-                output = llm.create_chat_completion(**completion_kwargs)
+            # Each replica serves one request at a time (llama-cpp-python is not thread-safe)
+            with pool.lease() as llm:
+                queue_wait += perf_counter() - start_time
+                self._check_cancelled(model_name, cancel, start_time)
+                clock.start()
+                output = llm.create_chat_completion(**call_kwargs)
+        except GenerationCancelled:
+            raise
         except Exception as exc:  # pylint: disable=broad-except
             logger.exception("Generation failed for model '%s'", model_name)
             raise InferenceError(
@@ -229,7 +1287,12 @@ class ModelManager:
             raise InferenceError(
                 f"Model '{model_name}' returned malformed output."
             ) from exc
+        # Text cut short by the stopping criterion is not an answer
+        self._check_cancelled(model_name, cancel, start_time)
         usage = output.get("usage", {})
+        if not clock.prompt_tokens:
+            clock.prompt_tokens = (usage or {}).get("prompt_tokens", 0)
+        clock.record(model_name, queue_wait=queue_wait, load_seconds=load_seconds)
         duration = perf_counter() - start_time
         logger.info(
             "Completed generation with model '%s' in %.2fs; usage=%s",
@@ -239,60 +1302,466 @@ class ModelManager:
         )
         return GenerationResult(text=text, usage=usage, raw=output)
 
-    def _ensure_model(self, settings: ModelSettings):
-        cached = self._models.get(settings.name)
-        if cached is not None:
-            return cached
+    def generate_stream(
+        self,
+        *,
+        model_name: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        stop: Optional[Iterable[str]] = None,
+        cancel: Optional[CancelToken] = None,
+        **extra_options: Any,
+    ) -> Iterator[str]:
+        """
+        Like generate(), but return an iterator of text deltas as llama.cpp decodes them.
 
-        lock = self._locks.setdefault(settings.name, Lock())
-        with lock:
-            cached = self._models.get(settings.name)
+        Configuration and load errors are raised here, before any token is
+        produced, so callers can still answer with a normal error response.
+        A model replica is held while the iterator is being consumed and is
+        released when it is exhausted or closed, or within one token of
+        ``cancel`` being cancelled (the iterator then raises GenerationCancelled).
+        """
+        settings, completion_kwargs = self._prepare_completion(
+            model_name=model_name,
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stop=stop,
+            extra_options=extra_options,
+        )
+        cache_key = self._cache_key(settings, completion_kwargs)
+        if cache_key is not None:
+            cached = self._completion_cache.get(cache_key)
+            record_cache("completion", cached is not None)
             if cached is not None:
-                return cached
+                return iter([cached.text])
 
-            if Llama is None:
-                raise ModelLoadError(
-                    "llama_cpp is not installed. Install llama-cpp-python to enable local inference."
+        queue_wait = current_queue_wait()
+        load_started = perf_counter()
+        pool = self._ensure_model(settings)
+        load_seconds = perf_counter() - load_started
+        logger.info(
+            "Starting streamed generation with model '%s' (%s); prompt length=%d",
+            model_name,
+            settings.path,
+            len(prompt),
+        )
+        if settings.batch_sequences > 1:
+            request = self._submit_batched(settings, pool, completion_kwargs, cancel)
+            stream = self._record_when_done(
+                request.stream(),
+                lambda: request.record(model_name, queue_wait=queue_wait, load_seconds=load_seconds),
+            )
+            usage = request.usage
+        else:
+            stream = self._stream_completion(
+                model_name, pool, completion_kwargs, cancel, queue_wait=queue_wait, load_seconds=load_seconds
+            )
+            usage = dict
+        if cache_key is None:
+            return stream
+        return self._cache_when_done(stream, cache_key, usage)
+
+    @staticmethod
+    def _record_when_done(stream: Iterator[str], record: Callable[[], None]) -> Iterator[str]:
+        yield from stream
+        record()
+
+    def _cache_when_done(
+        self, stream: Iterator[str], cache_key: str, usage: Callable[[], Dict[str, Any]]
+    ) -> Iterator[str]:
+        """Pass deltas through and cache the full text once the stream ends normally."""
+        parts = []
+        for delta in stream:
+            parts.append(delta)
+            yield delta
+        # Not reached when the consumer closes early or generation is cancelled (both raise)
+        text = "".join(parts).strip()
+        if text:
+            totals = usage()
+            message = {"role": "assistant", "content": text}
+            self._completion_cache.put(
+                cache_key,
+                GenerationResult(text=text, usage=totals, raw={"choices": [{"message": message}], "usage": totals}),
+            )
+
+    def token_counter(self, model_name: str) -> Optional[Callable[[str], int]]:
+        """Count tokens with ``model_name``'s own tokenizer, or None while no copy is loaded."""
+        pool = self._pools.get(model_name)
+        llm = pool.vocabulary() if pool is not None else None
+        if llm is None:
+            return None
+        return lambda text: len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=False))
+
+    def parallelism(self, model_name: str) -> int:
+        """How many generations ``model_name`` can decode at once: batch sequences or replicas."""
+        settings = self._registry.get(model_name)
+        if settings is None:
+            return 1
+        if settings.batch_sequences > 1:
+            return settings.batch_sequences
+        return self._replica_plan(settings)[0]
+
+    def generate_batch(
+        self,
+        model_name: str,
+        items: List[Dict[str, Any]],
+        cancel: Optional[CancelToken] = None,
+    ) -> Iterator[tuple[int, Any]]:
+        """
+        Run several completions on one model; yields ``(index, outcome)`` as each finishes.
+
+        ``items`` hold generate() keyword arguments other than ``model_name``.
+        An outcome is a GenerationResult, or the exception that item failed
+        with, so one bad prompt does not fail the rest. On a model with
+        continuous batching every prompt joins the batch scheduler at once and
+        they decode side by side; otherwise they are spread over the model's
+        replicas. Configuration and load errors are raised here, before
+        anything is yielded. Closing the iterator early cancels what is left.
+        """
+        settings = self._registry.get(model_name)
+        if settings is None:
+            raise ModelNotConfiguredError(f"Model '{model_name}' is not configured.")
+        cancel = cancel or CancelToken()
+        done: "queue.Queue[tuple[int, Any]]" = queue.Queue()
+        pending: List[tuple[int, Dict[str, Any], Optional[str]]] = []
+        for index, item in enumerate(items):
+            options = dict(item)
+            try:
+                _, completion_kwargs = self._prepare_completion(
+                    model_name=model_name,
+                    prompt=options.pop("prompt", ""),
+                    system_prompt=options.pop("system_prompt", None),
+                    temperature=options.pop("temperature", None),
+                    max_tokens=options.pop("max_tokens", None),
+                    stop=options.pop("stop", None),
+                    extra_options=options,
                 )
+            except ValueError as exc:
+                done.put((index, exc))
+                continue
+            cache_key = self._cache_key(settings, completion_kwargs)
+            if cache_key is not None:
+                cached = self._completion_cache.get(cache_key)
+                record_cache("completion", cached is not None)
+                if cached is not None:
+                    done.put((index, cached))
+                    continue
+            pending.append((index, completion_kwargs, cache_key))
+
+        queue_wait = current_queue_wait()
+        load_seconds = 0.0
+        if pending:
+            load_started = perf_counter()
+            pool = self._ensure_model(settings)
+            load_seconds = perf_counter() - load_started
+            logger.info("Starting batch of %d generations with model '%s'", len(pending), model_name)
+        cache_keys = {index: cache_key for index, _, cache_key in pending}
 
-            model_path = Path(settings.path)
-            if not model_path.exists():
-                raise ModelLoadError(
-                    f"Model file for '{settings.name}' not found at {settings.path}"
+        if pending and settings.batch_sequences > 1:
+            for index, completion_kwargs, _ in pending:
+                try:
+                    self._submit_batched(
+                        settings,
+                        pool,
+                        completion_kwargs,
+                        CancelToken(parent=cancel),
+                        on_finish=lambda request, index=index: done.put((index, request)),
+                    )
+                except InferenceError as exc:
+                    done.put((index, exc))
+        elif pending:
+            workers = ThreadPoolExecutor(
+                max_workers=min(pool.size, len(pending)), thread_name_prefix=f"llm-batch-{model_name}"
+            )
+            for index, completion_kwargs, _ in pending:
+                future = workers.submit(
+                    self._generate_uncached, settings, completion_kwargs, CancelToken(parent=cancel)
                 )
+                future.add_done_callback(lambda future, index=index: done.put((index, future)))
+            workers.shutdown(wait=False)
 
+        def outcomes() -> Iterator[tuple[int, Any]]:
+            remaining = len(items)
             try:
-                llm_kwargs: Dict[str, Any] = {
-                    "model_path": str(model_path),
-                    "n_ctx": settings.context_window,
-                    "logits_all": False,
-                    "verbose": False,
-                }
-                if settings.threads:
-                    llm_kwargs["n_threads"] = settings.threads
-                if settings.batch_size:
-                    llm_kwargs["n_batch"] = settings.batch_size
-
-                llm = Llama(**llm_kwargs)
-                logger.info(
-                    "Loaded model '%s' from %s (threads=%s, batch=%s)",
-                    settings.name,
-                    settings.path,
-                    settings.threads,
-                    settings.batch_size,
-                )
+                while remaining:
+                    index, outcome = done.get()
+                    remaining -= 1
+                    try:
+                        if isinstance(outcome, BatchRequest):
+                            text = outcome.result().strip()
+                            outcome.record(model_name, queue_wait=queue_wait, load_seconds=load_seconds)
+                            usage = outcome.usage()
+                            message = {"role": "assistant", "content": text}
+                            outcome = GenerationResult(
+                                text=text, usage=usage, raw={"choices": [{"message": message}], "usage": usage}
+                            )
+                        elif isinstance(outcome, Future):
+                            outcome = outcome.result()
+                    except Exception as exc:  # pylint: disable=broad-except
+                        outcome = exc
+                    cache_key = cache_keys.get(index)
+                    if cache_key is not None and isinstance(outcome, GenerationResult) and outcome.text:
+                        self._completion_cache.put(cache_key, outcome)
+                    yield index, outcome
+            finally:
+                if remaining:
+                    cancel.cancel("consumer closed")
+
+        return outcomes()
+
+    def _submit_batched(
+        self,
+        settings: ModelSettings,
+        pool: ReplicaPool,
+        completion_kwargs: Dict[str, Any],
+        cancel: Optional[CancelToken] = None,
+        on_finish: Optional[Callable[[BatchRequest], None]] = None,
+    ) -> BatchRequest:
+        scheduler = self._schedulers.get(settings.name)
+        if scheduler is None:
+            with self._pools_lock:
+                scheduler = self._schedulers.get(settings.name)
+                if scheduler is None:
+                    with pool.lease() as llm:
+                        engine = LlamaBatchEngine(llm, settings, settings.batch_sequences, pool.threads)
+                    scheduler = BatchScheduler(
+                        settings.name, engine, settings.batch_sequences, settings.context_window
+                    )
+                    self._schedulers[settings.name] = scheduler
+        ignored = set(completion_kwargs) - {"messages", "max_tokens", "temperature", "top_p", "stop"}
+        if ignored:
+            logger.debug("Batched decoding ignores options %s", sorted(ignored))
+        return scheduler.submit(
+            completion_kwargs["messages"],
+            max_tokens=completion_kwargs["max_tokens"],
+            temperature=completion_kwargs["temperature"],
+            top_p=completion_kwargs.get("top_p", 0.95),
+            stop=completion_kwargs.get("stop"),
+            cancel=cancel,
+            on_finish=on_finish,
+        )
+
+    @classmethod
+    def _stream_completion(
+        cls,
+        model_name: str,
+        pool: ReplicaPool,
+        completion_kwargs: Dict[str, Any],
+        cancel: Optional[CancelToken] = None,
+        *,
+        queue_wait: float = 0.0,
+        load_seconds: float = 0.0,
+    ) -> Iterator[str]:
+        start_time = perf_counter()
+        first_token_at: Optional[float] = None
+        chunks = 0
+        clock = _TokenClock()
+        call_kwargs = dict(completion_kwargs, logits_processor=LogitsProcessorList([clock]))
+        if cancel is not None:
+            call_kwargs["stopping_criteria"] = cancel.stopping_criteria()
+        with pool.lease() as llm:
+            queue_wait += perf_counter() - start_time
+            cls._check_cancelled(model_name, cancel, start_time)
+            clock.start()
+            try:
+                for chunk in llm.create_chat_completion(stream=True, **call_kwargs):
+                    try:
+                        delta = chunk["choices"][0]["delta"].get("content")
+                    except (KeyError, IndexError, AttributeError):
+                        delta = None
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = perf_counter()
+                    chunks += 1
+                    yield delta
+            except GeneratorExit:
+                logger.info("Streamed generation with model '%s' closed by consumer", model_name)
+                raise
             except Exception as exc:  # pylint: disable=broad-except
-                logger.exception(
-                    "Failed to load model '%s' from %s",
-                    settings.name,
-                    settings.path,
-                )
-                raise ModelLoadError(
-                    f"Could not load model '{settings.name}'."
+                logger.exception("Streamed generation failed for model '%s'", model_name)
+                raise InferenceError(
+                    f"Model '{model_name}' failed during generation."
                 ) from exc
+        cls._check_cancelled(model_name, cancel, start_time)
+        clock.record(model_name, queue_wait=queue_wait, load_seconds=load_seconds)
+        logger.info(
+            "Completed streamed generation with model '%s' in %.2fs (first token %.2fs, %d chunks)",
+            model_name,
+            perf_counter() - start_time,
+            (first_token_at or perf_counter()) - start_time,
+            chunks,
+        )
 
-            self._models[settings.name] = llm
-            return llm
+    def _replica_plan(self, settings: ModelSettings) -> tuple[int, Optional[int]]:
+        """Fit the requested replicas into the thread and memory budgets: (replicas, threads each)."""
+        # A batching model decodes every sequence on one shared context
+        replicas = 1 if settings.batch_sequences > 1 else settings.replicas
+        if self._memory_budget_bytes:
+            try:
+                model_bytes = Path(settings.path).stat().st_size
+            except OSError:
+                model_bytes = 0
+            if model_bytes:
+                # Count every replica at full file size; mmap sharing only makes this conservative
+                replicas = min(replicas, max(1, self._memory_budget_bytes // model_bytes))
+
+        threads = settings.threads
+        if self._thread_budget:
+            replicas = min(replicas, self._thread_budget)
+            share = max(1, self._thread_budget // replicas)
+            threads = min(threads, share) if threads else share
+        if replicas < settings.replicas and settings.batch_sequences <= 1:
+            logger.warning(
+                "Model '%s' asked for %d replicas; budget allows %d",
+                settings.name,
+                settings.replicas,
+                replicas,
+            )
+        return replicas, threads
+
+    def _ensure_model(self, settings: ModelSettings) -> ReplicaPool:
+        pool = self._pools.get(settings.name)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(settings.name)
+                if pool is None:
+                    replicas, threads = self._replica_plan(settings)
+                    pool = ReplicaPool(
+                        settings.name,
+                        replicas,
+                        threads,
+                        lambda: self._load_replica(settings, threads),
+                    )
+                    self._pools[settings.name] = pool
+        pool.ensure_loaded()
+        return pool
+
+    @staticmethod
+    def _replica_bytes(settings: ModelSettings) -> int:
+        """Resident-size estimate for one loaded copy: weights plus its prompt cache."""
+        try:
+            model_bytes = Path(settings.path).stat().st_size
+        except OSError:
+            model_bytes = 0
+        return model_bytes + settings.prompt_cache_mb * 1024 * 1024
+
+    def _resident_bytes(self) -> int:
+        return sum(
+            pool.loaded * self._replica_bytes(self._registry[name])
+            for name, pool in list(self._pools.items())
+        )
+
+    def _make_room(self, settings: ModelSettings) -> None:
+        """Unload least recently used idle models until one more replica of ``settings`` fits."""
+        if not self._ram_budget_bytes:
+            return
+        needed = self._replica_bytes(settings)
+        with self._evict_lock:
+            while self._resident_bytes() + needed > self._ram_budget_bytes:
+                idle = sorted(
+                    (
+                        pool
+                        for name, pool in list(self._pools.items())
+                        if name != settings.name and pool.loaded and name not in self._schedulers
+                    ),
+                    key=lambda pool: pool.last_used,
+                )
+                freed = 0
+                for pool in idle:
+                    freed = pool.unload()
+                    if freed:
+                        logger.info(
+                            "Unloaded %d replica(s) of idle model '%s' to make room for '%s'",
+                            freed,
+                            pool.name,
+                            settings.name,
+                        )
+                        break
+                if not freed:
+                    logger.warning(
+                        "Loading model '%s' exceeds the %d MB model RAM budget; no idle model to unload",
+                        settings.name,
+                        self._ram_budget_bytes // (1024 * 1024),
+                    )
+                    return
+
+    def _load_replica(self, settings: ModelSettings, threads: Optional[int]):
+        self._make_room(settings)
+        return self._load_model(settings, threads)
+
+    def preload(self, model_name: str, warmup: bool = True) -> float:
+        """Load a model now (and run a one-token generation); returns seconds taken."""
+        settings = self._registry.get(model_name)
+        if settings is None:
+            raise ModelNotConfiguredError(f"Model '{model_name}' is not configured.")
+        started = perf_counter()
+        pool = self._ensure_model(settings)
+        if warmup:
+            with pool.lease() as llm:
+                llm.create_chat_completion(
+                    messages=[
+                        {"role": "system", "content": settings.system_prompt},
+                        {"role": "user", "content": "Hello"},
+                    ],
+                    max_tokens=1,
+                )
+        elapsed = perf_counter() - started
+        logger.info("Preloaded model '%s' in %.2fs (warmup=%s)", model_name, elapsed, warmup)
+        return elapsed
+
+    @staticmethod
+    def _load_model(settings: ModelSettings, threads: Optional[int]):
+        if Llama is None:
+            raise ModelLoadError(
+                "llama_cpp is not installed. Install llama-cpp-python to enable local inference."
+            )
+
+        model_path = Path(settings.path)
+        if not model_path.exists():
+            raise ModelLoadError(
+                f"Model file for '{settings.name}' not found at {settings.path}"
+            )
+
+        try:
+            llm_kwargs: Dict[str, Any] = {
+                "model_path": str(model_path),
+                "n_ctx": settings.context_window,
+                "logits_all": False,
+                "verbose": False,
+            }
+            if threads:
+                llm_kwargs["n_threads"] = threads
+            if settings.batch_size:
+                llm_kwargs["n_batch"] = settings.batch_size
+
+            llm = Llama(**llm_kwargs)
+            if settings.prompt_cache_mb and settings.batch_sequences <= 1:
+                try:
+                    _prime_prompt_cache(llm, settings)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Could not prime prompt cache for model '%s'", settings.name)
+            logger.info(
+                "Loaded model '%s' from %s (threads=%s, batch=%s)",
+                settings.name,
+                settings.path,
+                threads,
+                settings.batch_size,
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(
+                "Failed to load model '%s' from %s",
+                settings.name,
+                settings.path,
+            )
+            raise ModelLoadError(
+                f"Could not load model '{settings.name}'."
+            ) from exc
+        return llm
 
 
 def get_model_manager(app) -> ModelManager:
@@ -300,6 +1769,51 @@ def get_model_manager(app) -> ModelManager:
     manager: ModelManager | None = app.extensions.get("llm_manager")  # type: ignore[assignment]
     if manager is None:
         registry = app.config.get("AI_MODEL_REGISTRY", {})
-        manager = ModelManager(registry)
+        completion_cache = None
+        if app.config.get("AI_COMPLETION_CACHE_ENABLED", False):
+            completion_cache = CompletionCache(
+                max_entries=app.config.get("AI_COMPLETION_CACHE_SIZE", 256),
+                ttl=app.config.get("AI_COMPLETION_CACHE_TTL", 3600),
+                directory=app.config.get("AI_COMPLETION_CACHE_DIR") or None,
+            )
+        manager = ModelManager(
+            registry,
+            thread_budget=app.config.get("AI_THREAD_BUDGET"),
+            memory_budget_mb=app.config.get("AI_MEMORY_BUDGET_MB", 0),
+            completion_cache=completion_cache,
+            ram_budget_mb=app.config.get("AI_MODEL_RAM_BUDGET_MB", 0),
+        )
         app.extensions["llm_manager"] = manager
     return manager
+
+
+def generation_timeout(app, model_name: str) -> float:
+    """Seconds a generation with ``model_name`` may take: its registry override or AI_GENERATION_TIMEOUT."""
+    override = app.config.get("AI_MODEL_REGISTRY", {}).get(model_name, {}).get("timeout")
+    if override is not None:
+        return float(override)
+    return float(app.config.get("AI_GENERATION_TIMEOUT", 45))
+
+
+def preload_models_async(app) -> Optional[Thread]:
+    """Load (and warm) the models named in AI_PRELOAD_MODELS without blocking startup."""
+    names = [
+        app.config.get("AI_DEFAULT_MODEL") if name == "default" else name
+        for name in app.config.get("AI_PRELOAD_MODELS", [])
+    ]
+    names = [name for name in dict.fromkeys(names) if name]
+    if not names:
+        return None
+    manager = get_model_manager(app)
+    warmup = app.config.get("AI_PRELOAD_WARMUP", True)
+
+    def _preload():
+        for name in names:
+            try:
+                manager.preload(name, warmup=warmup)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Preloading model '%s' failed: %s", name, exc)
+
+    thread = Thread(target=_preload, name="llm-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,363 @@
+"""In-process metrics (histograms, counters, gauges, cache hit rates)."""
+from __future__ import annotations
+
+import math
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterator, Optional, Tuple
+
+METRIC_PREFIX = "neo_druidic_"
+
+# Latency buckets in seconds, from sub-millisecond scoring up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS = (1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key)
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+class Histogram:
+    """Cumulative bucket histogram plus a bounded window of recent samples for percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1024):
+        self.buckets = tuple(sorted(buckets))
+        self._bucket_counts = [0] * len(self.buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+            self._recent.append(value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._bucket_counts[i] += 1
+                    break
+
+    @staticmethod
+    def _percentile(ordered: list[float], fraction: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._recent)
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, self._bucket_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 6),
+                "avg": round(self._sum / self._count, 6) if self._count else 0.0,
+                "p50": round(self._percentile(ordered, 0.50), 6),
+                "p95": round(self._percentile(ordered, 0.95), 6),
+                "p99": round(self._percentile(ordered, 0.99), 6),
+                "max": round(self._max, 6),
+                "buckets": buckets,
+            }
+
+
+class MetricsRegistry:
+    """Named, labelled metric families shared by the whole process."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None) -> None:
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def histogram(self, name: str, **labels: object) -> Histogram:
+        key = _label_key(labels)
+        with self._lock:
+            family = self._histograms.setdefault(name, {})
+            histogram = family.get(key)
+            if histogram is None:
+                histogram = family[key] = Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            return histogram
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            family[key] = family.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = float(value)
+
+    def counter_value(self, name: str, **labels: object) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def histograms(self, name: str) -> Dict[LabelKey, Histogram]:
+        with self._lock:
+            return dict(self._histograms.get(name, {}))
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view of every metric family."""
+        with self._lock:
+            histograms = {name: dict(family) for name, family in self._histograms.items()}
+            counters = {name: dict(family) for name, family in self._counters.items()}
+            gauges = {name: dict(family) for name, family in self._gauges.items()}
+
+        def render(family: dict, convert) -> list[dict]:
+            return [
+                {"labels": dict(key), "value": convert(value)}
+                for key, value in sorted(family.items())
+            ]
+
+        return {
+            "histograms": {name: render(family, Histogram.snapshot) for name, family in histograms.items()},
+            "counters": {name: render(family, float) for name, family in counters.items()},
+            "gauges": {name: render(family, float) for name, family in gauges.items()},
+        }
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {name: dict(family) for name, family in self._histograms.items()}
+            counters = {name: dict(family) for name, family in self._counters.items()}
+            gauges = {name: dict(family) for name, family in self._gauges.items()}
+
+        lines: list[str] = []
+
+        def header(name: str, kind: str) -> str:
+            full = METRIC_PREFIX + name
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for name in sorted(counters):
+            full = header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{full}{_format_labels(key)} {value:g}")
+
+        for name in sorted(gauges):
+            full = header(name, "gauge")
+            for key, value in sorted(gauges[name].items()):
+                lines.append(f"{full}{_format_labels(key)} {value:g}")
+
+        for name in sorted(histograms):
+            full = header(name, "histogram")
+            for key, histogram in sorted(histograms[name].items()):
+                snap = histogram.snapshot()
+                for bound, count in snap["buckets"].items():
+                    le = bound if bound == "+Inf" else f"{float(bound):g}"
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', le))} {count}")
+                lines.append(f"{full}_sum{_format_labels(key)} {snap['sum']:g}")
+                lines.append(f"{full}_count{_format_labels(key)} {snap['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("insight_stage_seconds", "Latency of each RAG/insight pipeline stage")
+registry.describe("cache_requests_total", "Cache lookups by cache and result")
+registry.describe("inference_queue_wait_seconds", "Time a generation waited for a worker, replica or batch slot")
+registry.describe("inference_load_seconds", "Time a generation waited for its model to load")
+registry.describe("inference_prefill_seconds", "Prompt evaluation time until the first sampled token")
+registry.describe("inference_decode_seconds", "Time spent sampling completion tokens")
+registry.describe("inference_seconds", "End-to-end generation time including queueing and loading")
+registry.describe("inference_prefill_tokens", "Prompt tokens per generation", TOKEN_BUCKETS)
+registry.describe("inference_decode_tokens", "Completion tokens per generation", TOKEN_BUCKETS)
+registry.describe("inference_tokens_per_second", "Completion tokens per second of decoding", RATE_BUCKETS)
+registry.describe("prompt_tokens", "Tokens per section of assembled prompts, and the reply reserve", TOKEN_BUCKETS)
+registry.describe("prompt_context_total", "Context candidates kept whole, truncated or dropped to fit a prompt budget")
+
+INFERENCE_METRICS = (
+    "queue_wait_seconds",
+    "load_seconds",
+    "prefill_seconds",
+    "decode_seconds",
+    "seconds",
+    "prefill_tokens",
+    "decode_tokens",
+    "tokens_per_second",
+)
+
+# Queue wait of the job running on the current worker thread (set by the AI scheduler)
+_job_context = threading.local()
+
+
+@contextmanager
+def timed(name: str, **labels: object) -> Iterator[None]:
+    """Observe the wall-clock duration of the wrapped block."""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, perf_counter() - start, **labels)
+
+
+def stage_timer(stage: str):
+    """Time one stage of the RAG/insight pipeline."""
+    return timed("insight_stage_seconds", stage=stage)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    registry.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def queued_for(seconds: float) -> Iterator[None]:
+    """Mark the job run inside the block as having waited ``seconds`` in a queue."""
+    _job_context.queue_wait = seconds
+    try:
+        yield
+    finally:
+        _job_context.queue_wait = 0.0
+
+
+def current_queue_wait() -> float:
+    return getattr(_job_context, "queue_wait", 0.0)
+
+
+def record_inference(
+    provider: str,
+    model: str,
+    *,
+    total_seconds: float,
+    queue_wait: Optional[float] = None,
+    load_seconds: Optional[float] = None,
+    prefill_tokens: Optional[int] = None,
+    prefill_seconds: Optional[float] = None,
+    decode_tokens: Optional[int] = None,
+    decode_seconds: Optional[float] = None,
+) -> None:
+    """Observe one generation; parts a provider cannot measure are left as None and skipped."""
+    labels = {"provider": provider, "model": model}
+    values = {
+        "queue_wait_seconds": queue_wait,
+        "load_seconds": load_seconds,
+        "prefill_seconds": prefill_seconds,
+        "decode_seconds": decode_seconds,
+        "seconds": total_seconds,
+        "prefill_tokens": prefill_tokens,
+        "decode_tokens": decode_tokens,
+    }
+    if decode_tokens:
+        elapsed = decode_seconds if decode_seconds else total_seconds
+        if elapsed > 0:
+            values["tokens_per_second"] = decode_tokens / elapsed
+    for metric, value in values.items():
+        if value is not None:
+            registry.observe(f"inference_{metric}", value, **labels)
+
+
+def inference_summary() -> Dict[str, dict]:
+    """Per provider/model snapshots of every inference histogram."""
+    summary: Dict[str, dict] = {}
+    for metric in INFERENCE_METRICS:
+        for key, histogram in registry.histograms(f"inference_{metric}").items():
+            labels = dict(key)
+            entry = summary.setdefault(
+                f"{labels['provider']}/{labels['model']}",
+                {"provider": labels["provider"], "model": labels["model"]},
+            )
+            snapshot = histogram.snapshot()
+            snapshot.pop("buckets")
+            entry[metric] = snapshot
+    return summary
+
+
+def record_prompt(provider: str, model: str, sections: Dict[str, int], context: Dict[str, int]) -> None:
+    """Observe the token breakdown of one assembled prompt and what packing did to its context."""
+    for section, tokens in sections.items():
+        registry.observe("prompt_tokens", tokens, provider=provider, model=model, section=section)
+    for result, count in context.items():
+        if count:
+            registry.inc("prompt_context_total", count, provider=provider, model=model, result=result)
+
+
+def prompt_summary() -> Dict[str, dict]:
+    """Per provider/model snapshots of prompt tokens by section."""
+    summary: Dict[str, dict] = {}
+    for key, histogram in registry.histograms("prompt_tokens").items():
+        labels = dict(key)
+        entry = summary.setdefault(
+            f"{labels['provider']}/{labels['model']}",
+            {"provider": labels["provider"], "model": labels["model"]},
+        )
+        snapshot = histogram.snapshot()
+        snapshot.pop("buckets")
+        entry[labels["section"]] = snapshot
+    return summary
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Hit/miss totals and hit rate per named cache."""
+    stats: Dict[str, dict] = {}
+    for entry in registry.snapshot()["counters"].get("cache_requests_total", []):
+        labels = entry["labels"]
+        bucket = stats.setdefault(labels["cache"], {"hits": 0, "misses": 0})
+        bucket["hits" if labels["result"] == "hit" else "misses"] += int(entry["value"])
+    for bucket in stats.values():
+        total = bucket["hits"] + bucket["misses"]
+        bucket["hit_rate"] = round(bucket["hits"] / total, 4) if total else 0.0
+    return stats
+
+
+def process_memory() -> dict:
+    """Resident and peak memory of this process in bytes (best effort)."""
+    info: dict = {"rss_bytes": None, "max_rss_bytes": None}
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as handle:
+            resident_pages = int(handle.read().split()[1])
+        info["rss_bytes"] = resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        info["max_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        pass
+    return info
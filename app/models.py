@@ -376,6 +376,9 @@ class FileAsset(db.Model):
     original_name = db.Column(db.String(255), nullable=False)
     stored_name = db.Column(db.String(255), unique=True, nullable=False)
     mime_type = db.Column(db.String(128), nullable=True)
+    # Extractor kind and text encoding sniffed from the file content (see sniff_content)
+    detected_type = db.Column(db.String(16), nullable=True)
+    text_encoding = db.Column(db.String(32), nullable=True)
     size = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     share_token = db.Column(db.String(64), unique=True, nullable=True)
@@ -403,6 +406,27 @@ class FileAsset(db.Model):
         storage_root = current_app.config.get("STORAGE_ROOT", "storage")
         return str(Path(storage_root) / self.stored_name)
 
+    def sniff_content(self):
+        """
+        Detect which extractor this file needs from its leading bytes.
+
+        The result is stored on the row, so later reads skip detection.
+
+        Returns:
+            SniffResult, or None if the file cannot be read
+        """
+        from .document_extractor import SniffResult, sniff_file
+
+        if self.detected_type:
+            return SniffResult(self.detected_type, self.text_encoding)
+        try:
+            sniffed = sniff_file(self.physical_path)
+        except OSError:
+            return None
+        self.detected_type = sniffed.kind
+        self.text_encoding = sniffed.encoding
+        return sniffed
+
     def read_text_safe(self, encoding: str = "utf-8", max_size: int = 10 * 1024 * 1024) -> str:
         """
         Safely read file content as text with advanced extraction (PDFs, OCR, etc.).
@@ -441,7 +465,10 @@ class FileAsset(db.Model):
                 )
 
             # Use advanced document extractor (handles PDFs, images, etc.)
-            text = extract_text_from_file(str(path), self.mime_type)
+            # PDFs stop extracting (and OCRing) once the budget is reached
+            text = extract_text_from_file(
+                str(path), self.mime_type, max_chars=max_size, sniffed=self.sniff_content()
+            )
 
             # Truncate if needed
             if text and len(text) > max_size:
@@ -466,9 +493,26 @@ class DocumentEmbedding(db.Model):
     # Vector column - will be created as vector(384) when pgvector is installed
     # For now, store as JSON array until pgvector extension is enabled
     embedding = db.Column(db.Text, nullable=False)  # JSON array of floats
+    # MinHash signature (JSON array) used to fold near-duplicate chunks onto this one
+    minhash = db.Column(db.Text, nullable=True)
+    # Stored vector length and the projection that produced it (NULL = raw model output)
+    dimensions = db.Column(db.Integer, nullable=True)
+    projection_id = db.Column(db.Integer, db.ForeignKey("embedding_projections.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     file_asset = db.relationship("FileAsset", backref=db.backref("embeddings", cascade="all, delete-orphan", lazy="dynamic"))
+    stored_text = db.relationship(
+        "DocumentChunkText",
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    duplicate_links = db.relationship(
+        "DocumentChunkLink",
+        back_populates="representative",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     __table_args__ = (
         db.UniqueConstraint("file_asset_id", "chunk_index", name="uq_file_chunk"),
@@ -478,6 +522,108 @@ class DocumentEmbedding(db.Model):
         return f"<DocumentEmbedding file={self.file_asset_id} chunk={self.chunk_index}>"
 
 
+class DocumentSummary(db.Model):
+    """Compact per-file summary and its embedding for coarse (document-level) retrieval."""
+    __tablename__ = "document_summaries"
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_asset_id = db.Column(
+        db.Integer,
+        db.ForeignKey("file_assets.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    summary = db.Column(db.Text, nullable=False)
+    embedding = db.Column(db.Text, nullable=False)  # JSON array of floats
+    dimensions = db.Column(db.Integer, nullable=True)
+    projection_id = db.Column(db.Integer, db.ForeignKey("embedding_projections.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    file_asset = db.relationship(
+        "FileAsset",
+        backref=db.backref("summary", uselist=False, cascade="all, delete-orphan"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<DocumentSummary file={self.file_asset_id}>"
+
+
+class DocumentChunkText(db.Model):
+    """Compressed chunk text kept out of the vector table (content is then left empty)."""
+    __tablename__ = "document_chunk_texts"
+
+    embedding_id = db.Column(
+        db.Integer,
+        db.ForeignKey("document_embeddings.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    codec = db.Column(db.String(8), nullable=False)  # "zlib" or "zstd"
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<DocumentChunkText embedding={self.embedding_id} codec={self.codec}>"
+
+
+class EmbeddingProjection(db.Model):
+    """Dimensionality reduction applied to stored and query vectors (one active at a time)."""
+    __tablename__ = "embedding_projections"
+
+    id = db.Column(db.Integer, primary_key=True)
+    method = db.Column(db.String(16), nullable=False)  # "truncate" or "pca"
+    source_dimensions = db.Column(db.Integer, nullable=False)
+    dimensions = db.Column(db.Integer, nullable=False)
+    # JSON: {"mean": [...], "components": [[...], ...]} for PCA; empty for truncation
+    parameters = db.Column(db.Text, nullable=True)
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<EmbeddingProjection {self.method} {self.source_dimensions}->{self.dimensions}>"
+
+
+class DocumentChunkLink(db.Model):
+    """A chunk that was folded onto a near-identical representative DocumentEmbedding."""
+    __tablename__ = "document_chunk_links"
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_asset_id = db.Column(db.Integer, db.ForeignKey("file_assets.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    representative_id = db.Column(
+        db.Integer,
+        db.ForeignKey("document_embeddings.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    similarity = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    file_asset = db.relationship("FileAsset", backref=db.backref("chunk_links", cascade="all, delete-orphan", lazy="dynamic"))
+    representative = db.relationship("DocumentEmbedding", back_populates="duplicate_links")
+
+    __table_args__ = (
+        db.UniqueConstraint("file_asset_id", "chunk_index", name="uq_file_chunk_link"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<DocumentChunkLink file={self.file_asset_id} chunk={self.chunk_index} -> {self.representative_id}>"
+
+
+class ExtractionFailure(db.Model):
+    """Failed text extractions per file content, so poison files are not retried forever."""
+    __tablename__ = "extraction_failures"
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_sha256 = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    kind = db.Column(db.String(16), nullable=False)
+    file_name = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_failed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ExtractionFailure {self.content_sha256[:12]} attempts={self.attempts}>"
+
+
 class NeodMint(db.Model):
     __tablename__ = "neod_mints"
 
@@ -537,6 +683,10 @@ def ensure_file_schema() -> None:
             connection.execute(text("ALTER TABLE file_assets ADD COLUMN pos_x REAL DEFAULT 0"))
         if "pos_y" not in columns:
             connection.execute(text("ALTER TABLE file_assets ADD COLUMN pos_y REAL DEFAULT 0"))
+        if "detected_type" not in columns:
+            connection.execute(text("ALTER TABLE file_assets ADD COLUMN detected_type VARCHAR(16)"))
+        if "text_encoding" not in columns:
+            connection.execute(text("ALTER TABLE file_assets ADD COLUMN text_encoding VARCHAR(32)"))
 
         folder_columns = {col['name'] for col in inspector.get_columns('file_folders')}
         if "pos_x" not in folder_columns:
@@ -550,6 +700,28 @@ def ensure_file_schema() -> None:
         )
 
 
+def ensure_rag_schema() -> None:
+    """Ensure Knowledge Garden index columns/tables exist."""
+    engine = db.get_engine()
+    with engine.begin() as connection:
+        EmbeddingProjection.__table__.create(bind=connection, checkfirst=True)
+        DocumentEmbedding.__table__.create(bind=connection, checkfirst=True)
+        DocumentChunkLink.__table__.create(bind=connection, checkfirst=True)
+        DocumentChunkText.__table__.create(bind=connection, checkfirst=True)
+        DocumentSummary.__table__.create(bind=connection, checkfirst=True)
+        ExtractionFailure.__table__.create(bind=connection, checkfirst=True)
+
+        inspector = sa.inspect(engine)
+        columns = {col['name'] for col in inspector.get_columns('document_embeddings')}
+
+        if "minhash" not in columns:
+            connection.execute(text("ALTER TABLE document_embeddings ADD COLUMN minhash TEXT"))
+        if "dimensions" not in columns:
+            connection.execute(text("ALTER TABLE document_embeddings ADD COLUMN dimensions INTEGER"))
+        if "projection_id" not in columns:
+            connection.execute(text("ALTER TABLE document_embeddings ADD COLUMN projection_id INTEGER"))
+
+
 def ensure_user_schema() -> None:
     """Add role/status metadata to users for admin and approval controls."""
     engine = db.get_engine()
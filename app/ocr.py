@@ -0,0 +1,435 @@
+"""Process-local pool of reusable OCR engines (PaddleOCR)."""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import multiprocessing
+import os
+import queue
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache
+from threading import Lock, Thread
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+# Rasterization resolution for scanned PDF pages
+OCR_DPI = 200
+
+
+def _create_paddle_engine():
+    from paddleocr import PaddleOCR
+
+    return PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+
+
+def paddle_result_text(result) -> str:
+    """Flatten a PaddleOCR result for one image into a line of text."""
+    if result and result[0]:
+        return ' '.join([line[1][0] for line in result[0]])
+    return ''
+
+
+class PooledEngine:
+    """One OCR engine plus the bookkeeping the pool needs to recycle it."""
+
+    def __init__(self, engine: Any):
+        self.engine = engine
+        self.pages = 0
+        self.healthy = True
+
+    def ocr(self, image) -> str:
+        """OCR one image (file path or ndarray) and return its text."""
+        if image is None:
+            return ''
+        result = self.engine.ocr(image, cls=True)
+        self.pages += 1
+        return paddle_result_text(result)
+
+
+class OCREnginePool:
+    """
+    Bounded pool of lazily created OCR engines.
+
+    Engines are created on first checkout (up to size) and reused afterwards,
+    so detection/recognition models are loaded once per worker process rather
+    than once per file. An engine is dropped and later replaced when it raised
+    during use or after it has processed recycle_pages pages, which keeps
+    native-memory leaks in long-running workers bounded.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        recycle_pages: int = 500,
+        factory: Callable[[], Any] = _create_paddle_engine,
+    ):
+        self.size = max(1, size)
+        self.recycle_pages = max(0, recycle_pages)
+        self._factory = factory
+        self._idle: "queue.LifoQueue[PooledEngine]" = queue.LifoQueue()
+        self._lock = Lock()
+        self._created = 0
+        self.recycled = 0
+
+    def _acquire(self, timeout: Optional[float]) -> PooledEngine:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                engine = self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            logger.info("Created OCR engine (%d/%d in pool)", self._created, self.size)
+            return PooledEngine(engine)
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No OCR engine became available") from None
+
+    def _release(self, pooled: PooledEngine) -> None:
+        worn_out = self.recycle_pages and pooled.pages >= self.recycle_pages
+        if pooled.healthy and not worn_out:
+            self._idle.put(pooled)
+            return
+        with self._lock:
+            self._created -= 1
+            self.recycled += 1
+        logger.info(
+            "Recycling OCR engine after %d pages (%s)",
+            pooled.pages,
+            "unhealthy" if not pooled.healthy else "page limit",
+        )
+        pooled.engine = None
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None) -> Iterator[PooledEngine]:
+        """Borrow an engine; it is marked unhealthy (and recycled) if the block raises."""
+        pooled = self._acquire(timeout)
+        try:
+            yield pooled
+        except Exception:
+            pooled.healthy = False
+            raise
+        finally:
+            self._release(pooled)
+
+    def ocr(self, image) -> str:
+        """OCR a single image with a pooled engine."""
+        with self.checkout() as pooled:
+            return pooled.ocr(image)
+
+    def ocr_many(self, images: Iterable) -> Iterator[str]:
+        """OCR a batch of images, keeping one engine checked out across the batch."""
+        iterator = iter(images)
+        pending = next(iterator, _END)
+        while pending is not _END:
+            with self.checkout() as pooled:
+                while pending is not _END:
+                    text = pooled.ocr(pending)
+                    pending = next(iterator, _END)
+                    yield text
+                    if self.recycle_pages and pooled.pages >= self.recycle_pages:
+                        break
+
+    def warm(self) -> None:
+        """Create every engine up front and run a blank page through it as a health check."""
+        try:
+            import numpy as np
+
+            probe = np.full((64, 256, 3), 255, dtype=np.uint8)
+        except ImportError:
+            probe = None
+
+        engines = []
+        try:
+            for _ in range(self.size):
+                pooled = self._acquire(timeout=0)
+                engines.append(pooled)
+                if probe is not None:
+                    try:
+                        pooled.engine.ocr(probe, cls=True)
+                    except Exception as exc:
+                        logger.warning("OCR engine failed its warm-up check: %s", exc)
+                        pooled.healthy = False
+        except TimeoutError:
+            pass
+        finally:
+            for pooled in engines:
+                self._release(pooled)
+        logger.info("Warmed %d OCR engine(s)", len(engines))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "recycled": self.recycled,
+                "recycle_pages": self.recycle_pages,
+            }
+
+
+_settings = {
+    "size": Config.OCR_POOL_SIZE,
+    "recycle_pages": Config.OCR_RECYCLE_PAGES,
+    "workers": Config.OCR_WORKERS,
+}
+_pool: Optional[OCREnginePool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = Lock()
+
+_page_executor: Optional[ProcessPoolExecutor] = None
+_page_executor_lock = Lock()
+
+
+def configure_ocr_pool(size: int, recycle_pages: int, workers: Optional[int] = None) -> None:
+    """Set the size/recycling policy (and page worker count) used by this process."""
+    global _pool
+    with _pool_lock:
+        _settings["size"] = size
+        _settings["recycle_pages"] = recycle_pages
+        if workers is not None:
+            _settings["workers"] = workers
+        if _pool is not None and (_pool.size, _pool.recycle_pages) != (max(1, size), max(0, recycle_pages)):
+            _pool = None
+
+
+def get_ocr_pool() -> OCREnginePool:
+    """The OCR engine pool of the current process (a forked child builds its own)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = OCREnginePool(size=_settings["size"], recycle_pages=_settings["recycle_pages"])
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_ocr_pool_async() -> Optional[Thread]:
+    """Load OCR models in the background so the first scanned upload does not pay for it."""
+    try:
+        import paddleocr  # noqa: F401
+    except ImportError:
+        logger.info("PaddleOCR not installed; skipping OCR warm-up")
+        return None
+
+    def _warm():
+        try:
+            get_ocr_pool().warm()
+        except Exception as exc:
+            logger.warning("OCR warm-up failed: %s", exc)
+
+    thread = Thread(target=_warm, name="ocr-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def pdf_page_count(file_path: str) -> int:
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(file_path)["Pages"])
+
+
+def rasterize_page(file_path: str, page_number: int, dpi: int = OCR_DPI):
+    """Render a single PDF page (1-based) to a PIL image, or None if it has no pixels."""
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(file_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return images[0] if images else None
+
+
+def image_to_array(image):
+    """PIL image -> BGR uint8 ndarray, the layout PaddleOCR expects for in-memory input."""
+    import numpy as np
+
+    return np.asarray(image.convert("RGB"))[:, :, ::-1]
+
+
+@lru_cache(maxsize=None)
+def _paddle_available() -> bool:
+    return importlib.util.find_spec("paddleocr") is not None
+
+
+@lru_cache(maxsize=None)
+def ocr_available() -> bool:
+    """Whether scanned pages can be OCRed at all (a rasterizer plus an OCR engine)."""
+    find_spec = importlib.util.find_spec
+    return find_spec("pdf2image") is not None and (
+        _paddle_available() or find_spec("pytesseract") is not None
+    )
+
+
+def ocr_page_image(image) -> str:
+    """
+    OCR an already rasterized page.
+
+    PaddleOCR (pooled engine) runs first; Tesseract gets the same image only if
+    Paddle is unavailable or finds nothing, so a page is never rendered twice.
+    """
+    text = ''
+    if _paddle_available():
+        try:
+            text = get_ocr_pool().ocr(image_to_array(image))
+        except Exception as exc:
+            logger.warning("PaddleOCR failed on page: %s", exc)
+    if not text.strip():
+        try:
+            import pytesseract
+
+            text = pytesseract.image_to_string(image) or ''
+        except ImportError:
+            pass
+        except Exception as exc:
+            logger.warning("Tesseract failed on page: %s", exc)
+    return text
+
+
+def _ocr_pdf_page(file_path: str, page_number: int, dpi: int) -> str:
+    """Rasterize and OCR one page; runs inside a page worker process."""
+    image = rasterize_page(file_path, page_number, dpi)
+    if image is None:
+        return ''
+    return ocr_page_image(image)
+
+
+def _page_worker_init(recycle_pages: int) -> None:
+    # Each worker keeps exactly one engine warm across the pages it is handed
+    configure_ocr_pool(1, recycle_pages)
+
+
+def _get_page_executor(workers: int) -> ProcessPoolExecutor:
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            # spawn: forking a process that holds Flask, DB and model threads is not safe
+            _page_executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_page_worker_init,
+                initargs=(_settings["recycle_pages"],),
+            )
+            logger.info("Started %d OCR page workers", workers)
+        return _page_executor
+
+
+def _reset_page_executor() -> None:
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is not None:
+            _page_executor.shutdown(wait=False, cancel_futures=True)
+            _page_executor = None
+
+
+def ordered_pages(
+    jobs: Iterable[tuple[int, Optional[str]]],
+    file_path: str,
+    dpi: int = OCR_DPI,
+    workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[tuple[int, str, bool]]:
+    """
+    Yield page texts in page order, OCRing the pages that need it.
+
+    jobs is consumed lazily and yields (page_number, text), with text None for
+    pages that must be OCRed. Those pages are rasterized and OCRed one page per
+    task inside the workers, straight from memory. At most two OCR pages per
+    worker are in flight, so memory stays bounded on very long scans. With a
+    single worker, OCR runs in this process. Closing the generator early
+    cancels the outstanding pages.
+
+    Args:
+        jobs: (page_number, text or None) in page order
+        file_path: Path to the PDF
+        dpi: Rasterization resolution
+        workers: Number of page workers (defaults to NEO_DRUIDIC_OCR_WORKERS)
+        executor: Executor to run OCR pages on (defaults to the shared process pool)
+
+    Yields:
+        (page_number, text, was_ocred)
+    """
+    workers = _settings["workers"] if workers is None else workers
+    if executor is None and workers > 1:
+        executor = _get_page_executor(workers)
+    max_in_flight = max(1, workers) * 2
+
+    window: deque = deque()  # [page_number, text or Future, was_ocred]
+    in_flight = 0
+
+    def pop_head() -> tuple[int, str, bool]:
+        nonlocal in_flight
+        page_number, value, ocred = window.popleft()
+        if isinstance(value, Future):
+            in_flight -= 1
+            try:
+                value = value.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as exc:
+                logger.warning("OCR failed on page %d of %s: %s", page_number, file_path, exc)
+                value = ''
+        return page_number, value, ocred
+
+    try:
+        for page_number, text in jobs:
+            if text is not None:
+                window.append((page_number, text, False))
+            elif executor is None:
+                try:
+                    text = _ocr_pdf_page(file_path, page_number, dpi)
+                except Exception as exc:
+                    logger.warning("OCR failed on page %d of %s: %s", page_number, file_path, exc)
+                    text = ''
+                window.append((page_number, text, True))
+            else:
+                while in_flight >= max_in_flight:
+                    yield pop_head()
+                window.append((page_number, executor.submit(_ocr_pdf_page, file_path, page_number, dpi), True))
+                in_flight += 1
+
+            while window and not (isinstance(window[0][1], Future) and not window[0][1].done()):
+                yield pop_head()
+
+        while window:
+            yield pop_head()
+    except BrokenProcessPool:
+        logger.error("OCR page worker died while processing %s; restarting workers", file_path)
+        _reset_page_executor()
+        raise
+    finally:
+        for _, value, _ in window:
+            if isinstance(value, Future):
+                value.cancel()
+
+
+def ocr_pdf_pages(
+    file_path: str,
+    dpi: int = OCR_DPI,
+    workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> list[str]:
+    """
+    OCR every page of a PDF, one text per page in page order (see ordered_pages).
+
+    Returns:
+        List of page texts ('' for pages without recognised text)
+    """
+    page_count = pdf_page_count(file_path)
+    jobs = ((page_number, None) for page_number in range(1, page_count + 1))
+    return [text for _, text, _ in ordered_pages(jobs, file_path, dpi, workers, executor)]
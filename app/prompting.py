@@ -0,0 +1,218 @@
+"""Token-budgeted prompt assembly for the local models and the remote provider."""
+from __future__ import annotations
+
+import logging
+import math
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import record_prompt
+
+logger = logging.getLogger(__name__)
+
+TokenCounter = Callable[[str], int]
+
+# A sentence ends at ., ! or ? (optionally closed by a quote or bracket) followed by whitespace
+_SENTENCE_END = re.compile(r"[.!?…][\"'”’)\]]*\s+")
+_WORD = re.compile(r"\w+")
+# Role markers the chat template wraps around the system and user messages
+_CHAT_TEMPLATE_TOKENS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count when no tokenizer is at hand: ~4 characters per token, at least one per word."""
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(text.split()))
+
+
+@lru_cache(maxsize=8)
+def _tiktoken_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def openai_token_counter(model: str) -> TokenCounter:
+    """Exact counts for an OpenAI model when tiktoken is installed, otherwise the estimate."""
+    encoding = _tiktoken_encoding(model)
+    if encoding is None:
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def local_token_counter(app, model_name: str) -> TokenCounter:
+    """Count with the loaded model's own vocabulary; estimate while it is not loaded yet."""
+    from .llm import get_model_manager
+
+    return get_model_manager(app).token_counter(model_name) or estimate_tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count: TokenCounter) -> str:
+    """
+    Longest prefix of ``text`` made of whole sentences that fits in ``max_tokens``.
+
+    Falls back to whole words when even the first sentence is too long.
+    """
+    text = text.strip()
+    if max_tokens <= 0 or not text:
+        return ""
+    if count(text) <= max_tokens:
+        return text
+
+    cut = 0
+    used = 0
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        used += count(text[start:match.end()])
+        if used > max_tokens:
+            break
+        cut = start = match.end()
+    if cut:
+        return text[:cut].rstrip()
+
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(" ".join(words[:middle])) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+
+def lexical_overlap(query: str, text: str) -> float:
+    """Share of the query's distinct words that also appear in ``text`` (0-1)."""
+    wanted = {word.lower() for word in _WORD.findall(query) if len(word) > 2}
+    if not wanted:
+        return 0.0
+    found = {word.lower() for word in _WORD.findall(text)}
+    return len(wanted & found) / len(wanted)
+
+
+class PromptBudget:
+    """
+    Token accounting for one prompt against a model's context window.
+
+    ``reserve_output`` tokens are held back for the reply. Parts that must go
+    in whole are charged with add(); fit() takes as much of a part as still
+    fits; pack() fills what is left with the highest-scoring context, cutting
+    the last piece at a sentence boundary. ``max_context`` additionally caps
+    the tokens spent on packed context. record() reports the breakdown.
+    """
+
+    def __init__(
+        self,
+        count: TokenCounter,
+        context_window: int,
+        reserve_output: int,
+        *,
+        max_context: Optional[int] = None,
+    ):
+        self.count = count
+        self.context_window = context_window
+        self.reserve_output = reserve_output
+        self.max_context = max_context
+        self.sections: Dict[str, int] = {}
+        self.context_results = {"kept": 0, "truncated": 0, "dropped": 0}
+
+    @property
+    def used(self) -> int:
+        return sum(self.sections.values())
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.context_window - self.reserve_output - self.used)
+
+    def charge(self, section: str, tokens: int) -> None:
+        """Charge a known number of tokens, such as fixed template markup."""
+        self.sections[section] = self.sections.get(section, 0) + tokens
+
+    def add(self, section: str, text: str) -> str:
+        """Charge text that goes into the prompt unchanged."""
+        self.charge(section, self.count(text))
+        return text
+
+    def fit(self, section: str, text: str) -> str:
+        """Charge as much of ``text`` as fits, cut at a sentence boundary."""
+        kept = truncate_to_tokens(text, self.remaining, self.count)
+        if kept != text.strip():
+            logger.info("Cut %s to %d tokens to fit the prompt budget", section, self.count(kept))
+        self.charge(section, self.count(kept))
+        return kept
+
+    def pack(
+        self,
+        section: str,
+        candidates: Sequence[Tuple[float, str, str]],
+        *,
+        overhead: str = "",
+        min_tokens: int = 24,
+    ) -> List[Optional[str]]:
+        """
+        Fit scored context into the budget, best first.
+
+        Each candidate is ``(score, header, body)``. A kept candidate costs its
+        header plus as much of its body as fits; a body that would be cut to
+        fewer than ``min_tokens`` tokens is dropped instead. ``overhead`` (a
+        preamble or closing instruction) is charged only if something is kept.
+        Returns the body to use for each candidate in input order, or None
+        where it was dropped.
+        """
+        available = self.remaining
+        if self.max_context is not None:
+            available = min(available, self.max_context - self.sections.get(section, 0))
+        overhead_tokens = self.count(overhead) if overhead else 0
+        available -= overhead_tokens
+
+        packed: List[Optional[str]] = [None] * len(candidates)
+        spent = 0
+        for index in sorted(range(len(candidates)), key=lambda position: candidates[position][0], reverse=True):
+            _, header, body = candidates[index]
+            room = available - spent - (self.count(header) if header else 0)
+            body_tokens = self.count(body)
+            if body_tokens <= room:
+                kept, outcome = body, "kept"
+            else:
+                kept = truncate_to_tokens(body, room, self.count) if room >= min_tokens else ""
+                if not kept:
+                    self.context_results["dropped"] += 1
+                    continue
+                body_tokens, outcome = self.count(kept), "truncated"
+            packed[index] = kept
+            spent += body_tokens + (self.count(header) if header else 0)
+            self.context_results[outcome] += 1
+
+        if spent:
+            self.charge(section, spent + overhead_tokens)
+        return packed
+
+    def record(self, provider: str, model: str) -> None:
+        record_prompt(
+            provider,
+            model,
+            dict(self.sections, reserved_output=self.reserve_output),
+            self.context_results,
+        )
+
+
+def local_prompt_budget(app, model_name: str, *, max_context: Optional[int] = None) -> PromptBudget:
+    """Budget for a local model's window and reply length, with its system prompt already charged."""
+    settings = app.config.get("AI_MODEL_REGISTRY", {}).get(model_name, {})
+    budget = PromptBudget(
+        local_token_counter(app, model_name),
+        int(settings.get("context_window") or app.config.get("AI_CONTEXT_WINDOW", 2048)),
+        int(settings.get("max_tokens") or 128),
+        max_context=max_context,
+    )
+    budget.charge("template", _CHAT_TEMPLATE_TOKENS)
+    if settings.get("system_prompt"):
+        budget.add("system", settings["system_prompt"])
+    return budget
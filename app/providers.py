@@ -0,0 +1,244 @@
+"""Shared, fault-tolerant client for the remote (OpenAI-compatible) model provider."""
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Optional, TypeVar
+
+from .metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+metrics_registry.describe("provider_requests_total", "Remote provider calls by operation and outcome")
+metrics_registry.describe("provider_circuit_open", "1 while the remote provider's circuit breaker is open")
+
+
+class ProviderUnavailable(RuntimeError):
+    """The remote provider is not configured or its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    are refused for ``reset_after`` seconds. Then one trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in the half-open state only one trial is allowed."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if monotonic() - self._opened_at < self.reset_after or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this one opened the circuit."""
+        with self._lock:
+            self._failures += 1
+            reopened = self._trial_running
+            self._trial_running = False
+            if reopened or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = monotonic()
+                return True
+            return False
+
+
+class OpenAIProvider:
+    """
+    One pooled OpenAI client shared by insight generation and RAG embeddings.
+
+    Every call gets its own timeout, so a slow API fails over to the local model
+    within a known deadline rather than the SDK default. The SDK's own retries
+    are off, because the circuit breaker and the local fallback handle failures.
+    Idempotent calls can be hedged: if no answer arrives within ``hedge_after``
+    seconds, an identical second request is sent and the first answer to
+    arrive wins.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        *,
+        base_url: Optional[str] = None,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        hedge_after: float = 0.0,
+        breaker: Optional[CircuitBreaker] = None,
+        client: Any = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url or None
+        self.timeout = timeout
+        self.max_connections = max(1, max_connections)
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._client = client
+        self._client_lock = Lock()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key) or self._client is not None
+
+    @property
+    def available(self) -> bool:
+        """Configured and not known to be failing; checking does not use up a half-open trial."""
+        return self.configured and self.breaker.state != "open"
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                if not self.api_key:
+                    raise ProviderUnavailable("OPENAI_API_KEY environment variable not set")
+                import httpx
+                import openai
+
+                self._client = openai.OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0,
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                    ),
+                )
+            return self._client
+
+    def call(
+        self,
+        operation: str,
+        request: Callable[[Any], T],
+        *,
+        timeout: Optional[float] = None,
+        hedge: bool = False,
+    ) -> T:
+        """Run ``request(client)`` under the breaker with a per-call timeout (hedged if asked)."""
+        if not self.configured:
+            raise ProviderUnavailable("OPENAI_API_KEY environment variable not set")
+        if not self.breaker.allow():
+            metrics_registry.inc("provider_requests_total", provider="openai", operation=operation, result="skipped")
+            raise ProviderUnavailable("OpenAI circuit breaker is open")
+
+        client = self.client
+        with_options = getattr(client, "with_options", None)
+        if with_options is not None:
+            client = with_options(timeout=timeout or self.timeout)
+        try:
+            if hedge and self.hedge_after > 0:
+                result = self._hedged(operation, lambda: request(client))
+            else:
+                result = request(client)
+        except Exception:
+            metrics_registry.inc("provider_requests_total", provider="openai", operation=operation, result="error")
+            if self.breaker.record_failure():
+                logger.warning(
+                    "OpenAI circuit opened after repeated failures; skipping it for %.0fs", self.breaker.reset_after
+                )
+                metrics_registry.set_gauge("provider_circuit_open", 1, provider="openai")
+            raise
+        if self.breaker.state != "closed":
+            logger.info("OpenAI circuit closed again")
+        self.breaker.record_success()
+        metrics_registry.set_gauge("provider_circuit_open", 0, provider="openai")
+        metrics_registry.inc("provider_requests_total", provider="openai", operation=operation, result="ok")
+        return result
+
+    def _hedged(self, operation: str, send: Callable[[], T]) -> T:
+        with self._client_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=self.max_connections, thread_name_prefix="openai-hedge"
+                )
+        primary = self._hedge_pool.submit(send)
+        try:
+            return primary.result(timeout=self.hedge_after)
+        except FutureTimeout:
+            pass
+        metrics_registry.inc("provider_requests_total", provider="openai", operation=operation, result="hedged")
+        backup = self._hedge_pool.submit(send)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        # The first to finish failed; the other one is the last chance
+        return (backup if primary in done else primary).result()
+
+    def chat(self, *, timeout: Optional[float] = None, **kwargs: Any):
+        return self.call(
+            "chat", lambda client: client.chat.completions.create(**kwargs), timeout=timeout, hedge=True
+        )
+
+    def chat_stream(self, *, timeout: Optional[float] = None, **kwargs: Any):
+        """Open a streamed chat completion (never hedged: a stream cannot be raced and discarded)."""
+        return self.call(
+            "chat_stream", lambda client: client.chat.completions.create(stream=True, **kwargs), timeout=timeout
+        )
+
+    def embed(self, *, timeout: Optional[float] = None, **kwargs: Any):
+        return self.call(
+            "embeddings", lambda client: client.embeddings.create(**kwargs), timeout=timeout, hedge=True
+        )
+
+
+_provider: Optional[OpenAIProvider] = None
+_provider_pid: Optional[int] = None
+_provider_lock = Lock()
+
+
+def get_openai_provider() -> OpenAIProvider:
+    """The process-wide provider, configured from the current app (or the environment outside one)."""
+    global _provider, _provider_pid
+    from flask import current_app, has_app_context
+
+    config = current_app.config if has_app_context() else {}
+    with _provider_lock:
+        # HTTP connections do not survive a fork, so each worker process builds its own client
+        if _provider is None or _provider_pid != os.getpid():
+            _provider = OpenAIProvider(
+                os.environ.get("OPENAI_API_KEY"),
+                base_url=config.get("AI_OPENAI_BASE_URL") or os.environ.get("OPENAI_BASE_URL"),
+                timeout=config.get("AI_OPENAI_TIMEOUT", 10.0),
+                max_connections=config.get("AI_OPENAI_MAX_CONNECTIONS", 20),
+                hedge_after=config.get("AI_OPENAI_HEDGE_AFTER", 0.0),
+                breaker=CircuitBreaker(
+                    failure_threshold=config.get("AI_OPENAI_BREAKER_FAILURES", 5),
+                    reset_after=config.get("AI_OPENAI_BREAKER_RESET", 30.0),
+                ),
+            )
+            _provider_pid = os.getpid()
+        return _provider
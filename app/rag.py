@@ -1,18 +1,561 @@
 """RAG (Retrieval Augmented Generation) service for Knowledge Garden."""
 from __future__ import annotations
 
+import heapq
 import json
 import logging
+import zlib
+from collections import OrderedDict, defaultdict
+from threading import Lock
 from typing import Optional
 
-from flask import Flask
+import sqlalchemy as sa
+from flask import Flask, current_app
 from sqlalchemy import and_
+from sqlalchemy.orm import defer, joinedload
 
-from .embeddings import cosine_similarity, generate_embedding
-from .models import DocumentEmbedding, FileAsset, db
+from .dedup import NearDuplicateIndex, minhash_signature, serialize_signature
+from .embeddings import (
+    EMBEDDING_DIMENSIONS,
+    chunk_text,
+    cosine_similarity,
+    fit_pca,
+    generate_embedding,
+    pca_project,
+    summarize_text,
+    truncate_embedding,
+)
+from .extraction_cache import get_extraction_cache
+from .metrics import record_cache, registry, stage_timer
+from .prompting import PromptBudget
+from .models import (
+    DocumentChunkLink,
+    DocumentChunkText,
+    DocumentEmbedding,
+    DocumentSummary,
+    EmbeddingProjection,
+    FileAsset,
+    db,
+)
 
 logger = logging.getLogger(__name__)
 
+# Recent query embeddings (raw model output) so repeated questions skip the API
+QUERY_EMBEDDING_CACHE_SIZE = 256
+_query_embedding_cache: "OrderedDict[str, list[float]]" = OrderedDict()
+_query_embedding_lock = Lock()
+
+# Rough in-memory cost of one float inside a parsed Python list (float object + pointer)
+_PY_FLOAT_BYTES = 32
+
+# Upper bound on the number of stored vectors sampled when fitting a PCA projection
+PCA_SAMPLE_SIZE = 4096
+
+# Parsed PCA parameters keyed by projection identity (they are immutable once stored)
+_projection_parameters: dict[tuple, dict] = {}
+
+
+def get_active_projection() -> Optional[EmbeddingProjection]:
+    """Return the projection the stored index was built with (None = full vectors)."""
+    return (
+        EmbeddingProjection.query.filter_by(is_active=True)
+        .order_by(EmbeddingProjection.id.desc())
+        .first()
+    )
+
+
+def apply_projection(embedding: list[float], projection: Optional[EmbeddingProjection]) -> list[float]:
+    """Reduce a full embedding with the given projection (no-op for None)."""
+    if projection is None:
+        return embedding
+    if projection.method == "pca":
+        cache_key = (projection.id, projection.created_at)
+        parameters = _projection_parameters.get(cache_key)
+        if parameters is None:
+            parameters = json.loads(projection.parameters or "{}")
+            if projection.id is not None:
+                _projection_parameters[cache_key] = parameters
+        return pca_project(embedding, parameters["mean"], parameters["components"])
+    return truncate_embedding(embedding, projection.dimensions)
+
+
+def _target_projection() -> tuple[str, int]:
+    """Projection method and size requested by configuration (0 = full vectors)."""
+    method = current_app.config.get("RAG_EMBEDDING_PROJECTION", "truncate")
+    dimensions = int(current_app.config.get("RAG_EMBEDDING_DIMENSIONS", 0) or 0)
+    if method not in ("truncate", "pca"):
+        logger.warning("Unknown embedding projection '%s'; using truncation", method)
+        method = "truncate"
+    if dimensions <= 0 or dimensions >= EMBEDDING_DIMENSIONS:
+        return method, 0
+    return method, dimensions
+
+
+def _activate_projection(projection: Optional[EmbeddingProjection]) -> None:
+    EmbeddingProjection.query.filter(EmbeddingProjection.is_active.is_(True)).update(
+        {"is_active": False}, synchronize_session=False
+    )
+    if projection is not None:
+        projection.is_active = True
+        db.session.add(projection)
+    db.session.commit()
+
+
+def prepare_index_projection() -> Optional[EmbeddingProjection]:
+    """
+    Pick the projection new chunks should be stored with.
+
+    Switching to truncation (or back to full vectors) takes effect immediately.
+    A PCA projection has to be fitted on full vectors first, so until
+    finalize_index_projection() has run, new chunks are stored at full size.
+    """
+    method, dimensions = _target_projection()
+    active = get_active_projection()
+
+    if dimensions == 0:
+        if active is not None:
+            logger.info("Embedding projection disabled; new chunks store full vectors")
+            _activate_projection(None)
+            _warn_stale_vectors(None)
+        return None
+
+    if active is not None and active.method == method and active.dimensions == dimensions:
+        return active
+
+    if method == "truncate":
+        projection = EmbeddingProjection(
+            method="truncate",
+            source_dimensions=EMBEDDING_DIMENSIONS,
+            dimensions=dimensions,
+        )
+        _activate_projection(projection)
+        logger.info("Activated truncation projection to %d dims", dimensions)
+        _reproject_stored_vectors(projection)
+        _warn_stale_vectors(projection)
+        return projection
+
+    # Queries must not keep using the old projection while new chunks are stored at full size
+    if active is not None:
+        logger.info("PCA projection pending; new chunks store full vectors until it is fitted")
+        _activate_projection(None)
+        _warn_stale_vectors(None)
+    return None
+
+
+def _full_vector_rows(limit: Optional[int] = None, model=DocumentEmbedding):
+    """Stored rows still holding raw model output (legacy rows have no dimensions)."""
+    query = model.query.filter(
+        model.projection_id.is_(None),
+        sa.or_(
+            model.dimensions.is_(None),
+            model.dimensions == EMBEDDING_DIMENSIONS,
+        ),
+    ).order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def finalize_index_projection() -> Optional[EmbeddingProjection]:
+    """
+    Fit a pending PCA projection and reduce every full-size stored vector.
+
+    Returns:
+        The active projection after finalizing (None = full vectors)
+    """
+    method, dimensions = _target_projection()
+    active = get_active_projection()
+
+    if method == "pca" and dimensions and not (
+        active is not None and active.method == "pca" and active.dimensions == dimensions
+    ):
+        sample = []
+        for row in _full_vector_rows(limit=PCA_SAMPLE_SIZE):
+            vector = json.loads(row.embedding)
+            if len(vector) == EMBEDDING_DIMENSIONS:
+                sample.append(vector)
+        try:
+            mean, components = fit_pca(sample, dimensions)
+        except ImportError:
+            logger.error("PCA projection requires numpy; keeping full-size vectors")
+            return active
+        except ValueError as exc:
+            logger.warning("Skipping PCA fit: %s", exc)
+            return active
+        active = EmbeddingProjection(
+            method="pca",
+            source_dimensions=EMBEDDING_DIMENSIONS,
+            dimensions=dimensions,
+            parameters=json.dumps({"mean": mean, "components": components}),
+        )
+        _activate_projection(active)
+        logger.info("Fitted PCA projection to %d dims on %d vectors", dimensions, len(sample))
+
+    if active is None:
+        return None
+
+    _reproject_stored_vectors(active)
+    _warn_stale_vectors(active)
+    return active
+
+
+def _reproject_stored_vectors(projection: EmbeddingProjection) -> int:
+    """
+    Reduce every stored vector that still holds more than the projection keeps.
+
+    Full-size rows can take any projection; rows from a wider truncation can be
+    cut down further, since truncating twice keeps the same leading dims.
+    """
+    wider = []
+    if projection.method == "truncate":
+        wider = [
+            row.id
+            for row in EmbeddingProjection.query.filter(
+                EmbeddingProjection.method == "truncate",
+                EmbeddingProjection.dimensions > projection.dimensions,
+                EmbeddingProjection.id != projection.id,
+            )
+        ]
+
+    reprojected = 0
+    for model in (DocumentEmbedding, DocumentSummary):
+        while True:
+            batch = _full_vector_rows(limit=500, model=model).all()
+            if wider:
+                batch += model.query.filter(model.projection_id.in_(wider)).order_by(model.id).limit(500).all()
+            if not batch:
+                break
+            for row in batch:
+                vector = json.loads(row.embedding)
+                if row.projection_id is None and len(vector) != projection.source_dimensions:
+                    # Unknown origin; leave it for the next re-index but stop matching it here
+                    row.dimensions = len(vector)
+                    continue
+                reduced = apply_projection(vector, projection)
+                row.embedding = json.dumps(reduced)
+                row.dimensions = len(reduced)
+                row.projection_id = projection.id
+                reprojected += 1
+            db.session.commit()
+
+    if reprojected:
+        logger.info(
+            "Projected %d stored vectors to %d dims (%s)", reprojected, projection.dimensions, projection.method
+        )
+    return reprojected
+
+
+def stale_vector_count(projection: Optional[EmbeddingProjection]) -> int:
+    """Count stored chunk and summary vectors that queries under this projection cannot match."""
+    count = 0
+    for model in (DocumentEmbedding, DocumentSummary):
+        if projection is None:
+            stale = sa.or_(
+                model.projection_id.isnot(None),
+                sa.and_(model.dimensions.isnot(None), model.dimensions != EMBEDDING_DIMENSIONS),
+            )
+        else:
+            stale = sa.or_(model.projection_id.is_(None), model.projection_id != projection.id)
+        count += model.query.filter(stale).count()
+    return count
+
+
+def _warn_stale_vectors(projection: Optional[EmbeddingProjection]) -> None:
+    stale = stale_vector_count(projection)
+    if stale:
+        logger.warning(
+            "%d stored vectors cannot be converted to the new projection and are skipped by queries; "
+            "re-index to restore them",
+            stale,
+        )
+
+
+def embedding_dimension_counts() -> dict[str, int]:
+    """Count stored chunks per vector size so mixed index states are visible."""
+    counts: dict[str, int] = {}
+    rows = db.session.query(DocumentEmbedding.dimensions, sa.func.count(DocumentEmbedding.id)).group_by(
+        DocumentEmbedding.dimensions
+    )
+    for dimensions, count in rows:
+        counts[str(dimensions) if dimensions is not None else "legacy"] = count
+    return counts
+
+
+def _chunk_codec() -> str:
+    """Compression codec for new chunk text ("none" keeps it inline in document_embeddings)."""
+    codec = current_app.config.get("RAG_CHUNK_COMPRESSION", "none")
+    if codec == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("zstandard is not installed; compressing chunk text with zlib")
+            return "zlib"
+    if codec not in ("none", "zlib", "zstd"):
+        logger.warning("Unknown chunk compression '%s'; storing text inline", codec)
+        return "none"
+    return codec
+
+
+def _compress_text(text: str, codec: str) -> bytes:
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=9).compress(raw)
+    return zlib.compress(raw, 9)
+
+
+def _decompress_text(data: bytes, codec: str) -> str:
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def load_chunk_texts(embedding_ids: list[int]) -> dict[int, str]:
+    """Fetch the text of the given chunks in one round trip per storage location."""
+    if not embedding_ids:
+        return {}
+    texts = {
+        row_id: content
+        for row_id, content in db.session.query(DocumentEmbedding.id, DocumentEmbedding.content).filter(
+            DocumentEmbedding.id.in_(embedding_ids)
+        )
+    }
+    compressed = DocumentChunkText.query.filter(DocumentChunkText.embedding_id.in_(embedding_ids))
+    for row in compressed:
+        try:
+            texts[row.embedding_id] = _decompress_text(row.data, row.codec)
+        except Exception as exc:
+            logger.error("Failed to decompress chunk %d: %s", row.embedding_id, exc)
+    return texts
+
+
+def embed_query(query: str) -> list[float]:
+    """Embed a query, reusing recent results for identical text."""
+    with _query_embedding_lock:
+        cached = _query_embedding_cache.get(query)
+        if cached is not None:
+            _query_embedding_cache.move_to_end(query)
+    record_cache("query_embedding", cached is not None)
+    if cached is not None:
+        return cached
+
+    embedding = generate_embedding(query)
+    with _query_embedding_lock:
+        _query_embedding_cache[query] = embedding
+        while len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return embedding
+
+
+def index_stats() -> dict:
+    """Size of the stored index and the memory a full scan needs; also published as gauges."""
+    chunks, vector_bytes, content_bytes, total_dims = db.session.query(
+        sa.func.count(DocumentEmbedding.id),
+        sa.func.coalesce(sa.func.sum(sa.func.length(DocumentEmbedding.embedding)), 0),
+        sa.func.coalesce(sa.func.sum(sa.func.length(DocumentEmbedding.content)), 0),
+        sa.func.coalesce(
+            sa.func.sum(sa.func.coalesce(DocumentEmbedding.dimensions, EMBEDDING_DIMENSIONS)), 0
+        ),
+    ).one()
+    compressed_bytes = db.session.query(
+        sa.func.coalesce(sa.func.sum(sa.func.length(DocumentChunkText.data)), 0)
+    ).scalar()
+    content_bytes = int(content_bytes) + int(compressed_bytes or 0)
+    linked = DocumentChunkLink.query.count()
+    summaries = DocumentSummary.query.count()
+    stats = {
+        "chunks": int(chunks),
+        "linked_chunks": int(linked),
+        "document_summaries": int(summaries),
+        "stored_vector_bytes": int(vector_bytes),
+        "stored_content_bytes": int(content_bytes),
+        # The scan only materialises ids and vectors; text is fetched for the winners
+        "estimated_scan_memory_bytes": int(total_dims) * _PY_FLOAT_BYTES,
+    }
+    registry.set_gauge("rag_index_chunks", stats["chunks"])
+    registry.set_gauge("rag_index_linked_chunks", stats["linked_chunks"])
+    registry.set_gauge("rag_index_document_summaries", stats["document_summaries"])
+    registry.set_gauge("rag_index_stored_bytes", stats["stored_vector_bytes"], kind="vector")
+    registry.set_gauge("rag_index_stored_bytes", stats["stored_content_bytes"], kind="content")
+    registry.set_gauge("rag_index_scan_memory_bytes", stats["estimated_scan_memory_bytes"])
+    return stats
+
+
+def _query_vector(query: str) -> list[float]:
+    """Embed the query, reduced the same way as the stored vectors."""
+    with stage_timer("query_embed"):
+        projection = get_active_projection()
+        query_embedding = apply_projection(embed_query(query), projection)
+    logger.info("Generated query embedding for: '%s...'", query[:50])
+    return query_embedding
+
+
+def _score_rows(
+    rows: list[tuple[int, str]],
+    query_embedding: list[float],
+    min_similarity: float,
+) -> list[tuple[int, float]]:
+    """Cosine-score (id, JSON vector) rows, skipping vectors of a different size."""
+    results = []
+    mismatched = 0
+    for row_id, raw_embedding in rows:
+        try:
+            # Parse stored embedding from JSON
+            stored_embedding = json.loads(raw_embedding)
+            if len(stored_embedding) != len(query_embedding):
+                # Mixed index state (projection changed without a re-index)
+                mismatched += 1
+                continue
+
+            # Calculate cosine similarity
+            similarity = cosine_similarity(query_embedding, stored_embedding)
+
+            if similarity >= min_similarity:
+                results.append((row_id, similarity))
+
+        except Exception as exc:
+            logger.error("Error processing embedding %d: %s", row_id, exc)
+            continue
+
+    if mismatched:
+        logger.warning(
+            "Skipped %d vectors whose size differs from the query (%d dims); re-index to fix",
+            mismatched,
+            len(query_embedding),
+        )
+    return results
+
+
+def _rank_documents(query_embedding: list[float], limit: int) -> tuple[list[tuple[int, float]], int]:
+    """
+    Coarse stage: rank files by the similarity of their summary vector.
+
+    Returns:
+        ([(file_asset_id, similarity), ...] best first, number of summaries scanned)
+    """
+    with stage_timer("doc_rank"):
+        rows = db.session.query(DocumentSummary.file_asset_id, DocumentSummary.embedding).all()
+        ranked = heapq.nlargest(limit, _score_rows(rows, query_embedding, -1.0), key=lambda x: x[1])
+    return ranked, len(rows)
+
+
+def _chunk_scope(file_ids: list[int]):
+    """
+    Chunks worth scanning once the coarse stage picked file_ids.
+
+    That is the chunks of those files, the representatives their duplicate
+    chunks link to, and every chunk of a file that has no summary yet (so
+    files indexed before summaries existed are never hidden).
+    """
+    summarized = sa.select(DocumentSummary.file_asset_id)
+    linked = sa.select(DocumentChunkLink.representative_id).where(
+        DocumentChunkLink.file_asset_id.in_(file_ids)
+    )
+    return sa.or_(
+        DocumentEmbedding.file_asset_id.in_(file_ids),
+        DocumentEmbedding.file_asset_id.notin_(summarized),
+        DocumentEmbedding.id.in_(linked),
+    )
+
+
+def _score_chunks(
+    query_embedding: list[float],
+    top_k: int,
+    min_similarity: float,
+    file_ids: Optional[list[int]] = None,
+) -> list[tuple[int, float]]:
+    """
+    Score representative chunks against the query and keep the best top_k.
+
+    Only ids and vectors are read here; chunk text is fetched afterwards for the
+    winners by _fetch_winners().
+
+    Args:
+        query_embedding: Projected query vector
+        top_k: Number of chunks to keep
+        min_similarity: Minimum similarity threshold (0-1)
+        file_ids: Restrict the scan to these files (see _chunk_scope); None scans everything
+
+    Returns:
+        List of (embedding_id, similarity) tuples, best first
+    """
+    # Get ids and vectors only from the database
+    with stage_timer("candidate_fetch"):
+        query = db.session.query(DocumentEmbedding.id, DocumentEmbedding.embedding)
+        if file_ids is not None:
+            query = query.filter(_chunk_scope(file_ids))
+        embeddings = query.all()
+
+    if not embeddings:
+        logger.warning("No document embeddings found in database")
+        return []
+
+    logger.info("Searching through %d document chunks", len(embeddings))
+
+    with stage_timer("scoring"):
+        results = _score_rows(embeddings, query_embedding, min_similarity)
+
+    # Keep the top_k by similarity (highest first)
+    with stage_timer("rerank"):
+        top_results = heapq.nlargest(top_k, results, key=lambda x: x[1])
+
+    logger.info(
+        "Found %d relevant chunks (min similarity: %.2f)",
+        len(top_results),
+        min_similarity
+    )
+
+    return top_results
+
+
+def _coarse_to_fine(
+    query: str,
+    top_k: int,
+    min_similarity: float,
+) -> tuple[list[tuple[int, float]], list[tuple[int, float]]]:
+    """
+    Two-level retrieval: rank documents by summary, then scan chunks inside the best ones.
+
+    Returns:
+        (ranked documents as (file_asset_id, similarity), top chunks as (embedding_id, similarity))
+    """
+    query_embedding = _query_vector(query)
+
+    ranked: list[tuple[int, float]] = []
+    file_ids = None
+    if current_app.config.get("RAG_SUMMARIES_ENABLED", True):
+        coarse_docs = max(1, int(current_app.config.get("RAG_COARSE_TOP_DOCS", 8)))
+        ranked, summary_count = _rank_documents(query_embedding, coarse_docs)
+        if summary_count > coarse_docs:
+            file_ids = [file_id for file_id, _ in ranked]
+
+    return ranked, _score_chunks(query_embedding, top_k, min_similarity, file_ids=file_ids)
+
+
+def _fetch_winners(scored: list[tuple[int, float]]) -> list[tuple[DocumentEmbedding, str, float]]:
+    """Load rows, files and text for the winning chunks in one batch, preserving order."""
+    ids = [embedding_id for embedding_id, _ in scored]
+    if not ids:
+        return []
+    rows = {
+        row.id: row
+        for row in DocumentEmbedding.query.options(
+            defer(DocumentEmbedding.content),
+            defer(DocumentEmbedding.embedding),
+            defer(DocumentEmbedding.minhash),
+            joinedload(DocumentEmbedding.file_asset),
+        ).filter(DocumentEmbedding.id.in_(ids))
+    }
+    texts = load_chunk_texts(ids)
+    return [
+        (rows[embedding_id], texts.get(embedding_id, ""), similarity)
+        for embedding_id, similarity in scored
+        if embedding_id in rows
+    ]
+
 
 def retrieve_relevant_documents(
     query: str,
@@ -33,64 +576,48 @@ def retrieve_relevant_documents(
         List of (file_asset, chunk_content, similarity_score) tuples, sorted by relevance
     """
     try:
-        # Generate embedding for the query
-        query_embedding = generate_embedding(query)
-        logger.info("Generated query embedding for: '%s...'", query[:50])
-
-        # Get all document embeddings from database
-        embeddings = DocumentEmbedding.query.all()
-
-        if not embeddings:
-            logger.warning("No document embeddings found in database")
-            return []
-
-        logger.info("Searching through %d document chunks", len(embeddings))
-
-        # Calculate similarity scores
-        results = []
-        for doc_emb in embeddings:
-            try:
-                # Parse stored embedding from JSON
-                stored_embedding = json.loads(doc_emb.embedding)
-
-                # Calculate cosine similarity
-                similarity = cosine_similarity(query_embedding, stored_embedding)
-
-                if similarity >= min_similarity:
-                    results.append((
-                        doc_emb.file_asset,
-                        doc_emb.content,
-                        similarity
-                    ))
-
-            except Exception as exc:
-                logger.error("Error processing embedding %d: %s", doc_emb.id, exc)
-                continue
-
-        # Sort by similarity (highest first) and take top_k
-        results.sort(key=lambda x: x[2], reverse=True)
-        top_results = results[:top_k]
-
-        logger.info(
-            "Found %d relevant chunks (min similarity: %.2f)",
-            len(top_results),
-            min_similarity
-        )
-
-        return top_results
+        _, scored = _coarse_to_fine(query, top_k, min_similarity)
+        return [
+            (doc_emb.file_asset, content, similarity)
+            for doc_emb, content, similarity in _fetch_winners(scored)
+        ]
 
     except Exception as exc:
         logger.error("Failed to retrieve documents: %s", exc)
         return []
 
 
-def build_rag_context(query: str, top_k: int = 3) -> tuple[str, list[dict]]:
+def _linked_files(representative_ids: list[int]) -> dict[int, list[FileAsset]]:
+    """Map representative chunk ids to the other files holding a near-duplicate of them."""
+    if not representative_ids:
+        return {}
+    links = (
+        DocumentChunkLink.query.filter(DocumentChunkLink.representative_id.in_(representative_ids))
+        .all()
+    )
+    linked: dict[int, list[FileAsset]] = defaultdict(list)
+    for link in links:
+        if link.file_asset not in linked[link.representative_id]:
+            linked[link.representative_id].append(link.file_asset)
+    return linked
+
+
+def build_rag_context(
+    query: str, top_k: int = 3, budget: Optional[PromptBudget] = None
+) -> tuple[str, list[dict]]:
     """
     Build a context string from relevant documents for RAG.
 
+    Document summaries pick and order the files (coarse); each of those files
+    then contributes its best matching chunks (fine). A file whose summary
+    matches but none of whose chunks do (typically a broad "what is this file
+    about" question) is represented by its summary instead.
+
     Args:
         query: The user's question
-        top_k: Number of documents to include
+        top_k: Number of passages to include
+        budget: Token budget of the prompt the context goes into; the most
+            relevant passages are packed until it is spent
 
     Returns:
         Tuple of (formatted_context_string, list_of_source_dicts)
@@ -101,49 +628,266 @@ def build_rag_context(query: str, top_k: int = 3) -> tuple[str, list[dict]]:
         logger.info("No document embeddings found - skipping RAG")
         return "", []
 
-    results = retrieve_relevant_documents(query, top_k=top_k)
-
-    if not results:
+    min_similarity = 0.5
+    try:
+        ranked, scored = _coarse_to_fine(query, top_k, min_similarity)
+        with stage_timer("content_fetch"):
+            results = _fetch_winners(scored)
+    except Exception as exc:
+        logger.error("Failed to retrieve documents: %s", exc)
         return "", []
 
-    context_parts = ["Context from Knowledge Garden:\n"]
-    sources = []
+    with stage_timer("context_build"):
+        linked = _linked_files([doc_emb.id for doc_emb, _, _ in results])
+        passages = _merge_passages(ranked, results, linked, top_k, min_similarity)
+        if not passages:
+            return "", []
+        return _format_context(passages, linked, budget)
+
+
+def _merge_passages(
+    ranked: list[tuple[int, float]],
+    results: list[tuple[DocumentEmbedding, str, float]],
+    linked: dict[int, list[FileAsset]],
+    top_k: int,
+    min_similarity: float,
+) -> list[tuple[str, FileAsset, str, float, Optional[int]]]:
+    """
+    Order chunks by similarity, then fill remaining slots with summaries of files without chunks.
+
+    Chunks from different files compete on their own similarity; the file's
+    summary rank only breaks ties. Summary and chunk similarities are not on
+    the same scale, so summaries (gated by RAG_SUMMARY_MIN_SIMILARITY) are
+    never compared with chunks: they follow them in file-rank order. Returns
+    (kind, file_asset, text, similarity, embedding_id) tuples, at most top_k.
+    """
+    file_rank = {file_id: position for position, (file_id, _) in enumerate(ranked)}
+
+    def rank_of(doc_emb: DocumentEmbedding) -> int:
+        # A duplicate chunk counts for the best-ranked file it appears in
+        candidates = [doc_emb.file_asset_id] + [other.id for other in linked.get(doc_emb.id, [])]
+        return min((file_rank[file_id] for file_id in candidates if file_id in file_rank), default=len(ranked))
+
+    chunks = [
+        (-similarity, rank_of(doc_emb), ("chunk", doc_emb.file_asset, content, similarity, doc_emb.id))
+        for doc_emb, content, similarity in results
+    ]
+    chunks.sort(key=lambda entry: entry[:2])
+    passages = [passage for _, _, passage in chunks[:top_k]]
 
-    for i, (file_asset, chunk_content, similarity) in enumerate(results, 1):
-        context_parts.append(
-            f"\n[Source {i}: {file_asset.display_name} (relevance: {similarity:.2f})]"
+    covered = {rank for _, rank, _ in chunks}
+    summary_threshold = float(current_app.config.get("RAG_SUMMARY_MIN_SIMILARITY", min_similarity))
+    wanted = {
+        file_id: similarity
+        for file_id, similarity in ranked[:top_k]
+        if similarity >= summary_threshold and file_rank[file_id] not in covered
+    }
+    if wanted and len(passages) < top_k:
+        summaries = []
+        for row in DocumentSummary.query.options(
+            defer(DocumentSummary.embedding),
+            joinedload(DocumentSummary.file_asset),
+        ).filter(DocumentSummary.file_asset_id.in_(list(wanted))):
+            similarity = wanted[row.file_asset_id]
+            summaries.append(
+                (file_rank[row.file_asset_id], ("summary", row.file_asset, row.summary, similarity, None))
+            )
+        summaries.sort(key=lambda entry: entry[0])
+        passages.extend(passage for _, passage in summaries[: top_k - len(passages)])
+    return passages
+
+
+_CONTEXT_CLOSING = "\n---\n"
+_CITATION_REQUEST = "Please cite sources in your response by referring to [Source 1], [Source 2], etc.\n"
+
+
+def _format_context(
+    passages: list[tuple[str, FileAsset, str, float, Optional[int]]],
+    linked: dict[int, list[FileAsset]],
+    budget: Optional[PromptBudget] = None,
+) -> tuple[str, list[dict]]:
+    preamble = "Context from Knowledge Garden:\n"
+
+    def header(number: int, kind: str, file_asset: FileAsset, similarity: float) -> str:
+        label = " - summary" if kind == "summary" else ""
+        return f"\n[Source {number}: {file_asset.display_name}{label} (relevance: {similarity:.2f})]"
+
+    bodies: list[Optional[str]] = [text for _, _, text, _, _ in passages]
+    if budget is not None:
+        # Earlier passages are the better ones; similarities of chunks and summaries do not compare
+        bodies = budget.pack(
+            "context",
+            [
+                (len(passages) - i, header(i, kind, file_asset, similarity), text)
+                for i, (kind, file_asset, text, similarity, _) in enumerate(passages, 1)
+            ],
+            overhead="\n".join([preamble, _CONTEXT_CLOSING, _CITATION_REQUEST]),
         )
-        context_parts.append(chunk_content)
-        context_parts.append("")  # Empty line between chunks
+    context_parts = [preamble]
+    sources = []
+
+    kept = [(passage, body) for passage, body in zip(passages, bodies) if body is not None]
+    # Sources are numbered after packing so the citations stay contiguous
+    for i, ((kind, file_asset, _, similarity, embedding_id), body) in enumerate(kept, 1):
+        context_parts.append(header(i, kind, file_asset, similarity))
+        context_parts.append(body)
+        context_parts.append("")  # Empty line between passages
 
         # Build source reference
         sources.append({
             "id": file_asset.id,
             "name": file_asset.display_name,
             "url": f"/files/preview/{file_asset.id}",
-            "relevance": round(similarity, 2)
+            "relevance": round(similarity, 2),
+            "kind": kind,
+            "also_in": [
+                {"id": other.id, "name": other.display_name}
+                for other in linked.get(embedding_id, [])
+                if other.id != file_asset.id
+            ],
         })
 
-    context_parts.append("\n---\n")
-    context_parts.append("Please cite sources in your response by referring to [Source 1], [Source 2], etc.\n")
+    if not sources:
+        return "", []
+
+    context_parts.append(_CONTEXT_CLOSING)
+    context_parts.append(_CITATION_REQUEST)
 
     return "\n".join(context_parts), sources
 
 
-def index_file(file_asset: FileAsset, chunk_size: int = 512, overlap: int = 128) -> int:
+def _promote_linked_chunks(file_asset: FileAsset, representative_ids: list[int]) -> set[int]:
+    """
+    Hand representatives that other files link onto over to one of those files.
+
+    The chunk keeps its vector and text but now belongs to the linking file
+    (whose link row it replaces), and the remaining links keep pointing at it,
+    so duplicate content elsewhere stays retrievable when this file goes away.
+    Returns the ids of the promoted representatives.
+    """
+    links = (
+        DocumentChunkLink.query.options(joinedload(DocumentChunkLink.representative))
+        .filter(
+            DocumentChunkLink.representative_id.in_(representative_ids),
+            DocumentChunkLink.file_asset_id != file_asset.id,
+        )
+        .order_by(DocumentChunkLink.similarity.desc(), DocumentChunkLink.id)
+        .all()
+    )
+    promoted: set[int] = set()
+    for link in links:
+        if link.representative_id in promoted:
+            continue
+        promoted.add(link.representative_id)
+        representative = link.representative
+        representative.file_asset = link.file_asset
+        representative.chunk_index = link.chunk_index
+        db.session.delete(link)
+    if promoted:
+        db.session.flush()
+        logger.info(
+            "Handed %d chunks of %s over to the files that duplicate them",
+            len(promoted),
+            file_asset.display_name,
+        )
+    return promoted
+
+
+def _clear_file_index(file_asset: FileAsset, dedup_index: Optional[NearDuplicateIndex]) -> None:
+    """Remove a file's chunks (and their stored text), its summary and its duplicate links."""
+    existing_ids = [
+        row_id
+        for (row_id,) in db.session.query(DocumentEmbedding.id).filter_by(file_asset_id=file_asset.id)
+    ]
+    if existing_ids:
+        promoted = _promote_linked_chunks(file_asset, existing_ids)
+        existing_ids = [row_id for row_id in existing_ids if row_id not in promoted]
+    if existing_ids:
+        if dedup_index is not None:
+            dedup_index.discard_many(existing_ids)
+
+        DocumentChunkText.query.filter(DocumentChunkText.embedding_id.in_(existing_ids)).delete(
+            synchronize_session=False
+        )
+
+    DocumentChunkLink.query.filter_by(file_asset_id=file_asset.id).delete(synchronize_session=False)
+    DocumentSummary.query.filter_by(file_asset_id=file_asset.id).delete(synchronize_session=False)
+    DocumentEmbedding.query.filter_by(file_asset_id=file_asset.id).delete(synchronize_session=False)
+
+
+def release_file_index(file_asset: FileAsset) -> None:
+    """
+    Drop a file's index rows ahead of deleting the file.
+
+    Chunks that other files were folded onto are handed over to those files
+    first, instead of being cascaded away with this one.
+    """
+    _clear_file_index(file_asset, None)
+
+
+def _store_summary(
+    file_asset: FileAsset,
+    content: str,
+    projection: Optional[EmbeddingProjection],
+) -> bool:
+    """Summarise a file and store the summary with its (projected) embedding."""
+    summary = summarize_text(content, int(current_app.config.get("RAG_SUMMARY_CHARS", 600)))
+    if not summary:
+        return False
+    try:
+        # The file name often carries the topic, so it is embedded alongside the summary
+        embedding = apply_projection(
+            generate_embedding(f"{file_asset.display_name}\n{summary}"), projection
+        )
+    except Exception as exc:
+        logger.error("Failed to embed summary for %s: %s", file_asset.display_name, exc)
+        return False
+    db.session.add(DocumentSummary(
+        file_asset_id=file_asset.id,
+        summary=summary,
+        embedding=json.dumps(embedding),
+        dimensions=len(embedding),
+        projection_id=projection.id if projection is not None else None,
+    ))
+    return True
+
+
+def index_file(
+    file_asset: FileAsset,
+    chunk_size: int = 512,
+    overlap: int = 128,
+    dedup_index: Optional[NearDuplicateIndex] = None,
+    projection: Optional[EmbeddingProjection] = None,
+) -> int:
     """
     Index a file by generating and storing embeddings for its content.
 
+    Chunks that are near-duplicates (MinHash/LSH) of an already indexed chunk are
+    not embedded; they are stored as a DocumentChunkLink onto the representative.
+    A short extractive summary of the whole file is embedded as well for the
+    coarse (document-level) retrieval stage.
+
     Args:
         file_asset: The FileAsset to index
         chunk_size: Size of text chunks
         overlap: Overlap between chunks
+        dedup_index: Shared near-duplicate index (loaded from the database if omitted)
+        projection: Projection to store vectors with (resolved from config if omitted)
 
     Returns:
-        Number of chunks indexed
+        Number of chunks indexed (representatives plus linked duplicates)
     """
-    from .embeddings import embed_document
+    dedup_enabled = current_app.config.get("RAG_DEDUP_ENABLED", True)
+    if dedup_enabled and dedup_index is None:
+        dedup_index = NearDuplicateIndex.from_database(
+            threshold=current_app.config.get("RAG_DEDUP_THRESHOLD", 0.85)
+        )
 
+    if projection is None:
+        projection = prepare_index_projection()
+    codec = _chunk_codec()
+
+    added_ids: list[int] = []
     try:
         # Read file content
         content = file_asset.read_text_safe()
@@ -157,38 +901,80 @@ def index_file(file_asset: FileAsset, chunk_size: int = 512, overlap: int = 128)
         logger.info("Indexing file: %s (%d chars)", file_asset.display_name, len(content))
 
         # Delete existing embeddings for this file
-        DocumentEmbedding.query.filter_by(file_asset_id=file_asset.id).delete()
+        _clear_file_index(file_asset, dedup_index if dedup_enabled else None)
         db.session.commit()  # Commit deletion before proceeding
 
-        # Generate embeddings
-        chunk_embeddings = embed_document(content, chunk_size, overlap)
+        chunks = chunk_text(content, chunk_size, overlap)
+        logger.info("Split document into %d chunks", len(chunks))
 
-        # Store in database
-        for chunk_index, (chunk_text, embedding) in enumerate(chunk_embeddings):
+        indexed = 0
+        duplicates = 0
+        for chunk_index, chunk in enumerate(chunks):
             # Clean chunk text of null bytes
-            chunk_text_clean = chunk_text.replace('\x00', '')
+            chunk_text_clean = chunk.replace('\x00', '')
+
+            signature = minhash_signature(chunk_text_clean) if dedup_enabled else None
+            if signature is not None:
+                match = dedup_index.find(signature)
+                if match is not None:
+                    representative_id, similarity = match
+                    db.session.add(DocumentChunkLink(
+                        file_asset_id=file_asset.id,
+                        chunk_index=chunk_index,
+                        representative_id=representative_id,
+                        similarity=similarity,
+                    ))
+                    duplicates += 1
+                    indexed += 1
+                    continue
+
+            try:
+                embedding = apply_projection(generate_embedding(chunk_text_clean), projection)
+            except Exception as exc:
+                logger.error("Failed to embed chunk %d: %s", chunk_index, exc)
+                # Continue with other chunks even if one fails
+                continue
 
             doc_emb = DocumentEmbedding(
                 file_asset_id=file_asset.id,
                 chunk_index=chunk_index,
-                content=chunk_text_clean,
-                embedding=json.dumps(embedding)  # Store as JSON array
+                content=chunk_text_clean if codec == "none" else "",
+                embedding=json.dumps(embedding),  # Store as JSON array
+                dimensions=len(embedding),
+                projection_id=projection.id if projection is not None else None,
+                minhash=serialize_signature(signature) if signature is not None else None,
             )
+            if codec != "none":
+                doc_emb.stored_text = DocumentChunkText(
+                    codec=codec,
+                    data=_compress_text(chunk_text_clean, codec),
+                )
             db.session.add(doc_emb)
+            if signature is not None:
+                db.session.flush()  # Assign an id so later chunks can link to it
+                dedup_index.add(doc_emb.id, signature)
+                added_ids.append(doc_emb.id)
+            indexed += 1
+
+        if indexed and current_app.config.get("RAG_SUMMARIES_ENABLED", True):
+            _store_summary(file_asset, content, projection)
 
         db.session.commit()
 
         logger.info(
-            "Indexed %d chunks for file: %s",
-            len(chunk_embeddings),
-            file_asset.display_name
+            "Indexed %d chunks for file: %s (%d near-duplicates linked)",
+            indexed,
+            file_asset.display_name,
+            duplicates,
         )
 
-        return len(chunk_embeddings)
+        return indexed
 
     except Exception as exc:
         logger.error("Failed to index file %s: %s", file_asset.display_name, exc, exc_info=True)
         db.session.rollback()
+        if dedup_index is not None and added_ids:
+            dedup_index.discard_many(added_ids)
         return 0
 
 
@@ -212,23 +998,24 @@ def index_all_files(folder_id: Optional[int] = None) -> dict[str, int]:
     files = query.all()
     logger.info("Starting indexing of %d files", len(files))
 
-    # Supported file extensions (now includes images for OCR)
-    supported_extensions = (
-        '.txt', '.md', '.pdf', '.doc', '.docx', '.csv', '.json', '.xml', '.html', '.htm',
-        '.py', '.js', '.ts', '.jsx', '.tsx', '.css', '.scss', '.yaml', '.yml',
-        '.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif'  # Images with OCR
-    )
+    dedup_index = None
+    if current_app.config.get("RAG_DEDUP_ENABLED", True):
+        dedup_index = NearDuplicateIndex.from_database(
+            threshold=current_app.config.get("RAG_DEDUP_THRESHOLD", 0.85)
+        )
+    projection = prepare_index_projection()
 
     for file_asset in files:
-        # Skip unsupported files
-        if not file_asset.display_name.lower().endswith(supported_extensions):
+        # Skip files whose content no extractor handles (sniffed once, then stored)
+        sniffed = file_asset.sniff_content()
+        if sniffed is None or sniffed.kind == "unsupported":
             logger.debug("Skipping unsupported file: %s", file_asset.display_name)
             stats["skipped"] += 1
             continue
 
         try:
             logger.info("Indexing file: %s", file_asset.display_name)
-            chunks_indexed = index_file(file_asset)
+            chunks_indexed = index_file(file_asset, dedup_index=dedup_index, projection=projection)
             if chunks_indexed > 0:
                 stats["indexed"] += 1
                 logger.info("Successfully indexed %s (%d chunks)", file_asset.display_name, chunks_indexed)
@@ -240,6 +1027,20 @@ def index_all_files(folder_id: Optional[int] = None) -> dict[str, int]:
             logger.error("Failed to index %s: %s", file_asset.display_name, exc, exc_info=True)
             stats["failed"] += 1
 
+    db.session.commit()  # Persist sniffed types of skipped files too
+
+    try:
+        finalize_index_projection()
+    except Exception as exc:
+        logger.error("Failed to finalize embedding projection: %s", exc, exc_info=True)
+        db.session.rollback()
+
+    cache = get_extraction_cache()
+    if cache is not None:
+        removed = cache.prune()
+        if removed:
+            logger.info("Pruned %d extraction cache entries", removed)
+
     logger.info(
         "Indexing complete: indexed=%d, failed=%d, skipped=%d",
         stats["indexed"],
@@ -0,0 +1,227 @@
+"""Bounded priority queue and worker threads for local AI generation."""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import math
+import queue
+from concurrent.futures import Future
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from flask import jsonify
+
+from .metrics import queued_for, registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: a member waiting in chat beats an insight request beats API batch work
+PRIORITIES = {"chat": 0, "insight": 1, "api": 2}
+
+metrics_registry.describe("ai_queue_depth", "Generation jobs waiting for an AI worker")
+metrics_registry.describe("ai_queue_wait_seconds", "Time generation jobs spent queued before a worker took them")
+metrics_registry.describe("ai_jobs_total", "Generation jobs by priority and outcome")
+
+
+class SchedulerFull(Exception):
+    """The generation queue is at capacity; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"AI generation queue is full; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobExpired(TimeoutError):
+    """A queued job's deadline passed before a worker could start it."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "priority", "deadline", "enqueued")
+
+    def __init__(self, fn, args, kwargs, priority: str, deadline: Optional[float]):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = perf_counter()
+
+
+class AIScheduler:
+    """
+    Fixed set of worker threads fed from a bounded priority heap.
+
+    submit() raises SchedulerFull as soon as ``max_queue`` jobs are waiting,
+    rather than letting a burst queue up minutes of work that would time out
+    anyway. Jobs run in priority order (FIFO within a priority). A job whose
+    deadline passes while it is queued fails with JobExpired without running.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._heap: List[Tuple[int, int, _Job]] = []
+        self._sequence = itertools.count()
+        self._ready = Condition()
+        self._running = 0
+        # Moving average of job run time, used to suggest a Retry-After
+        self._avg_runtime = 0.0
+        for index in range(self.workers):
+            Thread(target=self._work, name=f"ai-worker-{index}", daemon=True).start()
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        priority: str = "api",
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Future:
+        """Queue ``fn(*args, **kwargs)``; it is dropped if not started within ``timeout`` seconds."""
+        rank = PRIORITIES[priority]
+        job = _Job(fn, args, kwargs, priority, perf_counter() + timeout if timeout is not None else None)
+        with self._ready:
+            # Jobs an idle worker is about to pick up are not really waiting
+            waiting = len(self._heap) - (self.workers - self._running)
+            if waiting >= self.max_queue:
+                metrics_registry.inc("ai_jobs_total", priority=priority, result="rejected")
+                raise SchedulerFull(self._retry_after())
+            heapq.heappush(self._heap, (rank, next(self._sequence), job))
+            depth = len(self._heap)
+            self._ready.notify()
+        metrics_registry.set_gauge("ai_queue_depth", depth)
+        return job.future
+
+    def stream(
+        self,
+        open_stream: Callable[[], Iterable[Any]],
+        *,
+        priority: str = "api",
+        timeout: float,
+        on_close: Optional[Callable[[], None]] = None,
+    ) -> Iterator[Any]:
+        """
+        Run ``open_stream()`` on a worker and relay the items it yields.
+
+        The job is queued straight away, so SchedulerFull is raised here and not
+        from the returned iterator. The iterator raises TimeoutError once
+        ``timeout`` seconds have passed since submission, and calls ``on_close``
+        when its consumer stops, whether finished, timed out or closed early.
+        """
+        items: "queue.Queue[Any]" = queue.Queue()
+        finished = object()
+
+        def produce():
+            try:
+                source = open_stream()
+                try:
+                    for item in source:
+                        items.put(item)
+                finally:
+                    close = getattr(source, "close", None)
+                    if close is not None:
+                        close()
+            except Exception as exc:  # pylint: disable=broad-except
+                items.put(exc)
+            finally:
+                items.put(finished)
+
+        deadline = perf_counter() + timeout
+        future = self.submit(produce, priority=priority, timeout=timeout)
+
+        def relay():
+            try:
+                while True:
+                    try:
+                        item = items.get(timeout=max(0.0, deadline - perf_counter()))
+                    except queue.Empty:
+                        raise TimeoutError from None
+                    if item is finished:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                future.cancel()
+                if on_close is not None:
+                    on_close()
+
+        return relay()
+
+    def stats(self) -> dict:
+        with self._ready:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": len(self._heap),
+                "max_queue": self.max_queue,
+            }
+
+    def _retry_after(self) -> int:
+        backlog = len(self._heap) + self._running
+        return max(1, math.ceil(backlog * max(self._avg_runtime, 1.0) / self.workers))
+
+    def _work(self) -> None:
+        while True:
+            with self._ready:
+                while not self._heap:
+                    self._ready.wait()
+                _, _, job = heapq.heappop(self._heap)
+                self._running += 1
+                depth = len(self._heap)
+            metrics_registry.set_gauge("ai_queue_depth", depth)
+            try:
+                self._run(job)
+            finally:
+                with self._ready:
+                    self._running -= 1
+
+    def _run(self, job: _Job) -> None:
+        if not job.future.set_running_or_notify_cancel():
+            metrics_registry.inc("ai_jobs_total", priority=job.priority, result="cancelled")
+            return
+        started = perf_counter()
+        metrics_registry.observe("ai_queue_wait_seconds", started - job.enqueued, priority=job.priority)
+        if job.deadline is not None and started >= job.deadline:
+            logger.warning(
+                "Dropping %s generation job whose deadline passed after %.1fs in the queue",
+                job.priority,
+                started - job.enqueued,
+            )
+            metrics_registry.inc("ai_jobs_total", priority=job.priority, result="expired")
+            job.future.set_exception(JobExpired("generation job expired before it started"))
+            return
+        try:
+            with queued_for(started - job.enqueued):
+                result = job.fn(*job.args, **job.kwargs)
+        except BaseException as exc:  # pylint: disable=broad-except
+            metrics_registry.inc("ai_jobs_total", priority=job.priority, result="error")
+            job.future.set_exception(exc)
+        else:
+            metrics_registry.inc("ai_jobs_total", priority=job.priority, result="ok")
+            job.future.set_result(result)
+        runtime = perf_counter() - started
+        self._avg_runtime = runtime if not self._avg_runtime else 0.8 * self._avg_runtime + 0.2 * runtime
+
+
+def get_ai_scheduler(app) -> AIScheduler:
+    """Retrieve or create the generation scheduler for a Flask app instance."""
+    scheduler: AIScheduler | None = app.extensions.get("ai_scheduler")  # type: ignore[assignment]
+    if scheduler is None:
+        scheduler = AIScheduler(
+            workers=app.config.get("AI_WORKERS", 2),
+            max_queue=app.config.get("AI_QUEUE_DEPTH", 16),
+        )
+        app.extensions["ai_scheduler"] = scheduler
+    return scheduler
+
+
+def queue_full_response(exc: SchedulerFull):
+    """503 with a Retry-After hint for a request the scheduler turned away."""
+    response = jsonify({"error": "AI is busy, try again shortly", "retry_after": exc.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(exc.retry_after)
+    return response
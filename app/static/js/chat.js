@@ -51,6 +51,8 @@
   let socket = null;
   let reconnectTimer = null;
   const subscribedThreads = new Set();
+  const streamDrafts = new Map();
+  const typingIndicators = new Map();
 
   function renderMessageBody(text) {
     if (!text) return '';
@@ -2287,10 +2289,119 @@
     renderTray();
   }
 
+  function removeStreamDrafts(threadId, senderId) {
+    streamDrafts.forEach((draft, streamId) => {
+      if (draft.threadId === threadId && (senderId == null || draft.senderId === senderId)) {
+        clearTimeout(draft.expireTimer);
+        draft.element.remove();
+        streamDrafts.delete(streamId);
+      }
+    });
+  }
+
+  function hideTypingIndicator(threadId, senderId) {
+    const key = `${threadId}:${senderId}`;
+    const indicator = typingIndicators.get(key);
+    if (!indicator) {
+      return;
+    }
+    clearTimeout(indicator.expireTimer);
+    indicator.element.remove();
+    typingIndicators.delete(key);
+  }
+
+  function handleTyping(data) {
+    const senderId = data.sender?.id;
+    hideTypingIndicator(data.thread_id, senderId);
+    if (!data.typing) {
+      return;
+    }
+    let container = null;
+    if (currentThreadId === data.thread_id && messageList) {
+      container = messageList;
+    } else {
+      const info = ensureWindow(data.thread_id, getThreadLabel(data.thread_id));
+      container = info?.body || null;
+    }
+    if (!container) {
+      return;
+    }
+    const element = document.createElement('div');
+    element.className = 'chat-typing-indicator';
+    const dots = document.createElement('div');
+    for (let i = 0; i < 3; i += 1) {
+      const dot = document.createElement('span');
+      dot.className = 'dot';
+      dots.append(dot);
+    }
+    element.append(createUserChipElement(data.sender, { size: 'xs', linkPreference: 'message' }), dots);
+    container.append(element);
+    container.scrollTop = container.scrollHeight;
+    // Never leave the dots behind if the closing event is lost with the socket
+    const expireTimer = setTimeout(() => hideTypingIndicator(data.thread_id, senderId), 180000);
+    typingIndicators.set(`${data.thread_id}:${senderId}`, { element, expireTimer });
+  }
+
+  function handleMessageDelta(data) {
+    hideTypingIndicator(data.thread_id, data.sender?.id);
+    let draft = streamDrafts.get(data.stream_id);
+    if (!draft) {
+      let container = null;
+      let className = 'chat-popover-message';
+      if (currentThreadId === data.thread_id && messageList) {
+        container = messageList;
+        className = 'chat-message';
+      } else {
+        const info = ensureWindow(data.thread_id, getThreadLabel(data.thread_id));
+        container = info?.body || null;
+      }
+      if (!container) {
+        return;
+      }
+      const element = document.createElement('article');
+      element.className = `${className} is-streaming`;
+      element.dataset.streamId = data.stream_id;
+      const header = document.createElement('div');
+      header.className = 'chat-message-meta';
+      header.append(createUserChipElement(data.sender, { size: 'xs', linkPreference: 'message' }));
+      const body = document.createElement('div');
+      body.className = 'chat-message-body';
+      element.append(header, body);
+      container.append(element);
+      draft = {
+        threadId: data.thread_id,
+        senderId: data.sender?.id,
+        container,
+        element,
+        body,
+        text: '',
+        expireTimer: null,
+      };
+      streamDrafts.set(data.stream_id, draft);
+    }
+    draft.text += data.delta || '';
+    draft.body.innerHTML = renderMessageBody(draft.text);
+    draft.container.scrollTop = draft.container.scrollHeight;
+  }
+
+  function handleStreamEnd(data) {
+    const draft = streamDrafts.get(data.stream_id);
+    if (!draft) {
+      return;
+    }
+    // The stored message normally replaces the draft right away; drop it if none arrives
+    draft.expireTimer = setTimeout(() => {
+      draft.element.remove();
+      streamDrafts.delete(data.stream_id);
+    }, 5000);
+  }
+
   function handleIncomingMessage(threadId, message) {
     if (!message) {
       return;
     }
+    removeStreamDrafts(threadId, message.sender?.id);
+    hideTypingIndicator(threadId, message.sender?.id);
     const history = threadHistory.get(threadId) || [];
     if (!history.find((entry) => entry.id === message.id)) {
       history.push(message);
@@ -2357,6 +2468,15 @@
       case 'message':
         handleIncomingMessage(data.thread_id, data.message);
         break;
+      case 'message_delta':
+        handleMessageDelta(data);
+        break;
+      case 'message_stream_end':
+        handleStreamEnd(data);
+        break;
+      case 'typing':
+        handleTyping(data);
+        break;
       case 'message_deleted':
         handleMessageDeleted(data.thread_id, data.message_id);
         break;
@@ -34,6 +34,36 @@ document.addEventListener("DOMContentLoaded", () => {
     output.textContent = message;
   };
 
+  // Parse a text/event-stream body, calling onEvent(name, data) for each frame
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let name = "message";
+        let data = "";
+        frame.split("\n").forEach((line) => {
+          if (line.startsWith("event: ")) {
+            name = line.slice(7);
+          } else if (line.startsWith("data: ")) {
+            data += line.slice(6);
+          }
+        });
+        onEvent(name, data ? JSON.parse(data) : {});
+        boundary = buffer.indexOf("\n\n");
+      }
+    }
+  };
+
   form.addEventListener("submit", async (event) => {
     event.preventDefault();
     const formData = new FormData(form);
@@ -65,16 +95,33 @@ document.addEventListener("DOMContentLoaded", () => {
           "Content-Type": "application/json",
         },
         signal: controller.signal,
-        body: JSON.stringify({ prompt }),
+        body: JSON.stringify({ prompt, stream: true }),
       });
 
-      const payload = await response.json();
-      if (!response.ok || !payload?.insight) {
+      if (!response.ok || !response.body) {
+        const payload = await response.json().catch(() => ({}));
         throw new Error(payload?.error || "Unknown error");
       }
 
-      clearTimeout(slowNoticeTimer);
-      typeInsight(payload.insight);
+      let text = "";
+      let failed = null;
+      await readEventStream(response, (name, data) => {
+        if (name === "delta") {
+          if (!text) {
+            clearTimeout(slowNoticeTimer);
+          }
+          text += data.text || "";
+          typeInsight(text);
+        } else if (name === "done" && data.insight) {
+          typeInsight(data.insight);
+          text = data.insight;
+        } else if (name === "error") {
+          failed = data.error || "Unknown error";
+        }
+      });
+      if (!text) {
+        throw new Error(failed || "Unknown error");
+      }
     } catch (error) {
       console.error(error);
       if (error.name === "AbortError") {
@@ -0,0 +1,42 @@
+"""Server-Sent Events helpers for streamed AI responses."""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Iterable, Tuple
+
+from flask import Response, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one SSE frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: Iterable[Tuple[str, Any]]) -> Response:
+    """
+    Stream (event, data) pairs to the client as text/event-stream.
+
+    An exception raised by the event source after the headers have gone out
+    is reported as a final ``error`` event instead of a broken connection.
+    """
+
+    def generate():
+        try:
+            for event, data in events:
+                yield sse_event(event, data)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Event stream failed: %s", exc)
+            yield sse_event("error", {"error": "Generation failed"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx from buffering the stream into one late response
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark RAG recall and scan latency at reduced embedding dimensions.
+
+Uses full-size vectors already stored in document_embeddings (index with
+NEO_DRUIDIC_RAG_EMBEDDING_DIMENSIONS=0 first), or re-embeds stored chunk text
+with --reembed. A held-out slice of chunks acts as queries; recall@k is measured
+against an exact full-dimension scan.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app import create_app
+from app.embeddings import (
+    EMBEDDING_DIMENSIONS,
+    cosine_similarity,
+    fit_pca,
+    generate_embedding,
+    pca_project,
+    truncate_embedding,
+)
+from app.models import DocumentEmbedding
+from app.rag import load_chunk_texts
+
+
+def load_vectors(sample: int, reembed: bool) -> list[list[float]]:
+    vectors = []
+    rows = DocumentEmbedding.query.order_by(DocumentEmbedding.id).limit(sample).all()
+    texts = load_chunk_texts([row.id for row in rows]) if reembed else {}
+    for row in rows:
+        if reembed:
+            vectors.append(generate_embedding(texts.get(row.id, "")))
+            continue
+        vector = json.loads(row.embedding)
+        if len(vector) == EMBEDDING_DIMENSIONS:
+            vectors.append(vector)
+    return vectors
+
+
+def top_k(query: list[float], corpus: list[list[float]], k: int) -> list[int]:
+    scored = [(cosine_similarity(query, vector), i) for i, vector in enumerate(corpus)]
+    scored.sort(reverse=True)
+    return [i for _, i in scored[:k]]
+
+
+def run(args) -> None:
+    vectors = load_vectors(args.sample, args.reembed)
+    if len(vectors) < args.queries * 2:
+        print(f"Need at least {args.queries * 2} full-size vectors, found {len(vectors)}.")
+        print("Re-index with full dimensions or pass --reembed.")
+        sys.exit(1)
+
+    random.Random(args.seed).shuffle(vectors)
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+    truth = [set(top_k(query, corpus, args.k)) for query in queries]
+
+    methods = ["truncate"]
+    try:
+        import numpy  # noqa: F401
+        methods.append("pca")
+    except ImportError:
+        print("numpy not installed; skipping PCA rows.")
+
+    print(f"corpus={len(corpus)} queries={len(queries)} k={args.k}")
+    print(f"{'method':<9} {'dims':>5} {'recall@k':>9} {'scan ms/query':>14} {'KiB/vector (JSON)':>18}")
+
+    for dims in args.dims:
+        for method in methods:
+            if dims >= EMBEDDING_DIMENSIONS:
+                if method != "truncate":
+                    continue
+                project = list
+            elif method == "pca":
+                if len(corpus) <= dims:
+                    continue
+                mean, components = fit_pca(corpus, dims)
+                project = lambda vector: pca_project(vector, mean, components)  # noqa: E731
+            else:
+                project = lambda vector: truncate_embedding(vector, dims)  # noqa: E731
+
+            reduced_corpus = [project(vector) for vector in corpus]
+            reduced_queries = [project(query) for query in queries]
+
+            hits = 0
+            started = time.perf_counter()
+            for query, expected in zip(reduced_queries, truth):
+                hits += len(expected.intersection(top_k(query, reduced_corpus, args.k)))
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+            recall = hits / (len(queries) * args.k)
+            kib = len(json.dumps(reduced_corpus[0])) / 1024
+            label = "full" if dims >= EMBEDDING_DIMENSIONS else method
+            print(f"{label:<9} {min(dims, EMBEDDING_DIMENSIONS):>5} {recall:>9.3f} {elapsed_ms:>14.2f} {kib:>18.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample", type=int, default=2000, help="chunks to load")
+    parser.add_argument("--queries", type=int, default=50, help="held-out chunks used as queries")
+    parser.add_argument("--k", type=int, default=3, help="recall depth (RAG top_k)")
+    parser.add_argument("--dims", type=int, nargs="+", default=[1536, 1024, 512, 256, 128])
+    parser.add_argument("--reembed", action="store_true", help="re-embed stored chunk text via the API")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
 import os
 import shutil
 import tempfile
+import threading
+import time
 import unittest
 from datetime import datetime
+from unittest import mock
 
 from app import create_app
-from app.chat import ARCHDRUID_USERNAME, ensure_archdruid_user
+from app.chat import ARCHDRUID_USERNAME, _ReplyWorkers, _generate_archdruid_prompt, ensure_archdruid_user
 from app.chat_crypto import generate_identity
 from app.config import Config
 from app.database import db
 from app.models import ChatMessage, ChatMessageKey, ChatThread, ChatThreadMember, User
+from app.prompting import PromptBudget
+
+
+class ReplyBacklogTests(unittest.TestCase):
+    def test_replies_beyond_the_backlog_are_skipped(self):
+        workers = _ReplyWorkers(workers=1, max_queue=1)
+        release = threading.Event()
+
+        running = workers.submit(release.wait, 5)
+        queued = workers.submit(lambda: "queued")
+        self.assertIsNotNone(running)
+        self.assertIsNotNone(queued)
+        self.assertIsNone(workers.submit(lambda: "dropped"))
+
+        release.set()
+        self.assertEqual(queued.result(timeout=5), "queued")
+        self.assertIsNotNone(workers.submit(lambda: "later"))
 
 
 class ChatRouteTests(unittest.TestCase):
@@ -222,14 +242,37 @@ class ChatRouteTests(unittest.TestCase):
         )
         self.assertEqual(send_response.status_code, 200)
 
-        messages = (
-            ChatMessage.query.filter_by(thread_id=thread.id)
-            .order_by(ChatMessage.created_at.asc())
-            .all()
-        )
+        # The member's message is stored before the reply; the Archdruid answers from a worker
+        messages = ChatMessage.query.filter_by(thread_id=thread.id).all()
+        self.assertEqual(messages[0].sender_id, self.alice_id)
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            messages = (
+                ChatMessage.query.filter_by(thread_id=thread.id)
+                .order_by(ChatMessage.created_at.asc())
+                .all()
+            )
+            if len(messages) >= 2:
+                break
+            time.sleep(0.05)
         self.assertGreaterEqual(len(messages), 2)
         self.assertEqual(messages[-1].sender_id, self.arch_id)
 
 
+    def test_archdruid_prompt_is_budgeted_for_the_serving_provider(self):
+        self.app.config["AI_USE_OPENAI"] = True
+        alice = db.session.get(User, self.alice_id)
+        local = f"local/{self.app.config.get('AI_DEFAULT_MODEL', 'archdruid')}"
+        for available, expected in ((True, "openai/gpt-4o-mini"), (False, local)):
+            with mock.patch("app.ai.get_openai_provider", return_value=mock.Mock(available=available)), mock.patch.object(
+                PromptBudget, "record"
+            ) as record:
+                prompt = _generate_archdruid_prompt(alice, "What blessing do you suggest?", mock.Mock(members=[]))
+
+            self.assertIn("What blessing do you suggest?", prompt)
+            self.assertEqual("/".join(record.call_args.args), expected)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,196 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from flask import Flask
+
+from app.document_extractor import SNIFF_BYTES, _extract_pdf, extract_document, iter_pdf_pages, sniff_file
+
+TEXT_PAGE = "Minutes of the spring gathering, recorded by the scribe of the grove."
+
+
+class FakeTextLayer:
+    """Pages 1 and 3 have a text layer; pages 2 and 4 are scans."""
+
+    def __init__(self, file_path):
+        self.closed = False
+
+    def page_count(self):
+        return 4
+
+    def page_text(self, index):
+        if index % 2 == 0:
+            return f"{TEXT_PAGE} ({index + 1})", "pypdf2"
+        return "", ""
+
+    def close(self):
+        self.closed = True
+
+
+class PageStreamingPdfTests(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch("app.document_extractor._TextLayer", FakeTextLayer),
+            mock.patch("app.ocr.ocr_available", return_value=True),
+            mock.patch.dict("app.ocr._settings", {"workers": 1}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        ocr_patch = mock.patch(
+            "app.ocr._ocr_pdf_page",
+            side_effect=lambda path, page, dpi: f"scanned text of page {page}",
+        )
+        self.ocr_mock = ocr_patch.start()
+        self.addCleanup(ocr_patch.stop)
+
+    def test_mixed_pdf_is_extracted_in_one_pass(self):
+        pages = list(iter_pdf_pages("mixed.pdf"))
+
+        self.assertEqual([method for _, _, method in pages], ["pypdf2", "ocr", "pypdf2", "ocr"])
+        self.assertEqual([call.args[1] for call in self.ocr_mock.call_args_list], [2, 4])
+
+        result = _extract_pdf("mixed.pdf")
+        self.assertEqual(result.method, "ocr+pypdf2")
+        self.assertTrue(result.complete)
+        self.assertEqual(len(result.page_offsets), 4)
+        self.assertTrue(result.text[result.page_offsets[1]:].startswith("scanned text of page 2"))
+
+    def test_extraction_stops_at_char_budget(self):
+        result = _extract_pdf("mixed.pdf", char_budget=len(TEXT_PAGE))
+
+        self.assertFalse(result.complete)
+        self.assertEqual(len(result.page_offsets), 1)
+        self.ocr_mock.assert_not_called()
+
+
+class ContentSniffingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="neo_sniff_")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as handle:
+            handle.write(data)
+        return path
+
+    def test_binary_formats_are_detected_regardless_of_name(self):
+        self.assertEqual(sniff_file(self._write("notes.txt", b"%PDF-1.7\n...")).kind, "pdf")
+        self.assertEqual(sniff_file(self._write("scan.pdf", b"\x89PNG\r\n\x1a\n....")).kind, "image")
+        self.assertEqual(sniff_file(self._write("blob.txt", b"\x00\x01\x02binary")).kind, "unsupported")
+
+        docx = os.path.join(self.tmp_dir, "report.bin")
+        with zipfile.ZipFile(docx, "w") as archive:
+            archive.writestr("word/document.xml", "<w:document/>")
+        self.assertEqual(sniff_file(docx).kind, "docx")
+
+        archive_path = os.path.join(self.tmp_dir, "photos.docx")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("photo.jpg", "...")
+        self.assertEqual(sniff_file(archive_path).kind, "unsupported")
+
+    def test_pdf_header_must_lead_the_file(self):
+        self.assertEqual(sniff_file(self._write("padded.bin", b"\xef\xbb\xbf\r\n %PDF-1.4\n...")).kind, "pdf")
+
+        notes = self._write("notes.md", b"# Parsing\n\nEvery PDF starts with `%PDF-1.7` on its first line.\n")
+        self.assertEqual(sniff_file(notes).kind, "text")
+
+    def test_bmp_needs_a_consistent_header(self):
+        pixels = b"\x00" * 16
+        header = b"BM" + struct.pack("<IHHI", 54 + len(pixels), 0, 0, 54) + struct.pack("<I", 40) + b"\x00" * 36
+        self.assertEqual(sniff_file(self._write("tiny.dat", header + pixels)).kind, "image")
+
+        notes = self._write("notes.txt", b"BMW service notes: oil changed, brakes checked.\n")
+        self.assertEqual(sniff_file(notes).kind, "text")
+        self.assertIn("BMW service notes", extract_document(notes).text)
+
+    def test_text_encoding_is_detected_in_one_pass(self):
+        # A multi-byte character split by the sniff window is still UTF-8.
+        split = b"a" * (SNIFF_BYTES - 1) + "\u00e9t\u00e9".encode("utf-8")
+        self.assertEqual(sniff_file(self._write("long.md", split)).encoding, "utf-8")
+        self.assertEqual(
+            sniff_file(self._write("bom.txt", "\ufeffhello".encode("utf-16"))).encoding, "utf-16"
+        )
+
+        cp1252 = self._write("legacy.data", "Caf\u00e9 \u2014 \u201cquoted\u201d".encode("cp1252"))
+        sniffed = sniff_file(cp1252)
+        self.assertEqual((sniffed.kind, sniffed.encoding), ("text", "cp1252"))
+        self.assertEqual(extract_document(cp1252).text, "Caf\u00e9 \u2014 \u201cquoted\u201d")
+
+
+class StructuredExtractorTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="neo_structured_")
+        # Own context, so one leaked by another test cannot switch the cache or sandbox on
+        app = Flask(__name__)
+        app.config.update(EXTRACTION_CACHE_ENABLED=False, EXTRACTION_SANDBOX_ENABLED=False)
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as handle:
+            handle.write(data)
+        return path
+
+    def test_docx_paragraphs_are_streamed_from_document_xml(self):
+        body = (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            "<w:p><w:r><w:t>Oak</w:t></w:r><w:r><w:tab/><w:t>grove</w:t></w:r></w:p>"
+            "<w:p/>"
+            "<w:p><w:r><w:t>Line one</w:t><w:br/><w:t>line two</w:t></w:r></w:p>"
+            "</w:body></w:document>"
+        )
+        path = os.path.join(self.tmp_dir, "minutes.docx")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("word/document.xml", body)
+
+        result = extract_document(path)
+        self.assertEqual(result.text, "Oak\tgrove\n\nLine one\nline two")
+        self.assertTrue(result.complete)
+
+        truncated = extract_document(path, max_chars=5)
+        self.assertEqual(truncated.text, "Oak\tgrove")
+        self.assertFalse(truncated.complete)
+
+    def test_html_is_reduced_to_visible_text(self):
+        page = (
+            b"<!DOCTYPE html><html><head><title>Rites</title><style>p{color:red}</style>"
+            b"<script>var secret = 'x';</script></head><body><h1>Solstice  &amp; Equinox</h1>"
+            b"<p>Gather at\n   <b>dawn</b>.</p></body></html>"
+        )
+        path = self._write("rites.dat", page)
+        self.assertEqual(sniff_file(path).kind, "html")
+
+        result = extract_document(path)
+        self.assertEqual(result.text, "Rites\n\nSolstice & Equinox\n\nGather at dawn.")
+        self.assertNotIn("secret", result.text)
+
+    def test_markup_mentioned_in_text_files_is_kept(self):
+        readme = self._write("README.md", b"# Setup\n\nWrap the page in <html> and <body> tags.\nThen serve it.\n")
+        self.assertEqual(sniff_file(readme).kind, "text")
+        self.assertEqual(
+            extract_document(readme).text, "# Setup\n\nWrap the page in <html> and <body> tags.\nThen serve it.\n"
+        )
+
+    def test_large_text_stops_reading_at_the_budget(self):
+        path = self._write("huge.log", b"druid " * 100_000)
+        with mock.patch("app.document_extractor.TEXT_CHUNK_BYTES", 1024):
+            result = extract_document(path, max_chars=2000)
+        self.assertEqual(len(result.text), 2000)
+        self.assertFalse(result.complete)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from app import create_app
+from app.config import Config
+from app.document_extractor import (
+    EXTRACTOR_VERSION,
+    ExtractionResult,
+    _extract_docx,
+    extract_document,
+    extract_text_from_file,
+)
+from app.extraction_cache import ExtractionCache
+
+
+class ExtractionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="neo_extract_", suffix=".db")
+        self.storage_dir = tempfile.mkdtemp(prefix="neo_extract_storage_")
+        self._orig_db_uri = Config.SQLALCHEMY_DATABASE_URI
+        self._orig_storage_root = Config.STORAGE_ROOT
+        self._orig_log_root = Config.LOG_ROOT
+        Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+        Config.STORAGE_ROOT = self.storage_dir
+        Config.LOG_ROOT = self.storage_dir
+        self.app = create_app()
+        self.app.config["EXTRACTION_SANDBOX_ENABLED"] = False
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.pdf_path = os.path.join(self.storage_dir, "scan.pdf")
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 first revision")
+        self.extract_patch = mock.patch(
+            "app.document_extractor._extract_pdf",
+            return_value=ExtractionResult(text="page one\n\npage two", page_offsets=[0, 10], method="ocr"),
+        )
+        self.extract_mock = self.extract_patch.start()
+
+    def tearDown(self):
+        self.extract_patch.stop()
+        self.ctx.pop()
+        os.close(self.db_fd)
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+        Config.SQLALCHEMY_DATABASE_URI = self._orig_db_uri
+        Config.STORAGE_ROOT = self._orig_storage_root
+        Config.LOG_ROOT = self._orig_log_root
+
+    def test_second_extraction_is_served_from_cache(self):
+        first = extract_document(self.pdf_path)
+        second = extract_document(self.pdf_path)
+
+        self.assertEqual(self.extract_mock.call_count, 1)
+        self.assertEqual(second.text, "page one\n\npage two")
+        self.assertEqual(second.page_offsets, [0, 10])
+        self.assertEqual(first.method, second.method)
+        self.assertTrue(os.path.isdir(os.path.join(self.storage_dir, ".extraction_cache")))
+
+    def test_prune_drops_old_versions_then_least_recently_used(self):
+        cache = ExtractionCache(Path(self.storage_dir) / "cache", max_bytes=0)
+        result = ExtractionResult(text="x" * 2000, page_offsets=[0], method="ocr")
+        keys = [cache.key(digest * 64, "pdf") for digest in "abc"]
+        for age, key in enumerate(keys):
+            cache.put(key, result)
+            os.utime(cache._path(key), ns=(age * 10**9, age * 10**9))
+        cache.put(keys[0].replace(f"-v{EXTRACTOR_VERSION}", "-v0"), result)
+        cache.get(keys[0])  # a hit makes the oldest entry the most recently used
+        entry_size = cache._path(keys[1]).stat().st_size
+
+        self.assertEqual(cache.prune(), 1)
+        cache.max_bytes = 2 * entry_size
+        self.assertEqual(cache.prune(), 1)
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[2]))
+
+    def test_changed_bytes_invalidate_the_entry(self):
+        extract_text_from_file(self.pdf_path)
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 second revision, longer")
+        extract_text_from_file(self.pdf_path)
+
+        self.assertEqual(self.extract_mock.call_count, 2)
+
+    def test_empty_results_and_disabled_cache_are_not_stored(self):
+        self.extract_mock.return_value = ExtractionResult(text="")
+        extract_document(self.pdf_path)
+        extract_document(self.pdf_path)
+        self.assertEqual(self.extract_mock.call_count, 2)
+
+        self.extract_mock.return_value = ExtractionResult(text="words", page_offsets=[0])
+        self.app.config["EXTRACTION_CACHE_ENABLED"] = False
+        extract_document(self.pdf_path)
+        extract_document(self.pdf_path)
+        self.assertEqual(self.extract_mock.call_count, 4)
+
+    def test_hits_are_cut_to_the_callers_budget(self):
+        # Four pages, the third one blank
+        self.extract_mock.return_value = ExtractionResult(
+            text="page one\n\npage two\n\npage three", page_offsets=[0, 10, 20, 20], method="ocr"
+        )
+        extract_document(self.pdf_path)
+
+        limited = extract_document(self.pdf_path, max_chars=12)
+
+        self.assertEqual(self.extract_mock.call_count, 1)
+        # Whole pages up to the one that reached the budget, as the extractor itself stops
+        self.assertEqual(limited.text, "page one\n\npage two")
+        self.assertEqual(limited.page_offsets, [0, 10])
+        self.assertFalse(limited.complete)
+
+    def test_docx_hits_match_a_fresh_budgeted_extraction(self):
+        docx_path = os.path.join(self.storage_dir, "minutes.docx")
+        paragraphs = "".join(f"<w:p><w:r><w:t>{word}</w:t></w:r></w:p>" for word in ("Oak", "Ash", "Rowan"))
+        with zipfile.ZipFile(docx_path, "w") as archive:
+            archive.writestr(
+                "word/document.xml",
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{paragraphs}</w:body></w:document>",
+            )
+        fresh = _extract_docx(docx_path, max_chars=7)
+        extract_document(docx_path)
+
+        cached = extract_document(docx_path, max_chars=7)
+
+        self.assertEqual((cached.text, cached.complete), (fresh.text, fresh.complete))
+        self.assertEqual(cached.text, "Oak\n\nAsh")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.config import Config
+from app.document_extractor import ExtractionResult, extract_document
+from app.extraction_sandbox import ExtractionSandbox, ExtractionTimeout, get_extraction_sandbox
+from app.models import ExtractionFailure
+
+
+class ExtractionSandboxProcessTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="neo_sandbox_")
+        self.pdf_path = os.path.join(self.tmp_dir, "broken.pdf")
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"not really a pdf")
+        self.sandbox = ExtractionSandbox(size=1, timeout=60, ocr_settings={"workers": 1})
+
+    def tearDown(self):
+        self.sandbox.shutdown()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_worker_is_killed_on_timeout_and_replaced(self):
+        self.sandbox.timeout = 0.001
+        with self.assertRaises(ExtractionTimeout):
+            self.sandbox.extract("pdf", self.pdf_path)
+        self.assertEqual(self.sandbox.restarts, 1)
+
+        self.sandbox.timeout = 60
+        result = self.sandbox.extract("pdf", self.pdf_path)
+        self.assertIsInstance(result, ExtractionResult)
+        self.assertEqual(result.text, "")
+
+    def test_started_workers_serve_the_first_job(self):
+        self.sandbox.start()
+        self.sandbox.start()
+        self.assertEqual(len(self.sandbox._workers), 1)
+
+        self.assertEqual(self.sandbox.extract("pdf", self.pdf_path).text, "")
+        self.assertEqual((len(self.sandbox._workers), self.sandbox.restarts), (1, 0))
+
+    def test_interpreter_exits_after_using_the_sandbox(self):
+        script = textwrap.dedent(
+            f"""
+            from app.extraction_sandbox import ExtractionSandbox
+
+            sandbox = ExtractionSandbox(size=1, timeout=60)
+            print(repr(sandbox.extract("pdf", {self.pdf_path!r}).text))
+            """
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        completed = subprocess.run(
+            [sys.executable, "-c", script], cwd=root, capture_output=True, text=True, timeout=30
+        )
+
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertEqual(completed.stdout.strip(), "''")
+
+
+class PoisonFileTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="neo_sandbox_", suffix=".db")
+        self.storage_dir = tempfile.mkdtemp(prefix="neo_sandbox_storage_")
+        self._orig_db_uri = Config.SQLALCHEMY_DATABASE_URI
+        self._orig_storage_root = Config.STORAGE_ROOT
+        self._orig_log_root = Config.LOG_ROOT
+        Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+        Config.STORAGE_ROOT = self.storage_dir
+        Config.LOG_ROOT = self.storage_dir
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.pdf_path = os.path.join(self.storage_dir, "poison.pdf")
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 endless loop")
+        self.extract_patch = mock.patch.object(
+            ExtractionSandbox, "extract", side_effect=ExtractionTimeout("extraction exceeded 300s")
+        )
+        self.extract_mock = self.extract_patch.start()
+
+    def tearDown(self):
+        self.extract_patch.stop()
+        self.ctx.pop()
+        os.close(self.db_fd)
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+        Config.SQLALCHEMY_DATABASE_URI = self._orig_db_uri
+        Config.STORAGE_ROOT = self._orig_storage_root
+        Config.LOG_ROOT = self._orig_log_root
+
+    def test_repeated_failures_stop_retries_until_bytes_change(self):
+        for _ in range(3):
+            self.assertEqual(extract_document(self.pdf_path).text, "")
+
+        self.assertEqual(self.extract_mock.call_count, 2)
+        failure = ExtractionFailure.query.one()
+        self.assertEqual((failure.attempts, failure.kind), (2, "pdf"))
+        self.assertIn("300s", failure.error)
+
+        with open(self.pdf_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 fixed upload")
+        extract_document(self.pdf_path)
+        self.assertEqual(self.extract_mock.call_count, 3)
+
+    def test_sandbox_workers_ocr_one_page_at_a_time(self):
+        self.app.config.update(OCR_WORKERS=4, OCR_WARMUP=True)
+        with mock.patch("app.extraction_sandbox._sandbox", None):
+            sandbox = get_extraction_sandbox()
+
+        self.assertEqual(sandbox.ocr_settings["workers"], 1)
+        self.assertTrue(sandbox.ocr_settings["warmup"])
+
+
+if __name__ == "__main__":
+    unittest.main()
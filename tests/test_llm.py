@@ -0,0 +1,657 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.config import Config
+from app.llm import (
+    BatchEngine,
+    BatchScheduler,
+    CancelToken,
+    CompletionCache,
+    GenerationCancelled,
+    GenerationResult,
+    InferenceError,
+    ModelManager,
+    ModelNotConfiguredError,
+    _sample_token,
+    _system_prefix_tokens,
+)
+from app.metrics import inference_summary
+from app.scheduler import get_ai_scheduler
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+REPLY_TOKENS = ["Light ", "the ", "cedar ", "fire."]
+PROMPT_TOKENS = 12
+
+
+class FakeLlama:
+    """Stands in for llama_cpp.Llama; records every create_chat_completion call."""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.calls = []
+        FakeLlama.instances.append(self)
+
+    def create_chat_completion(self, stream=False, logits_processor=None, **kwargs):
+        self.calls.append(dict(kwargs, stream=stream))
+        if not stream:
+            self._sample(logits_processor, len(REPLY_TOKENS))
+            return {
+                "choices": [{"message": {"content": "".join(REPLY_TOKENS)}}],
+                "usage": {"completion_tokens": len(REPLY_TOKENS)},
+            }
+        return self._chunks(logits_processor)
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return list(range(len(text.split())))
+
+    @staticmethod
+    def _sample(logits_processor, count):
+        # Llama calls the processor once per sampled token with the prompt plus output so far
+        for index in range(count):
+            if logits_processor is not None:
+                logits_processor([0] * (PROMPT_TOKENS + index), None)
+
+    @classmethod
+    def _chunks(cls, logits_processor=None):
+        yield {"choices": [{"delta": {"role": "assistant"}}]}
+        for token in REPLY_TOKENS:
+            cls._sample(logits_processor, 1)
+            yield {"choices": [{"delta": {"content": token}}]}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+
+class ModelManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="neo_llm_")
+        self.model_path = os.path.join(self.tmp_dir, "archdruid.gguf")
+        with open(self.model_path, "wb") as handle:
+            handle.write(b"GGUF")
+        FakeLlama.instances = []
+        self.llama_patch = mock.patch("app.llm.Llama", FakeLlama)
+        self.llama_patch.start()
+        self.manager = ModelManager({"archdruid": {"path": self.model_path, "max_tokens": 32}})
+
+    def tearDown(self):
+        self.llama_patch.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class GenerateStreamTests(ModelManagerTestCase):
+    def test_stream_yields_deltas_and_releases_replica(self):
+        deltas = list(self.manager.generate_stream(model_name="archdruid", prompt="Guide us"))
+
+        self.assertEqual(deltas, REPLY_TOKENS)
+        call = FakeLlama.instances[0].calls[0]
+        self.assertTrue(call["stream"])
+        self.assertEqual(call["max_tokens"], 32)
+        self.assertEqual(self.manager._pools["archdruid"].stats()["in_flight"], [0])
+
+    def test_closing_stream_early_releases_replica(self):
+        stream = self.manager.generate_stream(model_name="archdruid", prompt="Guide us")
+        self.assertEqual(next(stream), REPLY_TOKENS[0])
+        self.assertEqual(self.manager._pools["archdruid"].stats()["in_flight"], [1])
+        stream.close()
+        self.assertEqual(self.manager._pools["archdruid"].stats()["in_flight"], [0])
+
+
+class TokenCounterTests(ModelManagerTestCase):
+    def test_counts_with_the_loaded_model_vocabulary(self):
+        self.assertIsNone(self.manager.token_counter("archdruid"))
+
+        list(self.manager.generate_stream(model_name="archdruid", prompt="Guide us"))
+        count = self.manager.token_counter("archdruid")
+
+        self.assertEqual(count("light the cedar fire"), 4)
+
+
+class ReplicaPoolTests(ModelManagerTestCase):
+    def test_concurrent_requests_spread_across_replicas(self):
+        manager = ModelManager({"archdruid": {"path": self.model_path, "replicas": 2}}, thread_budget=8)
+        both_running = threading.Barrier(3, timeout=5)
+
+        def slow_completion(stream=False, **kwargs):
+            both_running.wait()
+            return {"choices": [{"message": {"content": "ok"}}]}
+
+        started = []
+        original_init = FakeLlama.__init__
+
+        def init(llama, **kwargs):
+            original_init(llama, **kwargs)
+            llama.create_chat_completion = slow_completion
+            started.append(llama)
+
+        with mock.patch.object(FakeLlama, "__init__", init):
+            threads = [
+                threading.Thread(target=manager.generate, kwargs={"model_name": "archdruid", "prompt": "hi"})
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            # Both calls must be inside llama.cpp at once, which one serialized model cannot do
+            both_running.wait()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertFalse(both_running.broken)
+        self.assertEqual(len(started), 2)
+        self.assertEqual([llama.kwargs["n_threads"] for llama in started], [4, 4])
+        self.assertEqual(manager._pools["archdruid"].stats()["in_flight"], [0, 0])
+
+    def test_budgets_cap_replica_count(self):
+        manager = ModelManager(
+            {"archdruid": {"path": self.model_path, "replicas": 4, "threads": 2}},
+            thread_budget=3,
+            memory_budget_mb=1,
+        )
+        manager.generate(model_name="archdruid", prompt="hi")
+        stats = manager.describe_models()["archdruid"]["replicas"]
+        self.assertEqual(stats["replicas"], 3)
+        self.assertEqual(stats["threads_per_replica"], 1)
+        self.assertEqual(stats["loaded"], 1)
+
+
+class ModelResidencyTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sage_path = os.path.join(self.tmp_dir, "grove_sage.gguf")
+        for path in (self.model_path, self.sage_path):
+            with open(path, "wb") as handle:
+                handle.write(b"\0" * (600 * 1024))
+        self.manager = ModelManager(
+            {
+                "archdruid": {"path": self.model_path, "prompt_cache_mb": 0},
+                "grove_sage": {"path": self.sage_path, "prompt_cache_mb": 0},
+            },
+            ram_budget_mb=1,
+        )
+
+    def test_loading_over_budget_unloads_idle_model(self):
+        self.manager.generate(model_name="archdruid", prompt="hi")
+        self.manager.generate(model_name="grove_sage", prompt="hi")
+
+        models = self.manager.describe_models()
+        self.assertEqual(models["archdruid"]["state"], "unloaded")
+        self.assertEqual(models["archdruid"]["memory_bytes"], 0)
+        self.assertEqual(models["grove_sage"]["state"], "loaded")
+        self.assertEqual(models["grove_sage"]["memory_bytes"], 600 * 1024)
+
+        # The evicted model reloads on its next request
+        self.manager.generate(model_name="archdruid", prompt="hi")
+        self.assertEqual(len(FakeLlama.instances), 3)
+        self.assertEqual(self.manager.describe_models()["grove_sage"]["state"], "unloaded")
+
+    def test_busy_model_is_not_unloaded(self):
+        stream = self.manager.generate_stream(model_name="archdruid", prompt="hi")
+        next(stream)
+        with self.assertLogs("app.llm", "WARNING"):
+            self.manager.generate(model_name="grove_sage", prompt="hi")
+        stream.close()
+
+        models = self.manager.describe_models()
+        self.assertEqual(models["archdruid"]["state"], "loaded")
+        self.assertEqual(models["grove_sage"]["state"], "loaded")
+
+    def test_preload_loads_and_warms_model(self):
+        self.assertEqual(self.manager.describe_models()["archdruid"]["state"], "unloaded")
+        self.manager.preload("archdruid")
+
+        self.assertEqual(self.manager.describe_models()["archdruid"]["state"], "loaded")
+        self.assertEqual(FakeLlama.instances[0].calls[0]["max_tokens"], 1)
+        with self.assertRaises(ModelNotConfiguredError):
+            self.manager.preload("missing")
+
+
+class CancellationTests(ModelManagerTestCase):
+    @staticmethod
+    def _endless_completion(stream=False, stopping_criteria=None, **kwargs):
+        """Decode 'tokens' until the stopping criterion fires, like llama.cpp does."""
+
+        def tokens():
+            for _ in range(500):
+                if stopping_criteria is not None and stopping_criteria([], None):
+                    return
+                time.sleep(0.01)
+                yield "leaf "
+
+        if stream:
+            return ({"choices": [{"delta": {"content": token}}]} for token in tokens())
+        return {"choices": [{"message": {"content": "".join(tokens())}}]}
+
+    def test_deadline_stops_generation_and_frees_replica(self):
+        self.manager.generate(model_name="archdruid", prompt="warm")
+        FakeLlama.instances[0].create_chat_completion = self._endless_completion
+
+        started = time.monotonic()
+        with self.assertRaises(GenerationCancelled):
+            self.manager.generate(model_name="archdruid", prompt="Guide us", cancel=CancelToken(0.05))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.manager._pools["archdruid"].stats()["in_flight"], [0])
+
+    def test_cancelling_a_stream_stops_it(self):
+        self.manager.generate(model_name="archdruid", prompt="warm")
+        FakeLlama.instances[0].create_chat_completion = self._endless_completion
+        cancel = CancelToken()
+
+        stream = self.manager.generate_stream(model_name="archdruid", prompt="Guide us", cancel=cancel)
+        self.assertEqual(next(stream), "leaf ")
+        cancel.cancel("client went away")
+        with self.assertRaises(GenerationCancelled):
+            list(stream)
+        self.assertEqual(self.manager._pools["archdruid"].stats()["in_flight"], [0])
+
+    def test_cancelled_batch_request_frees_its_sequence(self):
+        scheduler = BatchScheduler("archdruid", EchoEngine(), max_sequences=1, context_window=512)
+        cancel = CancelToken()
+        first = scheduler.submit(_messages("x" * 200), max_tokens=500, temperature=0.0, cancel=cancel)
+        cancel.cancel()
+        with self.assertRaises(GenerationCancelled):
+            first.result()
+
+        second = scheduler.submit(_messages("yew"), max_tokens=100, temperature=0.0)
+        self.assertEqual(second.result(), "echo:yew")
+
+
+class InferenceMetricsTests(ModelManagerTestCase):
+    def test_generation_records_prefill_and_decode(self):
+        self.manager = ModelManager({"metrics-archdruid": {"path": self.model_path}})
+        self.manager.generate(model_name="metrics-archdruid", prompt="Guide us")
+        list(self.manager.generate_stream(model_name="metrics-archdruid", prompt="Guide us"))
+
+        entry = inference_summary()["local/metrics-archdruid"]
+        self.assertEqual(entry["decode_tokens"]["count"], 2)
+        self.assertEqual(entry["decode_tokens"]["max"], len(REPLY_TOKENS))
+        self.assertEqual(entry["prefill_tokens"]["max"], PROMPT_TOKENS)
+        self.assertGreater(entry["tokens_per_second"]["max"], 0)
+
+    def test_batched_request_counts_only_new_prefill(self):
+        engine = EchoEngine()
+        engine.reuse_prefix = lambda seq_id, tokens: 3
+        scheduler = BatchScheduler("archdruid", engine, max_sequences=1, context_window=512)
+        request = scheduler.submit(_messages("rowan"), max_tokens=100, temperature=0.0)
+        request.result()
+        request.record("metrics-batched", queue_wait=0.0, load_seconds=0.0)
+
+        entry = inference_summary()["local/metrics-batched"]
+        self.assertEqual(entry["prefill_tokens"]["max"], len("rowan") - 3)
+        self.assertEqual(entry["decode_tokens"]["max"], request.usage()["completion_tokens"])
+
+
+class CompletionCacheTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.tmp_dir, "completions")
+        self.manager = ModelManager(
+            {"archdruid": {"path": self.model_path}},
+            completion_cache=CompletionCache(max_entries=8, ttl=60, directory=self.cache_dir),
+        )
+
+    def test_deterministic_requests_are_served_from_cache(self):
+        first = self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0)
+        second = self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0)
+
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(len(FakeLlama.instances[0].calls), 1)
+
+        # A different prompt or sampling option is a different entry
+        self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0, top_p=0.5)
+        self.assertEqual(len(FakeLlama.instances[0].calls), 2)
+
+    def test_completed_streams_fill_the_cache_and_closed_ones_do_not(self):
+        stream = self.manager.generate_stream(model_name="archdruid", prompt="Guide us", temperature=0)
+        next(stream)
+        stream.close()
+
+        first = "".join(self.manager.generate_stream(model_name="archdruid", prompt="Guide us", temperature=0))
+        second = list(self.manager.generate_stream(model_name="archdruid", prompt="Guide us", temperature=0))
+
+        self.assertEqual(first, "Light the cedar fire.")
+        self.assertEqual(second, [first])
+        self.assertEqual(len(FakeLlama.instances[0].calls), 2)
+        self.assertTrue(self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0).cached)
+
+    def test_sampled_requests_bypass_cache_unless_seeded(self):
+        self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0.7)
+        self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0.7)
+        self.assertEqual(len(FakeLlama.instances[0].calls), 2)
+
+        self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0.7, seed=7)
+        seeded = self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0.7, seed=7)
+        self.assertTrue(seeded.cached)
+        self.assertEqual(len(FakeLlama.instances[0].calls), 3)
+
+    def test_disk_entries_survive_restart_and_expire(self):
+        self.manager.generate(model_name="archdruid", prompt="Guide us", temperature=0)
+        cache = CompletionCache(ttl=60, directory=self.cache_dir)
+        restarted = ModelManager({"archdruid": {"path": self.model_path}}, completion_cache=cache)
+
+        self.assertTrue(restarted.generate(model_name="archdruid", prompt="Guide us", temperature=0).cached)
+        self.assertEqual(len(FakeLlama.instances), 1)
+
+        expired = CompletionCache(ttl=60, directory=self.cache_dir)
+        key = CompletionCache.key(self.manager._registry["archdruid"], {"x": 1})
+        expired.put(key, GenerationResult(text="old", usage={}, raw={}))
+        with mock.patch("app.llm.time", return_value=time.time() + 120):
+            self.assertIsNone(expired.get(key))
+        self.assertFalse(os.path.exists(expired._disk_path(key)))
+
+
+class GenerateBatchTests(ModelManagerTestCase):
+    def test_items_spread_over_replicas_and_failures_stay_per_item(self):
+        self.manager = ModelManager({"archdruid": {"path": self.model_path, "max_tokens": 32, "replicas": 2}})
+        items = [{"prompt": "Guide us"}, {"prompt": ""}, {"prompt": "Bless the oak", "max_tokens": 8}]
+
+        outcomes = dict(self.manager.generate_batch("archdruid", items))
+
+        self.assertEqual(sorted(outcomes), [0, 1, 2])
+        self.assertEqual(outcomes[0].text, "Light the cedar fire.")
+        self.assertIsInstance(outcomes[1], ValueError)
+        self.assertEqual(sorted(call["max_tokens"] for llm in FakeLlama.instances for call in llm.calls), [8, 32])
+
+    def test_batching_model_decodes_items_together(self):
+        self.manager = ModelManager({"archdruid": {"path": self.model_path, "batch_sequences": 4}})
+        engine = EchoEngine()
+        self.manager._schedulers["archdruid"] = BatchScheduler("archdruid", engine, 4, 512)
+        prompts = ["a long prompt that needs two prefill chunks", "ash", "oak grove"]
+
+        order = [index for index, _ in self.manager.generate_batch("archdruid", [{"prompt": p} for p in prompts])]
+        outcomes = dict(self.manager.generate_batch("archdruid", [{"prompt": p} for p in prompts]))
+
+        self.assertEqual([outcomes[index].text for index in range(3)], [f"echo:{p}" for p in prompts])
+        self.assertEqual(order[0], 1)
+        self.assertTrue(any(len(step) > 1 for step in engine.steps))
+
+    def test_unknown_model_fails_before_anything_runs(self):
+        with self.assertRaises(ModelNotConfiguredError):
+            self.manager.generate_batch("missing", [{"prompt": "Guide us"}])
+
+
+class EchoEngine(BatchEngine):
+    """Character-level fake: every sequence replies 'echo:<prompt>' and then ends."""
+
+    n_batch = 8
+
+    def __init__(self):
+        self.steps = []
+        self.replies = {}
+        self.released = []
+
+    def prompt_tokens(self, messages):
+        return [ord(char) for char in messages[-1]["content"]]
+
+    def decode(self, entries):
+        time.sleep(0.005)
+        self.steps.append(sorted(seq_id for seq_id, _, _ in entries))
+        logits = {}
+        for seq_id, tokens, want_logits in entries:
+            reply = self.replies.setdefault(seq_id, {"prompt": [], "out": None})
+            if reply["out"] is None:
+                reply["prompt"].extend(tokens)
+            if want_logits:
+                if reply["out"] is None:
+                    reply["out"] = iter([ord(char) for char in "echo:"] + reply["prompt"] + [0])
+                logits[seq_id] = next(reply["out"])
+        return logits
+
+    def sample(self, logits, temperature, top_p):
+        return logits
+
+    def is_eog(self, token):
+        return token == 0
+
+    def token_bytes(self, token):
+        return chr(token).encode("utf-8")
+
+    def release(self, seq_id):
+        self.released.append(seq_id)
+        self.replies.pop(seq_id, None)
+
+
+def _messages(text):
+    return [{"role": "system", "content": "sys"}, {"role": "user", "content": text}]
+
+
+class BatchSchedulerTests(unittest.TestCase):
+    def test_concurrent_requests_share_decode_steps(self):
+        engine = EchoEngine()
+        scheduler = BatchScheduler("archdruid", engine, max_sequences=4, context_window=512)
+        prompts = ["oak grove", "ash", "a long prompt that needs two prefill chunks"]
+        requests = [
+            scheduler.submit(_messages(prompt), max_tokens=100, temperature=0.0) for prompt in prompts
+        ]
+
+        self.assertEqual([request.result() for request in requests], [f"echo:{p}" for p in prompts])
+        self.assertTrue(any(len(step) > 1 for step in engine.steps))
+        self.assertTrue(all(len(set(step)) == len(step) for step in engine.steps))
+        self.assertEqual(sorted(engine.released), [1, 2, 3])
+        self.assertEqual(requests[1].usage()["completion_tokens"], len("echo:ash"))
+
+    def test_stop_sequences_and_max_tokens(self):
+        scheduler = BatchScheduler("archdruid", EchoEngine(), max_sequences=2, context_window=512)
+        stopped = scheduler.submit(_messages("dusk|dawn"), max_tokens=100, temperature=0.0, stop=["|da"])
+        self.assertEqual("".join(stopped.stream()), "echo:dusk")
+
+        capped = scheduler.submit(_messages("midsummer"), max_tokens=6, temperature=0.0)
+        self.assertEqual(capped.result(), "echo:m")
+
+    def test_abandoned_stream_frees_its_sequence(self):
+        scheduler = BatchScheduler("archdruid", EchoEngine(), max_sequences=1, context_window=512)
+        first = scheduler.submit(_messages("x" * 200), max_tokens=500, temperature=0.0).stream()
+        next(first)
+        first.close()
+
+        second = scheduler.submit(_messages("yew"), max_tokens=100, temperature=0.0)
+        self.assertEqual(second.result(), "echo:yew")
+
+    def test_cached_prefix_is_not_prefilled_again(self):
+        engine = EchoEngine()
+        prefix_length = 4
+        engine.reuse_prefix = lambda seq_id, tokens: prefix_length
+        scheduler = BatchScheduler("archdruid", engine, max_sequences=1, context_window=512)
+        steps = []
+        original_decode = engine.decode
+
+        def record(entries):
+            steps.append(entries)
+            return original_decode(entries)
+
+        engine.decode = record
+        request = scheduler.submit(_messages("sacred oak"), max_tokens=3, temperature=0.0)
+        request.result()
+
+        prefilled = [token for entries in steps for _, tokens, _ in entries[:1] for token in tokens]
+        self.assertEqual(prefilled[: len("sacred oak") - prefix_length], [ord(c) for c in "ed oak"])
+        self.assertEqual(request.usage()["prompt_tokens"], len("sacred oak"))
+
+    def test_failing_step_fails_its_requests_but_not_the_scheduler(self):
+        engine = EchoEngine()
+        scheduler = BatchScheduler("archdruid", engine, max_sequences=2, context_window=512)
+        engine.sample = mock.Mock(side_effect=RuntimeError("bad logits"))
+
+        with self.assertRaises(InferenceError):
+            scheduler.submit(_messages("oak"), max_tokens=10, temperature=0.0).result()
+
+        engine.sample = lambda logits, temperature, top_p: logits
+        callback = mock.Mock(side_effect=RuntimeError("callback broke"))
+        first = scheduler.submit(_messages("ash"), max_tokens=10, temperature=0.0, on_finish=callback)
+        self.assertEqual(first.result(), "echo:ash")
+        self.assertEqual(scheduler.submit(_messages("yew"), max_tokens=10, temperature=0.0).result(), "echo:yew")
+        callback.assert_called_once_with(first)
+
+    def test_deadline_holds_when_the_scheduler_is_stuck(self):
+        engine = EchoEngine()
+        unblock = threading.Event()
+        engine.decode = lambda entries: unblock.wait(5) and {}
+        scheduler = BatchScheduler("archdruid", engine, max_sequences=1, context_window=512)
+        request = scheduler.submit(_messages("oak"), max_tokens=10, temperature=0.0, cancel=CancelToken(timeout=0.05))
+
+        started = time.monotonic()
+        with mock.patch("app.llm._CANCEL_GRACE_SECONDS", 0.1), self.assertRaises(GenerationCancelled):
+            request.result()
+        self.assertLess(time.monotonic() - started, 3)
+        unblock.set()
+
+    def test_oversized_prompt_is_rejected(self):
+        scheduler = BatchScheduler("archdruid", EchoEngine(), max_sequences=1, context_window=8)
+        with self.assertRaises(InferenceError):
+            scheduler.submit(_messages("far too long"), max_tokens=4, temperature=0.0)
+
+
+class SystemPrefixTests(unittest.TestCase):
+    def test_prefix_covers_everything_before_the_user_text(self):
+        llm = mock.Mock()
+        llm.tokenize.side_effect = lambda data, add_bos=True, special=False: list(data)
+
+        prefix = _system_prefix_tokens(llm, None, "Speak as the grove.")
+
+        self.assertEqual(bytes(prefix), b"system: Speak as the grove.\nuser: ")
+
+
+class SampleTokenTests(unittest.TestCase):
+    def test_greedy_and_top_p(self):
+        logits = [0.0, 3.0, 1.0, 2.9]
+        self.assertEqual(_sample_token(logits, 0.0, 0.95), 1)
+        # top_p this small keeps only the best token
+        self.assertEqual({_sample_token(logits, 0.8, 0.01) for _ in range(20)}, {1})
+        self.assertEqual({_sample_token(logits, 0.8, 1.0, top_k=2) for _ in range(50)} - {1, 3}, set())
+
+    @unittest.skipIf(numpy is None, "numpy is required for array logits")
+    def test_array_logits_match_the_list_path(self):
+        logits = numpy.array([0.0, 3.0, 1.0, 2.9], dtype=numpy.float32)
+        self.assertEqual(_sample_token(logits, 0.0, 0.95), 1)
+        self.assertEqual({_sample_token(logits, 0.8, 0.01) for _ in range(20)}, {1})
+        self.assertEqual({_sample_token(logits, 0.8, 1.0, top_k=2) for _ in range(50)} - {1, 3}, set())
+
+
+class StreamingEndpointTests(ModelManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="neo_llm_", suffix=".db")
+        self._orig_db_uri = Config.SQLALCHEMY_DATABASE_URI
+        self._orig_storage_root = Config.STORAGE_ROOT
+        self._orig_log_root = Config.LOG_ROOT
+        Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+        Config.STORAGE_ROOT = self.tmp_dir
+        Config.LOG_ROOT = self.tmp_dir
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["AI_API_KEYS"] = set()
+        self.app.extensions["llm_manager"] = self.manager
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+        Config.SQLALCHEMY_DATABASE_URI = self._orig_db_uri
+        Config.STORAGE_ROOT = self._orig_storage_root
+        Config.LOG_ROOT = self._orig_log_root
+        super().tearDown()
+
+    def test_generate_streams_server_sent_events(self):
+        response = self.client.post(
+            "/api/v1/generate", json={"prompt": "Guide us", "model": "archdruid", "stream": True}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        body = response.get_data(as_text=True)
+        frames = [frame for frame in body.split("\n\n") if frame]
+        self.assertEqual(len(frames), len(REPLY_TOKENS) + 1)
+        self.assertEqual(frames[0], 'event: delta\ndata: {"text": "Light "}')
+        self.assertIn('"completion": "Light the cedar fire."', frames[-1])
+
+    def test_cached_completions_are_flagged(self):
+        self.manager._completion_cache = CompletionCache()
+        payload = {"prompt": "Guide us", "model": "archdruid", "temperature": 0}
+
+        first = self.client.post("/api/v1/generate", json=payload)
+        second = self.client.post("/api/v1/generate", json=payload)
+
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertTrue(second.get_json()["cached"])
+        self.assertEqual(second.get_json()["completion"], "Light the cedar fire.")
+
+    def test_stream_errors_before_first_token_are_plain_json(self):
+        response = self.client.post(
+            "/api/v1/generate", json={"prompt": "Guide us", "model": "missing", "stream": True}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()["error"], "Unknown model 'missing'")
+
+    def test_batch_returns_results_in_order_with_shared_options(self):
+        response = self.client.post(
+            "/api/v1/generate/batch",
+            json={
+                "model": "archdruid",
+                "max_tokens": 16,
+                "prompts": ["Guide us", {"prompt": "Bless the oak", "max_tokens": 8}],
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1])
+        self.assertEqual(results[1]["completion"], "Light the cedar fire.")
+        self.assertEqual(sorted(call["max_tokens"] for llm in FakeLlama.instances for call in llm.calls), [8, 16])
+
+    def test_batch_streams_one_event_per_item(self):
+        response = self.client.post(
+            "/api/v1/generate/batch",
+            json={"model": "archdruid", "prompts": ["Guide us", "Bless the oak"], "stream": True},
+        )
+
+        frames = [frame for frame in response.get_data(as_text=True).split("\n\n") if frame]
+        self.assertEqual([frame.split("\n")[0] for frame in frames], ["event: result"] * 2 + ["event: done"])
+        self.assertIn('"index": ', frames[0])
+
+    def test_batch_validation(self):
+        self.app.config["AI_API_BATCH_LIMIT"] = 2
+        for body in ({"prompts": []}, {"prompts": ["a", "b", "c"]}, {"prompts": ["a", {"max_tokens": 4}]}):
+            self.assertEqual(self.client.post("/api/v1/generate/batch", json=body).status_code, 400)
+        missing = self.client.post("/api/v1/generate/batch", json={"model": "missing", "prompts": ["a"]})
+        self.assertEqual(missing.status_code, 404)
+
+    def test_token_deadline_before_wait_timeout_returns_504(self):
+        cancelled = GenerationCancelled("Generation cancelled: timed out")
+        for stream in (False, True):
+            with mock.patch.object(self.manager, "generate", side_effect=cancelled), mock.patch.object(
+                self.manager, "generate_stream", side_effect=cancelled
+            ):
+                response = self.client.post(
+                    "/api/v1/generate", json={"prompt": "Guide us", "model": "archdruid", "stream": stream}
+                )
+
+            self.assertEqual(response.status_code, 504)
+            self.assertEqual(response.get_json()["error"], "Generation timed out")
+
+    def test_full_queue_returns_503_with_retry_after(self):
+        self.app.config.update(AI_WORKERS=1, AI_QUEUE_DEPTH=0)
+        release = threading.Event()
+        get_ai_scheduler(self.app).submit(release.wait, 5)
+        try:
+            response = self.client.post("/api/v1/generate", json={"prompt": "Guide us", "model": "archdruid"})
+        finally:
+            release.set()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from app.metrics import Histogram, MetricsRegistry, inference_summary, record_inference, registry as metrics_registry
+
+
+class MetricsTests(unittest.TestCase):
+    def test_histogram_percentiles_and_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.2, 0.3, 2.0):
+            histogram.observe(value)
+
+        snap = histogram.snapshot()
+        self.assertEqual(snap["count"], 4)
+        self.assertAlmostEqual(snap["sum"], 2.55)
+        self.assertEqual(snap["p50"], 0.2)
+        self.assertEqual(snap["max"], 2.0)
+        self.assertEqual(snap["buckets"], {"0.1": 1, "1.0": 3, "+Inf": 4})
+
+    def test_prometheus_rendering(self):
+        registry = MetricsRegistry()
+        registry.describe("stage_seconds", "Stage latency")
+        registry.observe("stage_seconds", 0.2, stage="scoring")
+        registry.inc("cache_requests_total", cache="query_embedding", result="hit")
+        registry.set_gauge("rag_index_chunks", 42)
+
+        text = registry.render_prometheus()
+
+        self.assertIn("# HELP neo_druidic_stage_seconds Stage latency", text)
+        self.assertIn("# TYPE neo_druidic_stage_seconds histogram", text)
+        self.assertIn('neo_druidic_stage_seconds_bucket{stage="scoring",le="0.25"} 1', text)
+        self.assertIn('neo_druidic_stage_seconds_count{stage="scoring"} 1', text)
+        self.assertIn(
+            'neo_druidic_cache_requests_total{cache="query_embedding",result="hit"} 1', text
+        )
+        self.assertIn("neo_druidic_rag_index_chunks 42", text)
+
+    def test_inference_metrics_per_provider_and_model(self):
+        record_inference(
+            "local",
+            "metrics-test",
+            total_seconds=3.0,
+            queue_wait=0.5,
+            load_seconds=0.0,
+            prefill_tokens=300,
+            prefill_seconds=0.5,
+            decode_tokens=40,
+            decode_seconds=2.0,
+        )
+        # OpenAI reports no prefill/decode split for a plain completion
+        record_inference("openai", "metrics-test", total_seconds=1.0, prefill_tokens=10, decode_tokens=50)
+
+        local = inference_summary()["local/metrics-test"]
+        self.assertEqual(local["tokens_per_second"]["max"], 20.0)
+        self.assertEqual(local["prefill_tokens"]["max"], 300)
+        self.assertEqual(local["queue_wait_seconds"]["count"], 1)
+        openai = inference_summary()["openai/metrics-test"]
+        self.assertEqual(openai["tokens_per_second"]["max"], 50.0)
+        self.assertNotIn("decode_seconds", openai)
+
+        text = metrics_registry.render_prometheus()
+        self.assertIn(
+            'neo_druidic_inference_prefill_tokens_bucket{model="metrics-test",provider="local",le="512"} 1', text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
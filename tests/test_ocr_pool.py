@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from app.ocr import OCREnginePool, ocr_pdf_pages
+
+
+class FakeEngine:
+    created = 0
+
+    def __init__(self):
+        FakeEngine.created += 1
+        self.calls = []
+
+    def ocr(self, image, cls=True):
+        if image == "corrupt":
+            raise RuntimeError("engine crashed")
+        self.calls.append(image)
+        return [[(None, (f"text of {image}", 0.99))]]
+
+
+class OCREnginePoolTests(unittest.TestCase):
+    def setUp(self):
+        FakeEngine.created = 0
+
+    def test_engine_is_created_once_and_reused(self):
+        pool = OCREnginePool(size=1, recycle_pages=100, factory=FakeEngine)
+
+        self.assertEqual(pool.ocr("a.png"), "text of a.png")
+        self.assertEqual(list(pool.ocr_many(["b.png", "c.png"])), ["text of b.png", "text of c.png"])
+
+        self.assertEqual(FakeEngine.created, 1)
+        self.assertEqual(pool.stats()["idle"], 1)
+
+    def test_engine_is_recycled_after_page_limit(self):
+        pool = OCREnginePool(size=1, recycle_pages=2, factory=FakeEngine)
+
+        texts = list(pool.ocr_many(["p1", "p2", "p3", "p4"]))
+
+        self.assertEqual(len(texts), 4)
+        # Two engines did the work; the batch never opened a third for nothing.
+        self.assertEqual(FakeEngine.created, 2)
+        self.assertEqual(pool.recycled, 2)
+
+    def test_failing_engine_is_discarded(self):
+        pool = OCREnginePool(size=1, recycle_pages=0, factory=FakeEngine)
+
+        with self.assertRaises(RuntimeError):
+            pool.ocr("corrupt")
+        self.assertEqual(pool.stats()["created"], 0)
+
+        self.assertEqual(pool.ocr("ok.png"), "text of ok.png")
+        self.assertEqual(FakeEngine.created, 2)
+
+    def test_checkout_times_out_when_pool_is_exhausted(self):
+        pool = OCREnginePool(size=1, factory=FakeEngine)
+
+        with pool.checkout():
+            with self.assertRaises(TimeoutError):
+                with pool.checkout(timeout=0.01):
+                    pass
+
+
+class PdfPageOcrTests(unittest.TestCase):
+    def setUp(self):
+        FakeEngine.created = 0
+
+    def test_parallel_pages_are_reassembled_in_order_with_bounded_work(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fake_page(file_path, page_number, dpi):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            # Later pages finish first
+            time.sleep(0.002 * (12 - page_number))
+            with lock:
+                active -= 1
+            return f"page {page_number}"
+
+        with mock.patch("app.ocr.pdf_page_count", return_value=12), \
+                mock.patch("app.ocr._ocr_pdf_page", side_effect=fake_page), \
+                ThreadPoolExecutor(max_workers=8) as executor:
+            texts = ocr_pdf_pages("scan.pdf", workers=2, executor=executor)
+
+        self.assertEqual(texts, [f"page {n}" for n in range(1, 13)])
+        self.assertLessEqual(peak, 4)
+
+    def test_single_worker_rasterizes_page_by_page_with_one_engine(self):
+        pool = OCREnginePool(size=1, recycle_pages=0, factory=FakeEngine)
+        rasterized = []
+
+        def fake_rasterize(file_path, page_number, dpi):
+            rasterized.append(page_number)
+            return f"p{page_number}"
+
+        with mock.patch("app.ocr.pdf_page_count", return_value=3), \
+                mock.patch("app.ocr.rasterize_page", side_effect=fake_rasterize), \
+                mock.patch("app.ocr.image_to_array", side_effect=lambda image: image), \
+                mock.patch("app.ocr.get_ocr_pool", return_value=pool), \
+                mock.patch("app.ocr._paddle_available", return_value=True):
+            texts = ocr_pdf_pages("scan.pdf", workers=1)
+
+        self.assertEqual(texts, ["text of p1", "text of p2", "text of p3"])
+        self.assertEqual(rasterized, [1, 2, 3])
+        self.assertEqual(FakeEngine.created, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from app.metrics import prompt_summary, registry as metrics_registry
+from app.prompting import PromptBudget, lexical_overlap, truncate_to_tokens
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TruncateTests(unittest.TestCase):
+    def test_cuts_at_the_last_whole_sentence(self):
+        text = "The circle gathers at dusk. Each member brings an apple. The fire is lit at midnight."
+
+        self.assertEqual(truncate_to_tokens(text, 10, count_words), "The circle gathers at dusk. Each member brings an apple.")
+        self.assertEqual(truncate_to_tokens(text, 100, count_words), text)
+
+    def test_falls_back_to_whole_words_when_one_sentence_is_too_long(self):
+        text = "Walk sunwise three times around the old oak before the fire is lit."
+
+        self.assertEqual(truncate_to_tokens(text, 4, count_words), "Walk sunwise three times")
+        self.assertEqual(truncate_to_tokens(text, 0, count_words), "")
+
+
+class PromptBudgetTests(unittest.TestCase):
+    def test_pack_keeps_best_candidates_within_the_budget(self):
+        budget = PromptBudget(count_words, context_window=64, reserve_output=20)
+        budget.add("system", "You are the archdruid.")
+        low = "Seed packets of heirloom beans. " * 3
+        high = "The equinox ritual begins at dusk beneath the oak. " * 3
+        middle = "Apples and grain are shared after the walk. " * 3
+
+        packed = budget.pack(
+            "context", [(0.1, "- ", low), (0.9, "- ", high), (0.5, "- ", middle)], overhead="Notes:", min_tokens=8
+        )
+
+        # 39 tokens left after the system prompt and overhead: the best candidate fits whole,
+        # the next is cut to one sentence and the weakest no longer fits at all.
+        self.assertEqual(packed[1], high)
+        self.assertEqual(packed[2], "Apples and grain are shared after the walk.")
+        self.assertIsNone(packed[0])
+        self.assertEqual(budget.context_results, {"kept": 1, "truncated": 1, "dropped": 1})
+        self.assertLessEqual(budget.used, budget.context_window - budget.reserve_output)
+
+    def test_max_context_caps_packing_and_overhead_needs_content(self):
+        budget = PromptBudget(count_words, context_window=1000, reserve_output=100, max_context=10)
+
+        packed = budget.pack("context", [(1.0, "", "one two three four five six seven eight nine ten eleven")], min_tokens=50)
+
+        self.assertEqual(packed, [None])
+        self.assertNotIn("context", budget.sections)
+
+    def test_record_exports_the_breakdown(self):
+        budget = PromptBudget(count_words, context_window=100, reserve_output=10)
+        budget.add("question", "When does the ritual begin?")
+        budget.pack("context", [(1.0, "", "At dusk."), (0.5, "", "x " * 200)], min_tokens=100)
+        budget.record("local", "prompt-test")
+
+        entry = prompt_summary()["local/prompt-test"]
+        self.assertEqual(entry["question"]["max"], 5)
+        self.assertEqual(entry["context"]["max"], 2)
+        self.assertEqual(entry["reserved_output"]["max"], 10)
+        self.assertEqual(
+            metrics_registry.counter_value("prompt_context_total", provider="local", model="prompt-test", result="dropped"),
+            1,
+        )
+
+    def test_lexical_overlap(self):
+        self.assertEqual(lexical_overlap("equinox ritual", "The equinox RITUAL at dusk"), 1.0)
+        self.assertEqual(lexical_overlap("equinox seeds", "The equinox ritual"), 0.5)
+        self.assertEqual(lexical_overlap("a", "anything"), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+try:
+    import openai
+except ImportError:  # pragma: no cover - optional dependency
+    openai = None
+
+from app.providers import CircuitBreaker, OpenAIProvider, ProviderUnavailable
+
+
+class FakeClient:
+    """Minimal stand-in for openai.OpenAI: completions come from a callable."""
+
+    def __init__(self, create):
+        self.calls = 0
+        self.timeouts = []
+
+        def counted(**kwargs):
+            self.calls += 1
+            return create(**kwargs)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=counted))
+
+    def with_options(self, timeout=None):
+        self.timeouts.append(timeout)
+        return self
+
+
+def _completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def test_breaker_opens_then_allows_one_trial(self):
+        def fail(**kwargs):
+            raise ConnectionError("remote down")
+
+        client = FakeClient(fail)
+        provider = OpenAIProvider(
+            None, client=client, timeout=2.5, breaker=CircuitBreaker(failure_threshold=2, reset_after=0.05)
+        )
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                provider.chat(model="m", messages=[])
+        self.assertFalse(provider.available)
+
+        # Open: refused without touching the network
+        with self.assertRaises(ProviderUnavailable):
+            provider.chat(model="m", messages=[])
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(client.timeouts, [2.5, 2.5])
+
+        time.sleep(0.06)
+        self.assertTrue(provider.available)
+        client.chat.completions.create = lambda **kwargs: _completion("back")
+        self.assertEqual(provider.chat(model="m", messages=[]).choices[0].message.content, "back")
+        self.assertEqual(provider.breaker.state, "closed")
+
+    def test_failed_trial_reopens_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_after=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, "open")
+
+
+class HedgingTests(unittest.TestCase):
+    def test_slow_request_is_hedged(self):
+        attempts = []
+
+        def create(**kwargs):
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                time.sleep(1.0)
+                return _completion("slow")
+            return _completion("fast")
+
+        provider = OpenAIProvider(None, client=FakeClient(create), hedge_after=0.05)
+        started = time.monotonic()
+        response = provider.chat(model="m", messages=[])
+
+        self.assertEqual(response.choices[0].message.content, "fast")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(len(attempts), 2)
+
+    def test_streams_are_never_hedged(self):
+        client = FakeClient(lambda **kwargs: iter(()))
+        provider = OpenAIProvider(None, client=client, hedge_after=0.001)
+        provider.chat_stream(model="m", messages=[])
+        self.assertEqual(client.calls, 1)
+
+
+class _MockOpenAIHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_POST(self):  # noqa: N802 - http.server naming
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.delay)
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "The grove is quiet."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 4, "total_tokens": 9},
+        }).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client already gave up on its deadline
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(openai is None, "the openai package is required for the mock server test")
+class MockServerTests(unittest.TestCase):
+    def setUp(self):
+        _MockOpenAIHandler.delay = 0.0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _MockOpenAIHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_chat_against_local_server(self):
+        provider = OpenAIProvider("test-key", base_url=self.base_url)
+        response = provider.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+
+        self.assertEqual(response.choices[0].message.content, "The grove is quiet.")
+        self.assertEqual(response.usage.completion_tokens, 4)
+
+    def test_slow_server_hits_the_per_call_deadline(self):
+        _MockOpenAIHandler.delay = 0.5
+        provider = OpenAIProvider(
+            "test-key", base_url=self.base_url, timeout=0.1, breaker=CircuitBreaker(failure_threshold=1)
+        )
+        with self.assertRaises(Exception):
+            provider.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+        self.assertEqual(provider.breaker.state, "open")
+
+
+if __name__ == "__main__":
+    unittest.main()
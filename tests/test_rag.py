@@ -0,0 +1,415 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app
+from app.config import Config
+from app.database import db
+from app.dedup import NearDuplicateIndex, estimate_jaccard, minhash_signature
+from app.embeddings import EMBEDDING_DIMENSIONS
+from app.models import (
+    DocumentChunkLink,
+    DocumentChunkText,
+    DocumentEmbedding,
+    DocumentSummary,
+    FileAsset,
+    User,
+)
+from app.prompting import PromptBudget
+from app.rag import (
+    build_rag_context,
+    load_chunk_texts,
+    embedding_dimension_counts,
+    finalize_index_projection,
+    get_active_projection,
+    index_all_files,
+    index_file,
+    release_file_index,
+    retrieve_relevant_documents,
+    stale_vector_count,
+    _merge_passages,
+)
+
+try:
+    import numpy  # noqa: F401
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+
+def fake_embedding(text: str, dims: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    """Deterministic bag-of-words vector so similar texts land close together."""
+    vector = [0.0] * dims
+    for word in text.lower().split():
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:2], "little") % dims] += 1.0
+        # Mirror Matryoshka models: every word also lands in the leading dims
+        vector[digest[2] % 64] += 0.5
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+PAGE_TEXT = (
+    "The autumn equinox ritual begins at dusk when the circle gathers beneath the old oak. "
+    "Each member brings a single apple, a handful of grain, and a story of what they harvested "
+    "this year. The archdruid lights the central fire and the circle walks sunwise three times."
+)
+OCR_VARIANT = (
+    "The autumn equinox ritual begins at dusk when the circle gathers beneath the o1d oak. "
+    "Each member brings a single apple, a handful of grain, and a story of what they harvested "
+    "this year. The archdruid lights the central fire and the circle walks sunwise three tirnes."
+)
+UNRELATED_TEXT = (
+    "Seed library inventory: twelve packets of heirloom beans, four of winter squash, "
+    "and a jar of calendula collected from the east garden beds in late summer."
+)
+
+
+class NearDuplicateIndexTests(unittest.TestCase):
+    def test_ocr_variant_is_near_duplicate(self):
+        original = minhash_signature(PAGE_TEXT)
+        variant = minhash_signature(OCR_VARIANT)
+        unrelated = minhash_signature(UNRELATED_TEXT)
+        self.assertGreater(estimate_jaccard(original, variant), 0.85)
+        self.assertLess(estimate_jaccard(original, unrelated), 0.2)
+
+        index = NearDuplicateIndex(threshold=0.85)
+        index.add(1, original)
+        match = index.find(variant)
+        self.assertIsNotNone(match)
+        self.assertEqual(match[0], 1)
+        self.assertIsNone(index.find(unrelated))
+
+        index.discard_many([1])
+        self.assertIsNone(index.find(variant))
+
+    def test_empty_text_has_no_signature(self):
+        self.assertIsNone(minhash_signature("  ...  "))
+
+
+class RagIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(prefix="neo_rag_", suffix=".db")
+        self.storage_dir = tempfile.mkdtemp(prefix="neo_rag_storage_")
+        self._orig_db_uri = Config.SQLALCHEMY_DATABASE_URI
+        self._orig_storage_root = Config.STORAGE_ROOT
+        self._orig_log_root = Config.LOG_ROOT
+        Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.db_path}"
+        Config.STORAGE_ROOT = self.storage_dir
+        Config.LOG_ROOT = self.storage_dir
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.owner = User(username="rowan", email="rowan@example.com", status="active")
+        self.owner.set_password("password1")
+        db.session.add(self.owner)
+        db.session.commit()
+        self.embed_patch = mock.patch("app.rag.generate_embedding", side_effect=fake_embedding)
+        self.embed_mock = self.embed_patch.start()
+
+    def tearDown(self):
+        self.embed_patch.stop()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        os.close(self.db_fd)
+        if os.path.exists(self.db_path):
+            os.unlink(self.db_path)
+        shutil.rmtree(self.storage_dir, ignore_errors=True)
+        Config.SQLALCHEMY_DATABASE_URI = self._orig_db_uri
+        Config.STORAGE_ROOT = self._orig_storage_root
+        Config.LOG_ROOT = self._orig_log_root
+
+    def _add_text_file(self, name: str, content: str) -> FileAsset:
+        stored_name = f"user_{self.owner.id}/{name}"
+        path = os.path.join(self.storage_dir, stored_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(content)
+        asset = FileAsset(
+            owner=self.owner,
+            original_name=name,
+            stored_name=stored_name,
+            mime_type="text/plain",
+            size=len(content),
+        )
+        db.session.add(asset)
+        db.session.commit()
+        return asset
+
+    def test_near_duplicate_chunks_link_to_one_representative(self):
+        self.app.config["RAG_SUMMARIES_ENABLED"] = False
+        original = self._add_text_file("equinox.txt", PAGE_TEXT)
+        rescan = self._add_text_file("equinox_scan.txt", OCR_VARIANT)
+        self._add_text_file("seeds.txt", UNRELATED_TEXT)
+
+        stats = index_all_files()
+
+        self.assertEqual(stats["indexed"], 3)
+        self.assertEqual(DocumentEmbedding.query.count(), 2)
+        link = DocumentChunkLink.query.one()
+        self.assertEqual(link.file_asset_id, rescan.id)
+        self.assertEqual(link.representative.file_asset_id, original.id)
+        # The duplicate never reached the embedding API.
+        self.assertEqual(self.embed_mock.call_count, 2)
+
+        context, sources = build_rag_context(PAGE_TEXT, top_k=3)
+        self.assertIn("equinox.txt", context)
+        self.assertEqual(sources[0]["id"], original.id)
+        self.assertEqual([entry["id"] for entry in sources[0]["also_in"]], [rescan.id])
+
+    def test_stage_latency_and_index_size_are_exported(self):
+        self._add_text_file("equinox.txt", PAGE_TEXT)
+        index_all_files()
+        build_rag_context(PAGE_TEXT, top_k=3)
+
+        response = self.app.test_client().get("/api/v1/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        for stage in ("query_embed", "candidate_fetch", "scoring", "rerank", "context_build"):
+            self.assertIn(f'neo_druidic_insight_stage_seconds_count{{stage="{stage}"}}', body)
+        self.assertIn("neo_druidic_rag_index_chunks 1", body)
+        self.assertIn('neo_druidic_cache_requests_total{cache="query_embedding"', body)
+
+    def test_context_is_packed_into_the_prompt_budget(self):
+        self.app.config["RAG_SUMMARIES_ENABLED"] = False
+        self._add_text_file("equinox.txt", PAGE_TEXT)
+        index_all_files()
+
+        def count(text):
+            return len(text.split())
+
+        roomy = PromptBudget(count, context_window=1000, reserve_output=100)
+        context, sources = build_rag_context(PAGE_TEXT, top_k=3, budget=roomy)
+        self.assertIn("three times.", context)
+        self.assertEqual(roomy.context_results["kept"], 1)
+
+        # Room for the best passage's first two sentences only
+        tight = PromptBudget(count, context_window=90, reserve_output=20)
+        context, sources = build_rag_context(PAGE_TEXT, top_k=3, budget=tight)
+        self.assertEqual([source["name"] for source in sources], ["equinox.txt"])
+        self.assertIn("[Source 1: equinox.txt", context)
+        self.assertNotIn("three times.", context)
+        self.assertIn("story of what they harvested this year.", context)
+        self.assertLessEqual(tight.used, 70)
+        self.assertEqual(tight.context_results["truncated"], 1)
+
+    def test_reindex_is_idempotent(self):
+        self._add_text_file("equinox.txt", PAGE_TEXT)
+        self._add_text_file("equinox_scan.txt", OCR_VARIANT)
+
+        index_all_files()
+        index_all_files()
+
+        self.assertEqual(DocumentEmbedding.query.count(), 1)
+        self.assertEqual(DocumentChunkLink.query.count(), 1)
+
+    def test_duplicates_stay_retrievable_when_their_representative_is_reindexed(self):
+        self.app.config["RAG_SUMMARIES_ENABLED"] = False
+        original = self._add_text_file("equinox.txt", PAGE_TEXT)
+        rescan = self._add_text_file("equinox_scan.txt", OCR_VARIANT)
+        index_all_files()
+
+        index_file(original)
+
+        # The scan now owns the chunk and the original links onto it
+        chunk = DocumentEmbedding.query.one()
+        self.assertEqual(chunk.file_asset_id, rescan.id)
+        self.assertEqual(DocumentChunkLink.query.one().file_asset_id, original.id)
+        _, sources = build_rag_context(PAGE_TEXT, top_k=3)
+        self.assertEqual(sources[0]["id"], rescan.id)
+        self.assertEqual([entry["id"] for entry in sources[0]["also_in"]], [original.id])
+
+    def test_duplicates_stay_retrievable_when_their_representative_is_deleted(self):
+        self.app.config["RAG_SUMMARIES_ENABLED"] = False
+        original = self._add_text_file("equinox.txt", PAGE_TEXT)
+        rescan = self._add_text_file("equinox_scan.txt", OCR_VARIANT)
+        index_all_files()
+
+        release_file_index(original)
+        db.session.delete(original)
+        db.session.commit()
+
+        self.assertEqual(DocumentChunkLink.query.count(), 0)
+        context, sources = build_rag_context(PAGE_TEXT, top_k=3)
+        self.assertEqual([source["id"] for source in sources], [rescan.id])
+        self.assertIn("sunwise", context)
+
+    def test_dedup_can_be_disabled(self):
+        self.app.config["RAG_DEDUP_ENABLED"] = False
+        self._add_text_file("equinox.txt", PAGE_TEXT)
+        self._add_text_file("equinox_scan.txt", OCR_VARIANT)
+
+        index_all_files()
+
+        self.assertEqual(DocumentEmbedding.query.count(), 2)
+        self.assertEqual(DocumentChunkLink.query.count(), 0)
+
+    def test_compressed_chunk_text_is_fetched_for_winners_only(self):
+        self.app.config["RAG_CHUNK_COMPRESSION"] = "zlib"
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        self._add_text_file("seeds.txt", UNRELATED_TEXT)
+
+        index_all_files()
+
+        self.assertEqual({row.content for row in DocumentEmbedding.query}, {""})
+        self.assertEqual(DocumentChunkText.query.count(), 2)
+        row = DocumentEmbedding.query.filter_by(file_asset_id=equinox.id).one()
+        self.assertEqual(load_chunk_texts([row.id]), {row.id: PAGE_TEXT})
+
+        context, sources = build_rag_context(PAGE_TEXT, top_k=1)
+        self.assertEqual(sources[0]["id"], equinox.id)
+        self.assertIn("walks sunwise three times", context)
+
+        # Re-indexing replaces the side-table rows instead of leaking them.
+        index_all_files()
+        self.assertEqual(DocumentChunkText.query.count(), 2)
+
+    def test_truncation_projection_applies_to_stored_and_query_vectors(self):
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 64
+        self.app.config["RAG_EMBEDDING_PROJECTION"] = "truncate"
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        self._add_text_file("seeds.txt", UNRELATED_TEXT)
+
+        index_all_files()
+
+        projection = get_active_projection()
+        self.assertEqual((projection.method, projection.dimensions), ("truncate", 64))
+        self.assertEqual(embedding_dimension_counts(), {"64": 2})
+        self.assertTrue(all(row.projection_id == projection.id for row in DocumentEmbedding.query))
+        _, sources = build_rag_context(PAGE_TEXT, top_k=1)
+        self.assertEqual(sources[0]["id"], equinox.id)
+
+    def test_switching_projection_reprojects_what_it_can(self):
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        seeds = self._add_text_file("seeds.txt", UNRELATED_TEXT)
+        index_all_files()
+        self.assertEqual(embedding_dimension_counts(), {str(EMBEDDING_DIMENSIONS): 2})
+
+        # Full vectors and wider truncations are cut down in place.
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 128
+        index_file(seeds)
+        self.assertEqual(embedding_dimension_counts(), {"128": 2})
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 64
+        index_file(seeds)
+        self.assertEqual(embedding_dimension_counts(), {"64": 2})
+        _, sources = build_rag_context(PAGE_TEXT, top_k=1)
+        self.assertEqual(sources[0]["id"], equinox.id)
+
+        # A wider truncation cannot be rebuilt from narrower vectors: flagged, then skipped.
+        # (Counts cover chunk and summary vectors.)
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 96
+        with self.assertLogs("app.rag", level="WARNING") as logs:
+            index_file(seeds)
+        self.assertIn("4 stored vectors cannot be converted", "\n".join(logs.output))
+        self.assertEqual(embedding_dimension_counts(), {"96": 1, "64": 1})
+        self.assertEqual(stale_vector_count(get_active_projection()), 2)
+        _, sources = build_rag_context(PAGE_TEXT, top_k=3)
+        self.assertNotIn(equinox.id, [source["id"] for source in sources])
+
+    def test_switching_from_truncation_to_pca_stores_and_queries_full_vectors(self):
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 64
+        self._add_text_file("seeds.txt", UNRELATED_TEXT)
+        index_all_files()
+
+        self.app.config["RAG_EMBEDDING_PROJECTION"] = "pca"
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 4
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        with mock.patch("app.rag.fit_pca", side_effect=ImportError):
+            index_file(equinox)
+            finalize_index_projection()
+
+        # Until PCA is fitted the truncation no longer applies to new chunks or queries.
+        self.assertIsNone(get_active_projection())
+        self.assertEqual(embedding_dimension_counts(), {str(EMBEDDING_DIMENSIONS): 1, "64": 1})
+        _, sources = build_rag_context(PAGE_TEXT, top_k=1)
+        self.assertEqual(sources[0]["id"], equinox.id)
+
+    def test_summaries_pick_files_and_stand_in_when_no_chunk_matches(self):
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        seeds = self._add_text_file("seeds.txt", UNRELATED_TEXT)
+
+        index_all_files()
+        index_all_files()
+
+        self.assertEqual(DocumentSummary.query.count(), 2)
+        broad = f"seeds.txt {UNRELATED_TEXT}"
+        # The summary picks the file; its matching chunk is what gets quoted.
+        _, sources = build_rag_context(broad, top_k=2)
+        self.assertEqual((sources[0]["id"], sources[0]["kind"]), (seeds.id, "chunk"))
+
+        # With no chunk of the file matching, its summary stands in for it.
+        with mock.patch("app.rag._score_chunks", return_value=[]):
+            context, sources = build_rag_context(broad, top_k=2)
+        self.assertEqual((sources[0]["id"], sources[0]["kind"]), (seeds.id, "summary"))
+        self.assertIn("seeds.txt - summary", context)
+
+        _, sources = build_rag_context(PAGE_TEXT, top_k=1)
+        self.assertEqual((sources[0]["id"], sources[0]["kind"]), (equinox.id, "chunk"))
+
+    def test_best_chunk_wins_over_file_rank(self):
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        seeds = self._add_text_file("seeds.txt", UNRELATED_TEXT)
+        index_all_files()
+        weak = DocumentEmbedding.query.filter_by(file_asset_id=equinox.id).first()
+        strong = DocumentEmbedding.query.filter_by(file_asset_id=seeds.id).first()
+
+        # equinox.txt ranks first by summary, but seeds.txt holds the far better chunk.
+        ranked = [(equinox.id, 0.9), (seeds.id, 0.6)]
+        results = [(weak, "weak", 0.51), (strong, "strong", 0.95)]
+        passages = _merge_passages(ranked, results, {}, 1, 0.5)
+        self.assertEqual([(kind, text) for kind, _, text, _, _ in passages], [("chunk", "strong")])
+
+        # Summaries use their own threshold and only fill slots left over by chunks.
+        self.app.config["RAG_SUMMARY_MIN_SIMILARITY"] = 0.7
+        passages = _merge_passages(ranked, results[1:], {}, 3, 0.5)
+        self.assertEqual([kind for kind, *_ in passages], ["chunk", "summary"])
+        self.assertEqual(passages[1][1].id, equinox.id)
+        self.app.config["RAG_SUMMARY_MIN_SIMILARITY"] = 0.95
+        self.assertEqual(len(_merge_passages(ranked, results[1:], {}, 3, 0.5)), 1)
+
+    def test_chunk_scan_is_limited_to_top_documents(self):
+        self.app.config["RAG_COARSE_TOP_DOCS"] = 1
+        equinox = self._add_text_file("equinox.txt", PAGE_TEXT)
+        self._add_text_file("seeds.txt", UNRELATED_TEXT)
+        herbs = self._add_text_file("herbs.txt", "Drying rosemary and sage for the winter rites.")
+        index_all_files()
+
+        results = retrieve_relevant_documents(PAGE_TEXT, top_k=5, min_similarity=-1.0)
+        self.assertEqual({asset.id for asset, _, _ in results}, {equinox.id})
+
+        # Files without a summary (indexed before summaries existed) are always scanned.
+        DocumentSummary.query.filter_by(file_asset_id=herbs.id).delete()
+        db.session.commit()
+        results = retrieve_relevant_documents(PAGE_TEXT, top_k=5, min_similarity=-1.0)
+        self.assertEqual({asset.id for asset, _, _ in results}, {equinox.id, herbs.id})
+
+    @unittest.skipIf(numpy is None, "numpy is required for PCA projections")
+    def test_pca_projection_is_fitted_after_full_index(self):
+        self.app.config["RAG_EMBEDDING_DIMENSIONS"] = 4
+        self.app.config["RAG_EMBEDDING_PROJECTION"] = "pca"
+        topics = ["oak", "rowan", "hazel", "willow", "ash", "yew", "birch", "holly"]
+        for topic in topics:
+            self._add_text_file(
+                f"{topic}.txt",
+                f"Notes on the {topic} tree: where the {topic} grows, when the {topic} flowers, "
+                f"and which rites honour the {topic} through the turning year.",
+            )
+
+        index_all_files()
+
+        projection = get_active_projection()
+        self.assertEqual((projection.method, projection.dimensions), ("pca", 4))
+        self.assertEqual(embedding_dimension_counts(), {"4": len(topics)})
+        self.assertEqual({row.dimensions for row in DocumentSummary.query}, {4})
+        _, sources = build_rag_context("Notes on the hazel tree and when the hazel flowers", top_k=1)
+        self.assertEqual(sources[0]["name"], "hazel.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
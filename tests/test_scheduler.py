@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from app.metrics import registry as metrics_registry
+from app.scheduler import AIScheduler, JobExpired, SchedulerFull
+
+
+class AISchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = AIScheduler(workers=1, max_queue=3)
+        self.release = threading.Event()
+        self.blocker = self.scheduler.submit(self.release.wait, 5)
+        # Wait until the single worker is busy so later jobs really queue
+        deadline = time.monotonic() + 5
+        while self.scheduler.stats()["running"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_jobs_run_in_priority_order(self):
+        order = []
+        futures = [
+            self.scheduler.submit(order.append, priority, priority=priority)
+            for priority in ("api", "insight", "chat")
+        ]
+        self.release.set()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ["chat", "insight", "api"])
+
+    def test_full_queue_rejects_with_retry_after(self):
+        for _ in range(3):
+            self.scheduler.submit(time.sleep, 0)
+        before = metrics_registry.counter_value("ai_jobs_total", priority="api", result="rejected")
+
+        with self.assertRaises(SchedulerFull) as raised:
+            self.scheduler.submit(time.sleep, 0)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(
+            metrics_registry.counter_value("ai_jobs_total", priority="api", result="rejected"), before + 1
+        )
+
+    def test_stale_jobs_are_dropped_before_they_start(self):
+        calls = []
+        future = self.scheduler.submit(calls.append, "ran", priority="chat", timeout=0.01)
+        time.sleep(0.05)
+        self.release.set()
+
+        with self.assertRaises(JobExpired):
+            future.result(timeout=5)
+        self.assertEqual(calls, [])
+
+    def test_stream_relays_items_and_reports_close(self):
+        closed = threading.Event()
+        self.release.set()
+        items = self.scheduler.stream(lambda: iter("oak"), priority="chat", timeout=5, on_close=closed.set)
+
+        self.assertEqual(list(items), ["o", "a", "k"])
+        self.assertTrue(closed.is_set())
+
+    def test_stream_times_out_while_queued(self):
+        items = self.scheduler.stream(lambda: iter("ash"), timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            list(items)
+
+
+if __name__ == "__main__":
+    unittest.main()